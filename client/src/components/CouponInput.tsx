@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { orderAPI } from '../services/api';
 import '../styles/CouponInput.css';
 
@@ -26,6 +26,23 @@ const CouponInput: React.FC<CouponInputProps> = ({
   const [couponCode, setCouponCode] = useState('');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [bestCoupon, setBestCoupon] = useState<{ id: number; code: string; discount_amount: string; description?: string } | null>(null);
+
+  // Best coupon for the server-side cart, ranked by the discount it gives
+  useEffect(() => {
+    if (appliedCoupon) return;
+    let cancelled = false;
+    orderAPI.getBestCoupons()
+      .then((response) => {
+        if (!cancelled) setBestCoupon(response.data.best || null);
+      })
+      .catch(() => {
+        if (!cancelled) setBestCoupon(null);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [subtotal, appliedCoupon]);
 
   const handleApplyCoupon = async () => {
     if (!couponCode.trim()) {
@@ -110,6 +127,21 @@ const CouponInput: React.FC<CouponInputProps> = ({
           {loading ? 'Applying...' : 'Apply'}
         </button>
       </div>
+      {bestCoupon && (
+        <div className="coupon-best">
+          <span>
+            Best offer: <strong>{bestCoupon.code}</strong> saves ₹{parseFloat(bestCoupon.discount_amount).toFixed(2)}
+          </span>
+          <button
+            type="button"
+            className="coupon-apply-btn"
+            onClick={() => onCouponApplied(bestCoupon)}
+            disabled={loading}
+          >
+            Apply
+          </button>
+        </div>
+      )}
       {error && (
         <div className="coupon-error">
           <span className="material-symbols-outlined">error</span>
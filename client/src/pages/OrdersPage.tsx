@@ -98,7 +98,8 @@ const OrdersPage: React.FC = () => {
       // Create new Razorpay order for the pending order
       const razorpayResponse = await orderAPI.createRazorpayOrder({
         amount: order.total_amount,
-        shipping_address_id: order.shipping_address.id
+        shipping_address_id: order.shipping_address.id,
+        order_id: order.order_id
       });
 
       const getRazorpayMethods = () => {
@@ -51,6 +51,14 @@ const CheckoutPage: React.FC = () => {
     coupons_enabled: boolean;
   }>({ razorpay_enabled: true, cod_enabled: true, coupons_enabled: true });
   const paymentMethodInitialized = useRef(false);
+  // Idempotency-Key of the checkout attempt in flight; a double click reuses it
+  const checkoutAttemptKey = useRef<string | null>(null);
+  const getCheckoutAttemptKey = () => {
+    if (!checkoutAttemptKey.current) {
+      checkoutAttemptKey.current = crypto.randomUUID();
+    }
+    return checkoutAttemptKey.current;
+  };
   const [savedCards, setSavedCards] = useState<any[]>([]);
   const [appliedCoupon, setAppliedCoupon] = useState<{ id: number; code: string; discount_amount: string } | null>(null);
 
@@ -263,6 +271,8 @@ const CheckoutPage: React.FC = () => {
             shipping_address_id: selectedAddressId,
             order_notes: 'Order placed from checkout',
             coupon_id: appliedCoupon?.id
+          }, `cod:${getCheckoutAttemptKey()}`).finally(() => {
+            checkoutAttemptKey.current = null;
           });
           
                  // Clear cart after successful COD order
@@ -375,6 +385,8 @@ const CheckoutPage: React.FC = () => {
             amount: total,
             shipping_address_id: selectedAddressId,
             coupon_id: appliedCoupon?.id
+          }, `razorpay-order:${getCheckoutAttemptKey()}`).finally(() => {
+            checkoutAttemptKey.current = null;
           });
         } catch (apiError: any) {
           // Handle API errors before opening Razorpay
@@ -431,7 +443,7 @@ const CheckoutPage: React.FC = () => {
                 shipping_address_id: selectedAddressId,
                 payment_method: selectedPaymentMethod,
                 coupon_id: appliedCoupon?.id
-              });
+              }, `verify:${response.razorpay_payment_id}`);
 
               // Refresh saved cards if a card was saved during payment
               if (verifyResponse.data?.saved_card) {
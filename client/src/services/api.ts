@@ -283,6 +283,9 @@ export const paymentPreferencesAPI = {
 };
 
 // Order API calls
+// Retries and double submits sent with the same key are answered once by the server
+const idempotent = (key?: string) => (key ? { headers: { 'Idempotency-Key': key } } : undefined);
+
 export const orderAPI = {
   getOrders: () => API.get('/orders/'),
   
@@ -290,13 +293,13 @@ export const orderAPI = {
   
   createOrder: (data: any) => API.post('/orders/create/', data),
   
-  checkoutFromCart: (data: { shipping_address_id: number; order_notes?: string }) =>
-    API.post('/orders/checkout/', data),
+  checkoutFromCart: (data: { shipping_address_id: number; order_notes?: string }, idempotencyKey?: string) =>
+    API.post('/orders/checkout/', data, idempotent(idempotencyKey)),
   
   cancelOrder: (orderId: string) => API.post(`/orders/${orderId}/cancel/`),
   
-  createRazorpayOrder: (data: { amount: number; shipping_address_id: number; coupon_id?: number }) =>
-    API.post('/orders/razorpay/create-order/', data),
+  createRazorpayOrder: (data: { amount: number; shipping_address_id: number; coupon_id?: number; order_id?: string }, idempotencyKey?: string) =>
+    API.post('/orders/razorpay/create-order/', data, idempotent(idempotencyKey)),
   
   verifyRazorpayPayment: (data: {
     razorpay_order_id: string;
@@ -305,14 +308,16 @@ export const orderAPI = {
     shipping_address_id: number;
     payment_method?: string;
     coupon_id?: number;
-  }) => API.post('/orders/razorpay/verify-payment/', data),
+  }, idempotencyKey?: string) => API.post('/orders/razorpay/verify-payment/', data, idempotent(idempotencyKey)),
   
-  checkoutWithCOD: (data: { shipping_address_id: number; order_notes?: string; coupon_id?: number }) =>
-    API.post('/orders/checkout/cod/', data),
+  checkoutWithCOD: (data: { shipping_address_id: number; order_notes?: string; coupon_id?: number }, idempotencyKey?: string) =>
+    API.post('/orders/checkout/cod/', data, idempotent(idempotencyKey)),
   
   validateCoupon: (data: { code: string; order_amount: number; cart_items?: Array<{ product_id: number; quantity: number; price: number }> }) =>
     API.post('/orders/validate-coupon/', data),
   
+  getBestCoupons: () => API.get('/coupons/best/'),
+  
   completePayment: (data: {
     order_id: string;
     razorpay_order_id?: string;
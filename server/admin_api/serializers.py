@@ -4,7 +4,7 @@ from accounts.models import User, Vendor
 from products.models import (
     Category, Subcategory, Color, Material, Product, ProductImage, 
     ProductVariant, ProductVariantImage, ProductSpecification, ProductFeature, 
-    ProductOffer, Discount, ProductRecommendation, Coupon
+    ProductOffer, Discount, ProductRecommendation, Coupon, get_catalog_stats
 )
 from orders.models import Order, OrderItem, OrderStatusHistory, OrderNote
 from accounts.models import ContactQuery, BulkOrder, DataRequest
@@ -154,23 +154,41 @@ class AdminUserUpdateSerializer(serializers.ModelSerializer):
 
 
 # ==================== Category & Subcategory Serializers ====================
-class AdminSubcategorySerializer(serializers.ModelSerializer):
+class AdminCatalogStatsSerializer(serializers.Serializer):
+    """Read-only view of a CategoryStats/SubcategoryStats/MaterialStats row"""
+    product_count = serializers.IntegerField()
+    active_product_count = serializers.IntegerField()
+    variant_count = serializers.IntegerField()
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True)
+    updated_at = serializers.DateTimeField()
+
+
+class CatalogStatsMixin(serializers.Serializer):
+    """product_count and stats read from the statistics table (select_related('stats'))"""
     product_count = serializers.SerializerMethodField()
-    
+    stats = serializers.SerializerMethodField()
+
+    def get_product_count(self, obj):
+        stats = get_catalog_stats(obj)
+        return stats.product_count if stats else 0
+
+    def get_stats(self, obj):
+        stats = get_catalog_stats(obj)
+        return AdminCatalogStatsSerializer(stats).data if stats else None
+
+
+class AdminSubcategorySerializer(CatalogStatsMixin, serializers.ModelSerializer):
     class Meta:
         model = Subcategory
         fields = [
             'id', 'name', 'slug', 'category', 'description', 'is_active',
-            'sort_order', 'product_count', 'created_at', 'updated_at'
+            'sort_order', 'product_count', 'stats', 'created_at', 'updated_at'
         ]
-    
-    def get_product_count(self, obj):
-        return obj.products.count()
 
 
-class AdminCategorySerializer(serializers.ModelSerializer):
+class AdminCategorySerializer(CatalogStatsMixin, serializers.ModelSerializer):
     subcategories = AdminSubcategorySerializer(many=True, read_only=True)
-    product_count = serializers.SerializerMethodField()
     subcategory_count = serializers.SerializerMethodField()
     
     class Meta:
@@ -178,14 +196,12 @@ class AdminCategorySerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'slug', 'description', 'image', 'is_active',
             'sort_order', 'subcategories', 'product_count', 'subcategory_count',
-            'created_at', 'updated_at'
+            'stats', 'created_at', 'updated_at'
         ]
     
-    def get_product_count(self, obj):
-        return obj.products.count()
-    
     def get_subcategory_count(self, obj):
-        return obj.subcategories.count()
+        # Answered from the prefetched subcategories when available
+        return len(obj.subcategories.all())
 
 
 # ==================== Color & Material Serializers ====================
@@ -200,15 +216,10 @@ class AdminColorSerializer(serializers.ModelSerializer):
         return obj.variants.count()
 
 
-class AdminMaterialSerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
-    
+class AdminMaterialSerializer(CatalogStatsMixin, serializers.ModelSerializer):
     class Meta:
         model = Material
-        fields = ['id', 'name', 'description', 'is_active', 'product_count', 'created_at']
-    
-    def get_product_count(self, obj):
-        return obj.products.count()
+        fields = ['id', 'name', 'description', 'is_active', 'product_count', 'stats', 'created_at']
 
 
 # ==================== Product Serializers ====================
@@ -267,8 +278,9 @@ class AdminProductRecommendationSerializer(serializers.ModelSerializer):
         model = ProductRecommendation
         fields = [
             'id', 'recommended_product_id', 'recommended_product_title',
-            'recommendation_type', 'sort_order', 'is_active', 'created_at'
+            'recommendation_type', 'sort_order', 'is_active', 'source', 'score', 'created_at'
         ]
+        read_only_fields = ['source', 'score']
     
     def to_representation(self, instance):
         """Ensure recommended_product_id is included in the output"""
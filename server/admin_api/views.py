@@ -2,8 +2,9 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, Count, Q, Avg
+from django.db.models import Sum, Count, Q, Avg, Prefetch
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
@@ -24,6 +25,7 @@ from .serializers import (
 )
 from accounts.models import User, ContactQuery, BulkOrder, DataRequest, Vendor
 from accounts.data_export_utils import export_orders_to_excel, export_addresses_to_excel, export_payment_options_to_excel
+from products.pagination import CursorPaginationMixin
 from products.models import (
     Category, Subcategory, Color, Material, Product, ProductImage,
     ProductVariant, ProductVariantImage, ProductSpecification, ProductFeature,
@@ -134,7 +136,7 @@ def dashboard_stats(request):
 
 
 # ==================== User Management Views ====================
-class AdminUserViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminUserViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for user management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = User.objects.all().order_by('-date_joined')
@@ -287,7 +289,9 @@ class AdminUserViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 class AdminCategoryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for category management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
-    queryset = Category.objects.all().order_by('sort_order', 'name')
+    queryset = Category.objects.select_related('stats').prefetch_related(
+        Prefetch('subcategories', queryset=Subcategory.objects.select_related('stats'))
+    ).order_by('sort_order', 'name')
     serializer_class = AdminCategorySerializer
     
     def get_queryset(self):
@@ -308,7 +312,9 @@ class AdminCategoryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def hierarchical(self, request):
         """Get categories with subcategories"""
-        categories = Category.objects.filter(is_active=True).prefetch_related('subcategories')
+        categories = Category.objects.filter(is_active=True).select_related('stats').prefetch_related(
+            Prefetch('subcategories', queryset=Subcategory.objects.select_related('stats'))
+        )
         serializer = self.get_serializer(categories, many=True)
         return Response(serializer.data)
 
@@ -317,7 +323,7 @@ class AdminCategoryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 class AdminSubcategoryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for subcategory management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
-    queryset = Subcategory.objects.all().order_by('sort_order', 'name')
+    queryset = Subcategory.objects.select_related('stats').order_by('sort_order', 'name')
     serializer_class = AdminSubcategorySerializer
     
     def get_queryset(self):
@@ -360,7 +366,7 @@ class AdminColorViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 class AdminMaterialViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for material management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
-    queryset = Material.objects.all().order_by('name')
+    queryset = Material.objects.select_related('stats').order_by('name')
     serializer_class = AdminMaterialSerializer
     
     def get_queryset(self):
@@ -374,7 +380,7 @@ class AdminMaterialViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Product Management Views ====================
-class AdminProductViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminProductViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for product management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = Product.objects.all().select_related('category', 'subcategory').prefetch_related(
@@ -492,7 +498,7 @@ class AdminProductViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Order Management Views ====================
-class AdminOrderViewSet(AdminLoggingMixin, viewsets.ReadOnlyModelViewSet):
+class AdminOrderViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ReadOnlyModelViewSet):
     """Admin viewset for order management (read-only with custom actions)"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = Order.objects.all().select_related('user').prefetch_related(
@@ -688,7 +694,7 @@ class AdminOrderViewSet(AdminLoggingMixin, viewsets.ReadOnlyModelViewSet):
 
 
 # ==================== Discount Management Views ====================
-class AdminDiscountViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminDiscountViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for discount management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = Discount.objects.all().order_by('-created_at')
@@ -708,7 +714,7 @@ class AdminDiscountViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Coupon Management Views ====================
-class AdminCouponViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminCouponViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for coupon management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = Coupon.objects.all().order_by('-created_at')
@@ -908,7 +914,7 @@ def global_settings(request):
 
 
 # ==================== Contact Query Views ====================
-class AdminContactQueryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminContactQueryViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for contact query management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = ContactQuery.objects.all().order_by('-created_at')
@@ -954,7 +960,7 @@ class AdminContactQueryViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Bulk Order Views ====================
-class AdminBulkOrderViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminBulkOrderViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """Admin viewset for bulk order management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = BulkOrder.objects.all().select_related('assigned_to').order_by('-created_at')
@@ -1025,11 +1031,18 @@ class AdminBulkOrderViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Admin Log Views ====================
-class AdminLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AdminLogPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class AdminLogViewSet(CursorPaginationMixin, viewsets.ReadOnlyModelViewSet):
     """Admin viewset for viewing logs (read-only)"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = AdminLog.objects.all().order_by('-created_at')
     serializer_class = AdminLogSerializer
+    pagination_class = AdminLogPagination
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1051,27 +1064,6 @@ class AdminLogViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(created_at__lte=date_to)
         
         return queryset
-    
-    def list(self, request, *args, **kwargs):
-        """Override list to provide pagination"""
-        from rest_framework.response import Response
-        from rest_framework.pagination import PageNumberPagination
-        
-        class AdminLogPagination(PageNumberPagination):
-            page_size = 20
-            page_size_query_param = 'page_size'
-            max_page_size = 100
-        
-        queryset = self.filter_queryset(self.get_queryset())
-        paginator = AdminLogPagination()
-        page = paginator.paginate_queryset(queryset, request)
-        
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
 
 # ==================== Home Page Content Views ====================
@@ -1186,7 +1178,7 @@ class AdminBulkOrderPageContentViewSet(AdminLoggingMixin, viewsets.ModelViewSet)
         instance.delete()
 
 
-class AdminDataRequestViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
+class AdminDataRequestViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ModelViewSet):
     """ViewSet for managing data requests"""
     queryset = DataRequest.objects.all().order_by('-requested_at')
     serializer_class = AdminDataRequestSerializer
@@ -1397,7 +1389,7 @@ class AdminDataRequestViewSet(AdminLoggingMixin, viewsets.ModelViewSet):
 
 
 # ==================== Brand/Vendor Management Views ====================
-class AdminBrandViewSet(AdminLoggingMixin, viewsets.ReadOnlyModelViewSet):
+class AdminBrandViewSet(CursorPaginationMixin, AdminLoggingMixin, viewsets.ReadOnlyModelViewSet):
     """Admin viewset for brand/vendor management"""
     permission_classes = [IsAuthenticated, IsAdminUser]
     queryset = Vendor.objects.all().select_related('user').order_by('-created_at')
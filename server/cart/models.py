@@ -1,9 +1,28 @@
 from django.db import models
+from django.db.models import F, Q, Case, When, Sum, Count, Value, DecimalField
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from products.models import Product, ProductVariant
 from django.core.validators import MinValueValidator
 
 
+def line_unit_price(prefix=''):
+    """Expression for a cart line's unit price: the variant price when set, else the product price"""
+    return Case(
+        When(Q(**{f'{prefix}variant__price__gt': 0}), then=F(f'{prefix}variant__price')),
+        default=F(f'{prefix}product__price'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def line_total_price(prefix=''):
+    """Expression for quantity x unit price of a cart line"""
+    return models.ExpressionWrapper(
+        F(f'{prefix}quantity') * line_unit_price(prefix),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -12,17 +31,130 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    def get_totals(self):
+        """Item count, quantity and price totals from one aggregate query (cached on the instance)"""
+        if not hasattr(self, '_totals'):
+            zero = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+            self._totals = self.items.aggregate(
+                total_items=Coalesce(Sum('quantity'), 0),
+                total_price=Coalesce(Sum(line_total_price()), zero),
+                items_count=Count('id'),
+            )
+        return self._totals
+
+    def apply_operations(self, operations):
+        """
+        Apply validated add/set/remove operations in one go.
+        
+        Lines are read once, touched products (with their variant matrix, which
+        carries stock) are loaded with one query and the result is written with
+        one bulk delete, update and insert. Returns a list of
+        ``{'index', 'error'}`` dicts; nothing is written when it is not empty.
+        Call inside a transaction after locking the cart row.
+        """
+        from django.utils import timezone
+        from orders.reservations import available_to_sell
+        
+        lines = {(item.product_id, item.variant_id): item for item in self.items.all()}
+        by_id = {item.pk: key for key, item in lines.items()}
+        quantities = {key: item.quantity for key, item in lines.items()}
+        errors = []
+        touched = {}
+        
+        for index, operation in enumerate(operations):
+            if 'item_id' in operation:
+                key = by_id.get(operation['item_id'])
+                if key is None:
+                    errors.append({'index': index, 'error': 'Cart item not found'})
+                    continue
+            else:
+                key = (operation['product_id'], operation.get('variant_id'))
+            
+            if operation['op'] == 'add':
+                quantities[key] = quantities.get(key, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[key] = operation['quantity']
+            else:
+                quantities[key] = 0
+            touched[key] = index
+        
+        # Stock and variant checks for every line that ends up with a quantity
+        checked = [key for key in touched if quantities[key] > 0]
+        matrices = dict(Product.objects.filter(
+            pk__in={product_id for product_id, _ in checked}, is_active=True
+        ).values_list('pk', 'variant_matrix__matrix'))
+        missing = [pk for pk, matrix in matrices.items() if 'variants' not in (matrix or {})]
+        if missing:
+            matrices.update(Product.refresh_variant_matrices(missing))
+        
+        # Stock held for other shoppers' payments is not available (one query)
+        variants = {
+            variant['id']: variant
+            for matrix in matrices.values() for variant in matrix['variants']
+        }
+        available = available_to_sell({
+            variant_id: variants[variant_id]['stock_quantity']
+            for _, variant_id in checked if variant_id in variants
+        }, exclude_user=self.user_id)
+        
+        for key in checked:
+            product_id, variant_id = key
+            index = touched[key]
+            matrix = matrices.get(product_id)
+            if matrix is None:
+                errors.append({'index': index, 'error': 'Product not found'})
+                continue
+            product_variants = {variant['id'] for variant in matrix['variants']}
+            if product_variants and not variant_id:
+                errors.append({'index': index, 'error': 'Variant is required for this product'})
+            elif variant_id and variant_id not in product_variants:
+                errors.append({'index': index, 'error': 'Invalid variant for this product'})
+            elif variant_id and quantities[key] > available[variant_id]:
+                errors.append({
+                    'index': index,
+                    'error': f"Only {available[variant_id]} items available in stock for this variant"
+                })
+        if errors:
+            return sorted(errors, key=lambda error: error['index'])
+        
+        now = timezone.now()
+        removed, changed, created = [], [], []
+        for key in touched:
+            item = lines.get(key)
+            if quantities[key] <= 0:
+                if item is not None:
+                    removed.append(item.pk)
+            elif item is None:
+                created.append(CartItem(
+                    cart=self, product_id=key[0], variant_id=key[1], quantity=quantities[key]
+                ))
+            elif item.quantity != quantities[key]:
+                item.quantity = quantities[key]
+                item.updated_at = now
+                changed.append(item)
+        
+        if removed:
+            CartItem.objects.filter(pk__in=removed).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+        if created:
+            CartItem.objects.bulk_create(created)
+        if removed or changed or created:
+            Cart.objects.filter(pk=self.pk).update(updated_at=now)
+        self.__dict__.pop('_totals', None)
+        return []
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()['total_items']
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.get_totals()['total_price']
 
     @property
     def items_count(self):
-        return self.items.count()
+        return self.get_totals()['items_count']
 
 
 class CartItem(models.Model):
@@ -48,12 +180,14 @@ class CartItem(models.Model):
 
     def save(self, *args, **kwargs):
         # If product has variants, variant must be specified
-        if self.product.variants.exists() and not self.variant:
+        if self.product.has_variants and not self.variant_id:
             raise ValueError("Variant must be specified for products with variants")
         
-        # Check variant stock
-        if self.variant:
-            if self.quantity > self.variant.stock_quantity:
-                raise ValueError(f"Only {self.variant.stock_quantity} items available in stock for this variant")
+        # Check variant stock (from the product's variant matrix when the variant is active)
+        if self.variant_id:
+            matrix_variant = self.product.get_matrix_variant(self.variant_id)
+            stock_quantity = matrix_variant['stock_quantity'] if matrix_variant else self.variant.stock_quantity
+            if self.quantity > stock_quantity:
+                raise ValueError(f"Only {stock_quantity} items available in stock for this variant")
         
         super().save(*args, **kwargs)
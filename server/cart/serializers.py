@@ -1,10 +1,15 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Cart, CartItem
-from products.serializers import ProductListSerializer, ProductVariantSerializer
+from django.db.models import Count, Sum, Window
+from .models import Cart, CartItem, line_unit_price, line_total_price
+from products.serializers import ProductCardSerializer, ProductVariantSerializer
+
+CENTS = Decimal('0.01')
 
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer(read_only=True)
+    product = ProductCardSerializer(source='product_id', read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     variant = ProductVariantSerializer(read_only=True)
     variant_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
@@ -16,34 +21,66 @@ class CartItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['total_price', 'created_at', 'updated_at']
 
     def validate(self, attrs):
-        from products.models import Product, ProductVariant
+        from products.models import Product
+        from orders.reservations import available_to_sell
         
         if 'product_id' in attrs:
             try:
-                product = Product.objects.get(id=attrs['product_id'])
+                product = Product.objects.select_related('variant_matrix').get(id=attrs['product_id'])
                 variant_id = attrs.get('variant_id')
                 
                 # If product has variants, variant_id must be provided
-                if product.variants.exists() and not variant_id:
+                if product.has_variants and not variant_id:
                     raise serializers.ValidationError("Variant is required for this product")
                 
-                # If variant_id is provided, validate it
+                # If variant_id is provided, validate it against the product's variant matrix
                 if variant_id:
-                    try:
-                        variant = ProductVariant.objects.get(id=variant_id, product=product)
-                        quantity = attrs.get('quantity', 1)
-                        if quantity > variant.stock_quantity:
-                            raise serializers.ValidationError(
-                                f"Only {variant.stock_quantity} items available in stock for this variant"
-                            )
-                    except ProductVariant.DoesNotExist:
+                    variant = product.get_matrix_variant(variant_id)
+                    if variant is None:
                         raise serializers.ValidationError("Invalid variant for this product")
+                    quantity = attrs.get('quantity', 1)
+                    request = self.context.get('request')
+                    available = available_to_sell(
+                        {variant['id']: variant['stock_quantity']},
+                        exclude_user=request.user if request else None
+                    )[variant['id']]
+                    if quantity > available:
+                        raise serializers.ValidationError(
+                            f"Only {available} items available in stock for this variant"
+                        )
                     
             except Product.DoesNotExist:
                 raise serializers.ValidationError("Product not found")
         return attrs
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """One operation of a batch cart update"""
+    OPERATIONS = ['add', 'set', 'remove']
+    
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    item_id = serializers.IntegerField(required=False)
+    product_id = serializers.IntegerField(required=False)
+    variant_id = serializers.IntegerField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(required=False, min_value=0, default=1)
+    
+    def validate(self, attrs):
+        if attrs['op'] == 'add':
+            if 'product_id' not in attrs:
+                raise serializers.ValidationError("product_id is required to add an item")
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError("Quantity must be at least 1")
+        elif 'item_id' not in attrs and 'product_id' not in attrs:
+            raise serializers.ValidationError("item_id or product_id is required")
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 100
+    
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.ReadOnlyField()
@@ -53,4 +90,88 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'user', 'items', 'total_items', 'total_price', 'items_count', 'created_at', 'updated_at']
-        read_only_fields = ['user', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['user', 'created_at', 'updated_at']
+
+    def to_representation(self, instance):
+        ProductCardSerializer.preload(self.context, instance.items.values_list('product_id', flat=True))
+        return super().to_representation(instance)
+
+
+class CompactCartSerializer(serializers.BaseSerializer):
+    """
+    Lean cart payload returned by the cart mutation endpoints.
+    
+    Every line with its product and variant columns comes from one joined value
+    query; line prices and the cart totals (window sums over the cart's lines)
+    are computed by the database.
+    """
+    LINE_FIELDS = (
+        'id', 'quantity', 'unit_price', 'line_total',
+        'product_id', 'product__title', 'product__slug', 'product__main_image',
+        'product__price', 'product__old_price',
+        'variant_id', 'variant__title', 'variant__size', 'variant__pattern',
+        'variant__price', 'variant__old_price', 'variant__stock_quantity',
+        'variant__is_in_stock', 'variant__image',
+        'variant__color_id', 'variant__color__name', 'variant__color__hex_code',
+        'cart_total_items', 'cart_total_price', 'cart_items_count',
+    )
+    
+    def to_representation(self, instance):
+        return self.load(getattr(instance, 'pk', instance))
+    
+    @staticmethod
+    def _decimal(value):
+        # SQLite computes prices as floats; always render cents
+        return str(Decimal(str(value)).quantize(CENTS)) if value is not None else None
+    
+    @classmethod
+    def load(cls, cart_id):
+        rows = list(CartItem.objects.filter(cart_id=cart_id).annotate(
+            unit_price=line_unit_price(),
+            line_total=line_total_price(),
+            cart_total_items=Window(Sum('quantity')),
+            cart_total_price=Window(Sum(line_total_price())),
+            cart_items_count=Window(Count('id')),
+        ).order_by('created_at', 'id').values(*cls.LINE_FIELDS))
+        
+        items = []
+        for row in rows:
+            items.append({
+                'id': row['id'],
+                'product': {
+                    'id': row['product_id'],
+                    'title': row['product__title'],
+                    'slug': row['product__slug'],
+                    'main_image': row['product__main_image'],
+                    'price': cls._decimal(row['product__price']),
+                    'old_price': cls._decimal(row['product__old_price']),
+                },
+                'variant': {
+                    'id': row['variant_id'],
+                    'title': row['variant__title'],
+                    'color': {
+                        'id': row['variant__color_id'],
+                        'name': row['variant__color__name'],
+                        'hex_code': row['variant__color__hex_code'],
+                    },
+                    'size': row['variant__size'],
+                    'pattern': row['variant__pattern'],
+                    'price': cls._decimal(row['variant__price']),
+                    'old_price': cls._decimal(row['variant__old_price']),
+                    'stock_quantity': row['variant__stock_quantity'],
+                    'is_in_stock': row['variant__is_in_stock'],
+                    'image': row['variant__image'],
+                } if row['variant_id'] else None,
+                'quantity': row['quantity'],
+                'unit_price': cls._decimal(row['unit_price']),
+                'total_price': cls._decimal(row['line_total']),
+            })
+        
+        first = rows[0] if rows else {}
+        return {
+            'id': cart_id,
+            'items': items,
+            'total_items': first.get('cart_total_items') or 0,
+            'total_price': cls._decimal(first.get('cart_total_price')) or '0.00',
+            'items_count': first.get('cart_items_count') or 0,
+        }
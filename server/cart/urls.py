@@ -3,7 +3,9 @@ from . import views
 
 urlpatterns = [
     path('cart/', views.CartView.as_view(), name='cart-detail'),
+    path('cart/summary/', views.get_cart_summary, name='cart-summary'),
     path('cart/add/', views.add_to_cart, name='add-to-cart'),
+    path('cart/batch/', views.batch_update_cart, name='batch-update-cart'),
     path('cart/items/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
     path('cart/items/<int:item_id>/remove/', views.remove_from_cart, name='remove-from-cart'),
     path('cart/clear/', views.clear_cart, name='clear-cart'),
@@ -1,10 +1,12 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartSerializer, CartItemSerializer, CompactCartSerializer, CartBatchSerializer
 from products.models import Product
+from orders.reservations import available_to_sell
 
 
 class CartView(generics.RetrieveAPIView):
@@ -16,12 +18,18 @@ class CartView(generics.RetrieveAPIView):
         return cart
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_cart_summary(request):
+    """Compact cart (lines with product/variant basics and database-computed totals)"""
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    return Response(CompactCartSerializer(cart).data)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_to_cart(request):
     """Add item to cart or update quantity if item exists"""
-    from products.models import ProductVariant
-    
     product_id = request.data.get('product_id')
     variant_id = request.data.get('variant_id')
     quantity = int(request.data.get('quantity', 1))
@@ -30,36 +38,36 @@ def add_to_cart(request):
         return Response({'error': 'Product ID is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        product = Product.objects.get(id=product_id, is_active=True)
+        product = Product.objects.select_related('variant_matrix').get(id=product_id, is_active=True)
     except Product.DoesNotExist:
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Check if product has variants - variant_id is required if variants exist
-    has_variants = product.variants.exists()
+    # (answered from the product's stored variant matrix, no extra queries)
     variant = None
     
-    if has_variants:
+    if product.has_variants:
         if not variant_id:
             return Response({
                 'error': 'Variant is required for this product. Please select a color, size, or pattern.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            variant = ProductVariant.objects.get(id=variant_id, product=product, is_active=True)
-        except ProductVariant.DoesNotExist:
+        variant = product.get_matrix_variant(variant_id)
+        if variant is None:
             return Response({'error': 'Invalid variant selected'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Stock check for variant
-        if quantity > variant.stock_quantity:
+        # Stock check for variant (stock held for other shoppers' payments is not available)
+        available = available_to_sell({variant['id']: variant['stock_quantity']}, exclude_user=request.user)[variant['id']]
+        if quantity > available:
             return Response({
-                'error': f'Only {variant.stock_quantity} items available in stock for this variant'
+                'error': f'Only {available} items available in stock for this variant'
             }, status=status.HTTP_400_BAD_REQUEST)
     
     cart, created = Cart.objects.get_or_create(user=request.user)
     cart_item, created = CartItem.objects.get_or_create(
         cart=cart, 
         product=product,
-        variant=variant,
+        variant_id=variant['id'] if variant else None,
         defaults={'quantity': quantity}
     )
     
@@ -69,9 +77,9 @@ def add_to_cart(request):
         
         # Stock check for variants
         if variant:
-            if new_quantity > variant.stock_quantity:
+            if new_quantity > available:
                 return Response({
-                    'error': f'Cannot add {quantity} more items. Only {variant.stock_quantity - cart_item.quantity} more available'
+                    'error': f'Cannot add {quantity} more items. Only {max(available - cart_item.quantity, 0)} more available'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
         cart_item.quantity = new_quantity
@@ -79,7 +87,32 @@ def add_to_cart(request):
     
     return Response({
         'message': 'Item added to cart successfully',
-        'cart': CartSerializer(cart, context={'request': request}).data
+        'cart': CompactCartSerializer(cart).data
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_update_cart(request):
+    """Apply a list of add / set / remove operations to the cart in one transaction"""
+    serializer = CartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    with transaction.atomic():
+        # Serialize concurrent batches of the same user
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        errors = cart.apply_operations(serializer.validated_data['operations'])
+    
+    if errors:
+        return Response({
+            'error': 'Cart was not updated',
+            'errors': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': 'Cart updated successfully',
+        'cart': CompactCartSerializer(cart).data
     })
 
 
@@ -97,9 +130,12 @@ def update_cart_item(request, item_id):
     
     # Check variant stock if variant exists
     if cart_item.variant:
-        if quantity > cart_item.variant.stock_quantity:
+        available = available_to_sell(
+            {cart_item.variant_id: cart_item.variant.stock_quantity}, exclude_user=request.user
+        )[cart_item.variant_id]
+        if quantity > available:
             return Response({
-                'error': f'Only {cart_item.variant.stock_quantity} items available in stock for this variant'
+                'error': f'Only {available} items available in stock for this variant'
             }, status=status.HTTP_400_BAD_REQUEST)
     
     cart_item.quantity = quantity
@@ -107,7 +143,7 @@ def update_cart_item(request, item_id):
     
     return Response({
         'message': 'Cart updated successfully',
-        'cart': CartSerializer(cart_item.cart, context={'request': request}).data
+        'cart': CompactCartSerializer(cart_item.cart_id).data
     })
 
 
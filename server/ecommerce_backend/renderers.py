@@ -0,0 +1,30 @@
+"""
+JSON renderer backed by orjson when it is installed.
+
+Falls back to DRF's stock JSONRenderer (the ``json`` module) when orjson is not
+available or when pretty-printing was requested (browsable API, ``indent=``).
+Types orjson does not handle natively (Decimal, lazy strings, ...) and datetimes
+are passed to DRF's encoder so the output matches the stock renderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in replacement for JSONRenderer"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 import urllib.parse as urlparse
 from decouple import config, Csv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -129,6 +130,69 @@ else:
     }
 
 
+# Cache
+# Local memory by default (per process). Set REDIS_URL to share the cache between
+# workers, or CACHE_BACKEND=file (optionally with CACHE_LOCATION) for a disk cache.
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis' if REDIS_URL else 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'sixpine',
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+            'KEY_PREFIX': 'sixpine',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sixpine',
+            'KEY_PREFIX': 'sixpine',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Only a Redis cache is seen by every worker. Otherwise the versions that invalidate
+# cached responses are kept in the database (products.CacheNamespace) so a change
+# made through one worker reaches all of them.
+CACHE_IS_SHARED = CACHE_BACKEND == 'redis'
+# Upper bound (seconds) on how long a cached API response is kept
+CACHE_RESPONSE_TIMEOUT = config('CACHE_RESPONSE_TIMEOUT', default=3600, cast=int)
+
+
+# Browsing history (products/history.py)
+# Product views are buffered per process and written in bulk every
+# BROWSING_HISTORY_FLUSH_INTERVAL seconds. The write-behind buffer is off where
+# background threads do not run (Vercel sets VERCEL=1).
+BROWSING_HISTORY_WRITE_BEHIND = config(
+    'BROWSING_HISTORY_WRITE_BEHIND', default=not config('VERCEL', default=False, cast=bool), cast=bool
+)
+BROWSING_HISTORY_FLUSH_INTERVAL = config('BROWSING_HISTORY_FLUSH_INTERVAL', default=5, cast=int)
+BROWSING_HISTORY_MAX_PENDING = config('BROWSING_HISTORY_MAX_PENDING', default=1000, cast=int)
+# Retention enforced by `manage.py prune_browsing_history` (0 disables a limit)
+BROWSING_HISTORY_MAX_PER_USER = config('BROWSING_HISTORY_MAX_PER_USER', default=500, cast=int)
+BROWSING_HISTORY_MAX_AGE_DAYS = config('BROWSING_HISTORY_MAX_AGE_DAYS', default=365, cast=int)
+
+# Stock held while a Razorpay payment is open (orders/reservations.py, in seconds).
+# Expired holds stop counting at once; `manage.py release_stock_reservations` deletes them.
+STOCK_RESERVATION_TTL = config('STOCK_RESERVATION_TTL', default=900, cast=int)
+
+# Idempotency-Key support for checkout and payment endpoints (orders/idempotency.py, in seconds).
+# Stored responses are replayed for IDEMPOTENCY_KEY_TTL; `manage.py prune_idempotency_keys` deletes older ones.
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=60 * 60 * 24, cast=int)
+IDEMPOTENCY_WAIT_TIMEOUT = config('IDEMPOTENCY_WAIT_TIMEOUT', default=30, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -184,6 +248,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'ecommerce_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
@@ -196,6 +264,7 @@ CORS_ALLOWED_ORIGINS = config(
 )
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Only allow all origins in development
 CORS_ALLOW_ALL_ORIGINS = DEBUG
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Address, Order, OrderItem, OrderStatusHistory
+from .models import Address, Order, OrderItem, OrderStatusHistory, StockReservation, CouponRedemption
 
 
 class OrderItemInline(admin.TabularInline):
@@ -64,3 +64,20 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
     list_display = ['order', 'status', 'created_at', 'created_by']
     list_filter = ['status', 'created_at']
     search_fields = ['order__order_id', 'notes']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['variant', 'user', 'quantity', 'razorpay_order_id', 'expires_at', 'created_at']
+    list_filter = ['expires_at']
+    search_fields = ['razorpay_order_id', 'user__username']
+    list_select_related = ['variant__product', 'user']
+    raw_id_fields = ['variant', 'user']
+
+
+@admin.register(CouponRedemption)
+class CouponRedemptionAdmin(admin.ModelAdmin):
+    list_display = ['coupon', 'user', 'times_used', 'last_order', 'updated_at']
+    search_fields = ['coupon__code', 'user__username']
+    list_select_related = ['coupon__vendor', 'user', 'last_order__user']
+    raw_id_fields = ['coupon', 'user', 'last_order']
@@ -0,0 +1,361 @@
+"""
+Order placement shared by every checkout path.
+
+Lines (from the cart or from a request) are loaded with one joined query, the
+touched variants are locked with SELECT ... FOR UPDATE, order items are
+bulk-created and stock is taken with F() expressions, all in one transaction,
+so the number of queries does not grow with the size of the cart.
+
+Stock held for other shoppers' online payments (see reservations.py) is not
+available; the buyer's own holds are released when their order is placed.
+"""
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CouponRedemption, Order, OrderItem, OrderStatusHistory, StockReservation
+from .reservations import available_to_sell, release_holds
+from .utils import calculate_order_totals
+
+CENTS = Decimal('0.01')
+
+
+class CheckoutError(Exception):
+    """An order that cannot be placed; ``message`` is meant for the shopper"""
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.message = message
+        self.field = field
+
+
+def _line(product_id, variant_id, quantity, price, vendor_id, title, color='', size='', pattern=''):
+    return {
+        'product_id': product_id,
+        'variant_id': variant_id,
+        'quantity': quantity,
+        'price': Decimal(str(price)).quantize(CENTS),
+        'vendor_id': vendor_id,
+        'title': title,
+        'color': color or '',
+        'size': size or '',
+        'pattern': pattern or '',
+    }
+
+
+def cart_lines(user):
+    """Lines of the user's cart with prices and variant details, from one joined query"""
+    from cart.models import CartItem, line_unit_price
+
+    rows = CartItem.objects.filter(cart__user=user).annotate(unit_price=line_unit_price()).order_by(
+        'created_at', 'id'
+    ).values_list(
+        'product_id', 'variant_id', 'quantity', 'unit_price', 'product__vendor_id', 'product__title',
+        'variant__color__name', 'variant__size', 'variant__pattern',
+    )
+    return [_line(*row) for row in rows]
+
+
+def item_lines(items):
+    """Lines for ``[{'product_id', 'quantity', 'variant_id'}]`` request data (two queries)"""
+    from products.models import Product, ProductVariant
+
+    products = {
+        row['id']: row for row in Product.objects.filter(
+            pk__in={item['product_id'] for item in items}
+        ).values('id', 'price', 'vendor_id', 'title')
+    }
+    variants = {
+        row['id']: row for row in ProductVariant.objects.filter(
+            pk__in={item['variant_id'] for item in items if item.get('variant_id')}
+        ).values('id', 'product_id', 'price', 'color__name', 'size', 'pattern')
+    }
+
+    lines = []
+    for item in items:
+        product = products.get(item['product_id'])
+        if product is None:
+            raise CheckoutError('Product not found', 'items')
+        variant = variants.get(item.get('variant_id'))
+        if variant is not None and variant['product_id'] != product['id']:
+            variant = None
+        lines.append(_line(
+            product['id'],
+            variant['id'] if variant else None,
+            item['quantity'],
+            variant['price'] if variant and variant['price'] else product['price'],
+            product['vendor_id'],
+            product['title'],
+            *((variant['color__name'], variant['size'], variant['pattern']) if variant else ()),
+        ))
+    return lines
+
+
+def order_lines(order):
+    """Lines of an existing order's items (one query)"""
+    rows = order.items.order_by('id').values_list(
+        'product_id', 'variant_id', 'quantity', 'price', 'vendor_id', 'product__title',
+        'variant_color', 'variant_size', 'variant_pattern',
+    )
+    return [_line(*row) for row in rows]
+
+
+def _variant_quantities(lines):
+    quantities = Counter()
+    for line in lines:
+        if line['variant_id']:
+            quantities[line['variant_id']] += line['quantity']
+    return quantities
+
+
+def _lock_stock(user, lines, quantities, check=True):
+    """
+    Lock the variants in a stable order (so concurrent checkouts cannot
+    deadlock) and, with ``check``, refuse lines exceeding the stock not held
+    for other users.
+    """
+    from products.models import ProductVariant
+
+    stock = dict(ProductVariant.objects.select_for_update().filter(
+        pk__in=quantities
+    ).order_by('pk').values_list('pk', 'stock_quantity'))
+    if not check:
+        return
+    available_stock = available_to_sell(stock, exclude_user=user)
+    for line in lines:
+        if line['variant_id'] not in stock:
+            continue
+        available = available_stock[line['variant_id']]
+        if quantities[line['variant_id']] > available:
+            raise CheckoutError(f"Only {available} items available in stock for {line['title']}", 'items')
+
+
+def reserve_stock(user, lines, razorpay_order_id='', ttl=None):
+    """
+    Hold the variant stock of ``lines`` for ``ttl`` seconds (default
+    ``STOCK_RESERVATION_TTL``) while the user pays. The user's earlier holds
+    are replaced. Raises CheckoutError when the stock is not available;
+    returns the expiry time.
+    """
+    ttl = settings.STOCK_RESERVATION_TTL if ttl is None else ttl
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    quantities = _variant_quantities(lines)
+    with transaction.atomic():
+        release_holds(user=user)
+        if quantities:
+            _lock_stock(user, lines, quantities)
+            StockReservation.objects.bulk_create([
+                StockReservation(
+                    variant_id=variant_id,
+                    user=user,
+                    razorpay_order_id=razorpay_order_id or '',
+                    quantity=quantity,
+                    expires_at=expires_at,
+                )
+                for variant_id, quantity in quantities.items()
+            ])
+    return expires_at
+
+
+def vendor_subtotals(lines):
+    """``{vendor_id: subtotal}`` of the lines (products without a vendor under None)"""
+    subtotals = {}
+    for line in lines:
+        subtotals[line['vendor_id']] = subtotals.get(line['vendor_id'], Decimal('0.00')) + line['price'] * line['quantity']
+    return subtotals
+
+
+def apply_coupon(user, coupon_id, lines, subtotal, strict=True):
+    """
+    ``(coupon, discount)`` for the lines. Vendor coupons only discount that
+    vendor's products. When not ``strict`` an unusable coupon is ignored
+    instead of raising CheckoutError.
+    """
+    from products.models import Coupon
+
+    if not coupon_id:
+        return None, Decimal('0.00')
+    try:
+        coupon = Coupon.objects.select_related('vendor').get(pk=coupon_id)
+    except (Coupon.DoesNotExist, ValueError):
+        if strict:
+            raise CheckoutError('Invalid coupon', 'coupon_id')
+        return None, Decimal('0.00')
+
+    can_use, message = coupon.can_be_used_by_user(user)
+    if not can_use:
+        if strict:
+            raise CheckoutError(message, 'coupon_id')
+        return None, Decimal('0.00')
+
+    if coupon.vendor:
+        vendor_subtotal = vendor_subtotals(lines).get(coupon.vendor_id, Decimal('0.00'))
+        if vendor_subtotal == 0 and strict:
+            raise CheckoutError(
+                f'This coupon applies only to products from {coupon.vendor.brand_name}. '
+                'Please add products from this vendor to your cart.',
+                'coupon_id'
+            )
+        discount, _ = coupon.calculate_discount(subtotal, vendor_subtotal)
+    else:
+        discount, _ = coupon.calculate_discount(subtotal)
+    return coupon, Decimal(str(discount))
+
+
+def rank_coupons(user, lines):
+    """
+    ``[(coupon, discount)]`` for every coupon usable on ``lines``, best first.
+
+    Candidates are the store-wide coupons and those of vendors present in the
+    lines, taken from the in-process coupon table. The subtotal and per-vendor
+    subtotals are computed once; the only query checks once-per-user coupons
+    against the redemption ledger.
+    """
+    from products.coupons import coupon_table
+
+    if not lines:
+        return []
+    subtotals = vendor_subtotals(lines)
+    subtotal = sum(subtotals.values(), Decimal('0.00'))
+    candidates = [
+        coupon for coupon in coupon_table.active()
+        if coupon.is_valid() and (coupon.vendor_id is None or subtotals.get(coupon.vendor_id))
+    ]
+    once = [coupon.pk for coupon in candidates if coupon.one_time_use_per_user]
+    used = set(CouponRedemption.objects.filter(
+        user=user, coupon_id__in=once, times_used__gt=0
+    ).values_list('coupon_id', flat=True)) if once else set()
+
+    ranked = []
+    for coupon in candidates:
+        if coupon.pk in used:
+            continue
+        discount, _ = coupon.calculate_discount(subtotal, subtotals.get(coupon.vendor_id) if coupon.vendor_id else None)
+        discount = Decimal(str(discount)).quantize(CENTS)
+        if discount > 0:
+            ranked.append((coupon, discount))
+    ranked.sort(key=lambda item: (-item[1], item[0].pk))
+    return ranked
+
+
+def redeem_coupon(coupon, user, order, strict=True):
+    """
+    Count a redemption of ``coupon`` by ``user`` with conditional F()
+    increments of Coupon.used_count and the (coupon, user) ledger row. When
+    ``strict``, CheckoutError is raised (and the caller's transaction rolls
+    back) if the usage limit or the once-per-user limit has been reached.
+    """
+    from products.models import Coupon
+    from products.coupons import coupon_table
+
+    coupons = Coupon.objects.filter(pk=coupon.pk)
+    if strict:
+        coupons = coupons.filter(Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')))
+    if not coupons.update(used_count=F('used_count') + 1) and strict:
+        raise CheckoutError('Coupon usage limit has been reached', 'coupon_id')
+
+    CouponRedemption.objects.bulk_create([CouponRedemption(coupon=coupon, user=user)], ignore_conflicts=True)
+    redemptions = CouponRedemption.objects.filter(coupon=coupon, user=user)
+    if strict and coupon.one_time_use_per_user:
+        redemptions = redemptions.filter(times_used=0)
+    updated = redemptions.update(times_used=F('times_used') + 1, last_order=order, updated_at=timezone.now())
+    if not updated and strict:
+        raise CheckoutError('This coupon can only be used once per user', 'coupon_id')
+
+    if coupon.usage_limit is not None:
+        # The cached copy may now be used up
+        coupon_table.invalidate()
+
+
+def place_order(user, lines, *, shipping_address_id, payment_method, coupon_id=None, strict_coupon=True,
+                status='pending', payment_status='pending', take_stock=True, check_stock=True,
+                status_note='Order created', clear_cart=False, **order_fields):
+    """
+    Create an order for ``lines`` atomically and return it.
+
+    ``take_stock`` decrements variant stock; with ``check_stock`` the order is
+    refused (CheckoutError) when a locked variant has too little stock not
+    held for other users, otherwise stock is floored at zero (payment already
+    taken). A strict coupon counts as used, the user's stock holds are
+    released and ``clear_cart`` empties the user's cart.
+    """
+    from products.models import ProductVariant
+    from products import personalization
+
+    if not lines:
+        raise CheckoutError('Cart is empty')
+
+    with transaction.atomic():
+        quantities = _variant_quantities(lines)
+        if take_stock and quantities:
+            _lock_stock(user, lines, quantities, check=check_stock)
+
+        subtotal = sum((line['price'] * line['quantity'] for line in lines), Decimal('0.00'))
+        coupon, coupon_discount = apply_coupon(user, coupon_id, lines, subtotal, strict=strict_coupon)
+        totals = calculate_order_totals(subtotal - coupon_discount, payment_method)
+
+        order = Order.objects.create(
+            user=user,
+            shipping_address_id=shipping_address_id,
+            subtotal=subtotal,
+            coupon=coupon,
+            coupon_discount=coupon_discount,
+            coupon_redeemed=bool(coupon and strict_coupon),
+            shipping_cost=totals['shipping_cost'],
+            platform_fee=totals['platform_fee'],
+            tax_amount=totals['tax_amount'],
+            total_amount=totals['total_amount'],
+            payment_method=payment_method,
+            payment_status=payment_status,
+            status=status,
+            **order_fields
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line['product_id'],
+                variant_id=line['variant_id'],
+                vendor_id=line['vendor_id'],
+                quantity=line['quantity'],
+                price=line['price'],
+                variant_color=line['color'],
+                variant_size=line['size'],
+                variant_pattern=line['pattern'],
+            )
+            for line in lines
+        ])
+
+        if take_stock:
+            ProductVariant.adjust_stock(
+                {variant_id: -quantity for variant_id, quantity in quantities.items()},
+                floor=not check_stock
+            )
+        if coupon and strict_coupon:
+            redeem_coupon(coupon, user, order)
+
+        OrderStatusHistory.objects.create(order=order, status=status, notes=status_note, created_by=user)
+        # The buyer's holds are either taken as stock above or no longer needed
+        release_holds(user=user)
+        if clear_cart:
+            from cart.models import CartItem
+            CartItem.objects.filter(cart__user=user).delete()
+
+    # bulk_create sends no post_save; the purchases change the buyer's affinity
+    personalization.invalidate_user_affinity(user.pk)
+    return order
+
+
+def restock_variants(order, sign, floor=False):
+    """Add (``sign=1``) or take (``sign=-1``) the variant stock of an order's items in one update"""
+    from products.models import ProductVariant
+
+    quantities = Counter()
+    for variant_id, quantity in order.items.filter(variant__isnull=False).values_list('variant_id', 'quantity'):
+        quantities[variant_id] += sign * quantity
+    if quantities:
+        ProductVariant.adjust_stock(dict(quantities), floor=floor)
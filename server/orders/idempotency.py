@@ -0,0 +1,132 @@
+"""
+``Idempotency-Key`` support for order-creating and payment endpoints.
+
+The first request with a key claims an IdempotencyRecord row (unique per user
+and key) in its own short transaction, runs the view and stores the response.
+Repeats replay the stored response without running the view again; duplicates
+arriving while the first request is still in flight poll the row for up to
+``IDEMPOTENCY_WAIT_TIMEOUT`` seconds instead of racing it. Server errors and
+exceptions release the key so the client can retry. Records are kept for
+``IDEMPOTENCY_KEY_TTL`` seconds; see the prune_idempotency_keys command.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+POLL_INTERVAL = 0.2
+# In-flight records older than this belong to a request that died
+STALE_AFTER = 300
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """``(record, created)``; record is None when it vanished between the insert and the read"""
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(user=user, key=key, fingerprint=fingerprint), True
+    except IntegrityError:
+        return IdempotencyRecord.objects.filter(user=user, key=key).first(), False
+
+
+def _replay(record):
+    response = Response(json.loads(record.response_body or 'null'), status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a POST function view idempotent for requests carrying an
+    ``Idempotency-Key`` header (apply below ``@api_view``).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{HEADER} must be at most 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = _fingerprint(request)
+        ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            record, created = _claim(request.user, key, fingerprint)
+            if created:
+                break
+            if record is None:
+                continue
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'error': f'{HEADER} was already used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            age = timezone.now() - record.created_at
+            if record.status_code is not None:
+                if age <= ttl:
+                    return _replay(record)
+                # Expired: forget it and claim the key afresh
+                IdempotencyRecord.objects.filter(pk=record.pk).delete()
+                continue
+            if age > timedelta(seconds=STALE_AFTER):
+                IdempotencyRecord.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+                continue
+            if time.monotonic() >= deadline:
+                response = Response(
+                    {'error': f'A request with this {HEADER} is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+                response['Retry-After'] = '1'
+                return response
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            raise
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            # Not a final outcome: let the client retry with the same key
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            return response
+        IdempotencyRecord.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            response_body=json.dumps(response.data, cls=JSONEncoder),
+        )
+        return response
+
+    return wrapper
+
+
+def prune_expired(chunk_size=1000):
+    """Delete records older than ``IDEMPOTENCY_KEY_TTL`` in chunks; returns the number removed"""
+    cutoff = timezone.now() - timedelta(seconds=max(settings.IDEMPOTENCY_KEY_TTL, STALE_AFTER))
+    expired = IdempotencyRecord.objects.filter(created_at__lt=cutoff)
+    total = 0
+    while True:
+        pks = list(expired.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        removed, _ = IdempotencyRecord.objects.filter(pk__in=pks).delete()
+        total += removed
+    logger.info('Pruned %d idempotency record(s)', total)
+    return total
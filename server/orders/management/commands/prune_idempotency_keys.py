@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from orders.idempotency import prune_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL, in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Records deleted per statement (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        removed = prune_expired(chunk_size=max(1, options['chunk_size']))
+        self.stdout.write(self.style.SUCCESS(f'Pruned {removed} idempotency record(s).'))
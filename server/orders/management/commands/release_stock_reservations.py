@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from orders.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired stock reservations (holds of abandoned Razorpay payments) in small chunks. '
+        'Expired holds already stop counting against stock; run this periodically, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Reservations deleted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between chunks to let other writers through (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        removed = release_expired(
+            chunk_size=max(1, options['chunk_size']),
+            pause=max(0.0, options['pause']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Released {removed} expired stock reservation(s).'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:54
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_orderitem_vendor'),
+        ('products', '0021_catalog_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razorpay_order_id', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productvariant')),
+            ],
+            options={
+                'db_table': 'orders_stock_reservation',
+                'indexes': [models.Index(fields=['variant', 'expires_at'], name='stock_res_variant_exp_idx'), models.Index(fields=['expires_at'], name='stock_res_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def populate_coupon_redemptions(apps, schema_editor):
+    """Ledger rows for coupons already used by existing orders"""
+    Order = apps.get_model('orders', 'Order')
+    CouponRedemption = apps.get_model('orders', 'CouponRedemption')
+
+    rows = Order.objects.filter(coupon__isnull=False).order_by().values('coupon_id', 'user_id').annotate(
+        times_used=Count('id'), last_order_id=Max('id')
+    )
+    CouponRedemption.objects.bulk_create([
+        CouponRedemption(
+            coupon_id=row['coupon_id'],
+            user_id=row['user_id'],
+            times_used=row['times_used'],
+            last_order_id=row['last_order_id'],
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_stock_reservation'),
+        ('products', '0021_catalog_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('times_used', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='products.coupon')),
+                ('last_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'orders_coupon_redemption',
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'user'), name='coupon_redemption_coupon_user_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_coupon_redemptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+from django.db import migrations, models
+
+
+def mark_counted_coupons(apps, schema_editor):
+    """Migration 0009 counted the coupon of every existing order in the ledger"""
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.filter(coupon__isnull=False).update(coupon_redeemed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coupon_redeemed',
+            field=models.BooleanField(default=False, help_text='Coupon use already counted (orders/checkout.py redeem_coupon)'),
+        ),
+        migrations.RunPython(mark_counted_coupons, migrations.RunPython.noop),
+    ]
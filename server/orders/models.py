@@ -77,6 +77,7 @@ class Order(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     coupon = models.ForeignKey(Coupon, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     coupon_discount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='Discount amount from coupon')
+    coupon_redeemed = models.BooleanField(default=False, help_text='Coupon use already counted (orders/checkout.py redeem_coupon)')
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     platform_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='Payment gateway platform fee based on payment method')
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -171,3 +172,76 @@ class OrderNote(models.Model):
 
     def __str__(self):
         return f"Note for Order {self.order.order_id} by {self.created_by.username if self.created_by else 'Unknown'}"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a shopper between starting an online payment and verifying
+    it. Holds stop counting once ``expires_at`` has passed; the
+    release_stock_reservations command deletes them.
+    """
+    variant = models.ForeignKey('products.ProductVariant', on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_reservations')
+    razorpay_order_id = models.CharField(max_length=100, blank=True, db_index=True)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'orders_stock_reservation'
+        indexes = [
+            # Active holds of a few variants (available-to-sell) and expired holds (sweeper)
+            models.Index(fields=['variant', 'expires_at'], name='stock_res_variant_exp_idx'),
+            models.Index(fields=['expires_at'], name='stock_res_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x variant {self.variant_id} held for {self.user_id} until {self.expires_at}"
+
+
+class CouponRedemption(models.Model):
+    """
+    How often a user has redeemed a coupon, one row per (coupon, user).
+    Incremented with conditional F() updates when an order is placed, so the
+    per-user limit holds under concurrent checkouts.
+    """
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='coupon_redemptions')
+    times_used = models.PositiveIntegerField(default=0)
+    last_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'orders_coupon_redemption'
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name='coupon_redemption_coupon_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon.code} used {self.times_used}x by {self.user_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Outcome of a request sent with an ``Idempotency-Key`` header, per user
+    and key. ``status_code`` is null while the first request is in flight.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text='SHA-256 of the method, path and body')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'orders_idempotency_record'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_record_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in progress'})"
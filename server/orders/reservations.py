@@ -0,0 +1,78 @@
+"""
+Time-boxed stock holds for online payments.
+
+create_razorpay_order holds the variants being paid for during
+``STOCK_RESERVATION_TTL`` seconds so two shoppers cannot pay for the last
+unit; placing (or completing) the order releases the holds in the same
+transaction that takes the stock. Stock available to sell is the variant's
+stock minus other users' unexpired holds, summed over the (variant,
+expires_at) index for just the variants asked about; the cart and checkout
+stock checks use it. Expired holds no longer count and are deleted in bulk by
+the release_stock_reservations command.
+"""
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+def active_holds(variant_ids, exclude_user=None):
+    """``{variant_id: quantity}`` held by unexpired reservations (of other users)"""
+    holds = StockReservation.objects.filter(variant_id__in=list(variant_ids), expires_at__gt=timezone.now())
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return dict(holds.order_by().values('variant_id').annotate(
+        held=Sum('quantity')
+    ).values_list('variant_id', 'held'))
+
+
+def available_to_sell(stock, exclude_user=None):
+    """
+    ``{variant_id: stock minus active holds}`` for a ``{variant_id: stock}``
+    mapping the caller already has (locked rows, the variant matrix)
+    """
+    held = active_holds(stock, exclude_user)
+    return {pk: max(quantity - held.get(pk, 0), 0) for pk, quantity in stock.items()}
+
+
+def attach_razorpay_order(user, razorpay_order_id):
+    """Tag the user's holds placed before the Razorpay order existed with its id"""
+    return StockReservation.objects.filter(user=user, razorpay_order_id='').update(
+        razorpay_order_id=razorpay_order_id
+    )
+
+
+def release_holds(user=None, razorpay_order_id=None):
+    """Delete the holds of a user and/or a Razorpay order; returns the number removed"""
+    if user is None and not razorpay_order_id:
+        return 0
+    holds = StockReservation.objects.all()
+    if user is not None:
+        holds = holds.filter(user=user)
+    if razorpay_order_id:
+        holds = holds.filter(razorpay_order_id=razorpay_order_id)
+    removed, _ = holds.delete()
+    return removed
+
+
+def release_expired(chunk_size=1000, pause=0.0):
+    """Delete expired holds in chunks, one short transaction each; returns the number removed"""
+    expired = StockReservation.objects.filter(expires_at__lte=timezone.now())
+    total = 0
+    while True:
+        pks = list(expired.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            removed, _ = StockReservation.objects.filter(pk__in=pks).delete()
+        total += removed
+        if pause:
+            time.sleep(pause)
+    logger.info('Released %d expired stock reservation(s)', total)
+    return total
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import Address, Order, OrderItem, OrderStatusHistory, OrderNote
-from products.serializers import ProductListSerializer, ProductVariantSerializer
+from products.serializers import ProductCardSerializer, ProductVariantSerializer
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -16,7 +16,7 @@ class AddressSerializer(serializers.ModelSerializer):
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer(read_only=True)
+    product = ProductCardSerializer(source='product_id', read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     variant = ProductVariantSerializer(read_only=True)
     variant_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
@@ -87,6 +87,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         """Add coupon information to response"""
+        ProductCardSerializer.preload(self.context, [item.product_id for item in instance.items.all()])
         data = super().to_representation(instance)
         # Include coupon information
         if instance.coupon:
@@ -122,114 +123,19 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        from products.models import Product, Coupon
-        from decimal import Decimal
+        from .checkout import CheckoutError, item_lines, place_order
         
-        user = self.context['request'].user
+        user = validated_data.pop('user', None) or self.context['request'].user
         items_data = validated_data.pop('items')
-        shipping_address_id = validated_data.pop('shipping_address_id')
-        coupon_id = validated_data.pop('coupon_id', None)
-        payment_method = validated_data.pop('payment_method', 'COD')
-        
-        # Calculate totals
-        subtotal = Decimal('0.00')
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            subtotal += product.price * item_data['quantity']
-        
-        # Handle coupon if provided
-        coupon = None
-        coupon_discount = Decimal('0.00')
-        if coupon_id:
-            try:
-                coupon = Coupon.objects.get(id=coupon_id)
-                can_use, message = coupon.can_be_used_by_user(user)
-                if can_use:
-                    # If coupon is vendor-specific, calculate discount only on vendor's products
-                    if coupon.vendor:
-                        vendor_subtotal = Decimal('0.00')
-                        for item_data in items_data:
-                            product = Product.objects.get(id=item_data['product_id'])
-                            if product.vendor and product.vendor.id == coupon.vendor.id:
-                                vendor_subtotal += product.price * item_data['quantity']
-                        
-                        if vendor_subtotal == 0:
-                            raise serializers.ValidationError({
-                                'coupon_id': f'This coupon applies only to products from {coupon.vendor.brand_name}. Please add products from this vendor to your cart.'
-                            })
-                        
-                        discount_amount, _ = coupon.calculate_discount(subtotal, vendor_subtotal)
-                    else:
-                        discount_amount, _ = coupon.calculate_discount(subtotal)
-                    
-                    coupon_discount = Decimal(str(discount_amount))
-                    # Update coupon usage
-                    coupon.used_count += 1
-                    coupon.save()
-                else:
-                    raise serializers.ValidationError({'coupon_id': message})
-            except Coupon.DoesNotExist:
-                raise serializers.ValidationError({'coupon_id': 'Invalid coupon'})
-        
-        from .utils import calculate_order_totals
-        
-        # Calculate totals with platform fee (after coupon discount)
-        subtotal_after_discount = subtotal - coupon_discount
-        totals = calculate_order_totals(subtotal_after_discount, payment_method)
-        
-        # Create order with all required fields stored in database
-        order = Order.objects.create(
-            user=user,
-            shipping_address_id=shipping_address_id,
-            subtotal=subtotal,  # Store original subtotal
-            coupon=coupon,  # Store coupon reference
-            coupon_discount=coupon_discount,  # Store coupon discount amount
-            shipping_cost=totals['shipping_cost'],  # Store shipping cost
-            platform_fee=totals['platform_fee'],  # Store platform fee
-            tax_amount=totals['tax_amount'],  # Store tax amount
-            total_amount=totals['total_amount'],  # Store total amount
-            payment_method=payment_method,
-            **validated_data
-        )
-        
-        # Create order items
-        from products.models import ProductVariant
-        
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            variant_id = item_data.get('variant_id')
-            variant = None
-            
-            if variant_id:
-                try:
-                    variant = ProductVariant.objects.get(id=variant_id, product=product)
-                except ProductVariant.DoesNotExist:
-                    pass
-            
-            # Get price from variant if available
-            price = product.price
-            if variant and variant.price:
-                price = variant.price
-            
-            # Get vendor from product
-            vendor = product.vendor if hasattr(product, 'vendor') else None
-            
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                variant=variant,
-                vendor=vendor,
-                quantity=item_data['quantity'],
-                price=price,
-                variant_color=variant.color.name if variant else '',
-                variant_size=variant.size if variant else '',
-                variant_pattern=variant.pattern if variant else ''
+        try:
+            return place_order(
+                user,
+                item_lines(items_data),
+                shipping_address_id=validated_data.pop('shipping_address_id'),
+                payment_method=validated_data.pop('payment_method', 'COD'),
+                coupon_id=validated_data.pop('coupon_id', None),
+                status_note='Order created',
+                **validated_data
             )
-            
-            # Update variant stock if variant exists
-            if variant:
-                variant.stock_quantity -= item_data['quantity']
-                variant.is_in_stock = variant.stock_quantity > 0
-                variant.save()
-        
-        return order
\ No newline at end of file
+        except CheckoutError as e:
+            raise serializers.ValidationError({e.field or 'non_field_errors': e.message})
\ No newline at end of file
@@ -15,4 +15,5 @@ urlpatterns = [
     path('orders/complete-payment/', views.complete_payment, name='complete-payment'),
     path('payment-charges/', views.get_payment_charges, name='get-payment-charges'),
     path('coupons/validate/', views.validate_coupon, name='validate-coupon'),
+    path('coupons/best/', views.get_best_coupons, name='best-coupons'),
 ]
\ No newline at end of file
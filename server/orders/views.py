@@ -3,16 +3,25 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.db import transaction
 import razorpay
 import hmac
 import hashlib
+import uuid
 from .models import Address, Order, OrderStatusHistory
-from products.models import Coupon
+from products.coupons import coupon_table
+from products.pagination import CursorPaginationMixin
+from products.serializers import ProductCardSerializer
 from .serializers import (
     AddressSerializer, OrderListSerializer, OrderDetailSerializer, 
     OrderCreateSerializer
 )
-from .utils import calculate_order_totals
+from .checkout import (
+    CheckoutError, cart_lines, order_lines, place_order, rank_coupons, redeem_coupon, reserve_stock,
+    restock_variants
+)
+from .reservations import attach_razorpay_order, release_holds
+from .idempotency import idempotent
 from admin_api.models import GlobalSettings
 
 # Initialize Razorpay client
@@ -64,15 +73,32 @@ class AddressDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
 
 
-class OrderListView(generics.ListAPIView):
+class OrderListView(CursorPaginationMixin, generics.ListAPIView):
     serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user).select_related('shipping_address').prefetch_related(
-            'items__product', 'items__variant__color'
+            'items', 'items__variant__color'
         )
 
+    def get_serializer(self, *args, **kwargs):
+        """Load the product cards of every order on the page together"""
+        orders = args[0] if args else None
+        if kwargs.get('many') and orders is not None:
+            kwargs.setdefault('context', self.get_serializer_context())
+            ProductCardSerializer.preload(
+                kwargs['context'], [item.product_id for order in orders for item in order.items.all()]
+            )
+        return super().get_serializer(*args, **kwargs)
+
+
+def order_detail_queryset():
+    """Orders with everything OrderDetailSerializer reads, in a fixed number of queries"""
+    return Order.objects.prefetch_related(
+        'items__product', 'items__variant__color', 'items__variant__images', 'status_history__created_by'
+    ).select_related('shipping_address', 'coupon')
+
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderDetailSerializer
@@ -80,9 +106,7 @@ class OrderDetailView(generics.RetrieveAPIView):
     lookup_field = 'order_id'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related(
-            'items__product', 'items__variant__color', 'status_history'
-        ).select_related('shipping_address')
+        return order_detail_queryset().filter(user=self.request.user)
 
 
 class OrderCreateView(generics.CreateAPIView):
@@ -90,31 +114,15 @@ class OrderCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        order = serializer.save(user=self.request.user)
-        
-        # Create initial status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='pending',
-            notes='Order created',
-            created_by=self.request.user
-        )
-        
-        # Clear user's cart after successful order
-        from cart.models import Cart
-        try:
-            cart = Cart.objects.get(user=self.request.user)
-            cart.items.all().delete()
-        except Cart.DoesNotExist:
-            pass
+        # The serializer places the order through the checkout service
+        serializer.save(user=self.request.user)
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def checkout_from_cart(request):
     """Create order from user's cart"""
-    from cart.models import Cart
-    
     shipping_address_id = request.data.get('shipping_address_id')
     order_notes = request.data.get('order_notes', '')
     
@@ -124,57 +132,30 @@ def checkout_from_cart(request):
     # Verify shipping address belongs to user
     address = get_object_or_404(Address, id=shipping_address_id, user=request.user)
     
-    # Get user's cart
-    try:
-        cart = Cart.objects.get(user=request.user)
-    except Cart.DoesNotExist:
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    if not cart.items.exists():
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Prepare items data
-    items_data = []
-    for cart_item in cart.items.all():
-        items_data.append({
-            'product_id': cart_item.product.id,
-            'quantity': cart_item.quantity
-        })
-    
     # Get coupon_id and payment_method if provided
     coupon_id = request.data.get('coupon_id', None)
     payment_method = request.data.get('payment_method', 'COD')
+    if payment_method not in dict(Order.PAYMENT_METHOD_CHOICES):
+        return Response({'payment_method': [f'"{payment_method}" is not a valid choice.']}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create order
-    order_data = {
-        'shipping_address_id': shipping_address_id,
-        'items': items_data,
-        'order_notes': order_notes,
-        'coupon_id': coupon_id,
-        'payment_method': payment_method
-    }
-    
-    serializer = OrderCreateSerializer(data=order_data, context={'request': request})
-    if serializer.is_valid():
-        order = serializer.save()
-        
-        # Create initial status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='pending',
-            notes='Order created from cart',
-            created_by=request.user
+    try:
+        order = place_order(
+            request.user,
+            cart_lines(request.user),
+            shipping_address_id=address.id,
+            payment_method=payment_method,
+            coupon_id=coupon_id,
+            order_notes=order_notes,
+            status_note='Order created from cart',
+            clear_cart=True
         )
-        
-        # Clear cart
-        cart.items.all().delete()
-        
-        return Response({
-            'message': 'Order created successfully',
-            'order': OrderDetailSerializer(order, context={'request': request}).data
-        }, status=status.HTTP_201_CREATED)
-    else:
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    except CheckoutError as e:
+        return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': 'Order created successfully',
+        'order': OrderDetailSerializer(order_detail_queryset().get(pk=order.pk), context={'request': request}).data
+    }, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
@@ -200,21 +181,16 @@ def cancel_order(request, order_id):
     )
     
     # Restore variant stock
-    for item in order.items.all():
-        if item.variant:
-            item.variant.stock_quantity += item.quantity
-            item.variant.is_in_stock = item.variant.stock_quantity > 0
-            item.variant.save()
+    restock_variants(order, 1)
     
     return Response({'message': 'Order cancelled successfully'})
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def create_razorpay_order(request):
-    """Create a Razorpay order for payment"""
-    from cart.models import Cart
-    
+    """Create a Razorpay order for payment and hold the stock being paid for"""
     # Check if Razorpay is enabled
     razorpay_enabled = GlobalSettings.get_setting('razorpay_enabled', True)
     if isinstance(razorpay_enabled, str):
@@ -269,6 +245,31 @@ def create_razorpay_order(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Stock to hold while the user pays: a pending order's items, or the cart
+        pending_order_id = request.data.get('order_id')
+        if pending_order_id:
+            try:
+                pending_order = Order.objects.filter(
+                    order_id=uuid.UUID(str(pending_order_id)), user=request.user, payment_status='pending'
+                ).first()
+            except ValueError:
+                pending_order = None
+            if pending_order is None:
+                return Response(
+                    {'error': 'Order not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            reservation_lines = order_lines(pending_order)
+        else:
+            reservation_lines = cart_lines(request.user)
+        
+        # Hold the stock before talking to Razorpay, so a short stock creates no
+        # Razorpay order; the hold lasts until the payment is verified or it expires
+        try:
+            reservation_expires_at = reserve_stock(request.user, reservation_lines)
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Get or create Razorpay customer for token saving
         # Use User model to store customer_id - created ON FIRST PAYMENT ATTEMPT (not at login)
         # Uses logged-in user's email, name, and phone to create customer
@@ -351,9 +352,15 @@ def create_razorpay_order(request):
         
         print(f'[RAZORPAY] Creating Razorpay order with data: {order_data}')
         logger.info(f'Creating Razorpay order with data: {order_data}')
-        razorpay_order = razorpay_client.order.create(order_data)
+        try:
+            razorpay_order = razorpay_client.order.create(order_data)
+        except Exception:
+            # No payment will follow: give the held stock back
+            release_holds(user=request.user)
+            raise
         print(f'[RAZORPAY] ✅ Created Razorpay order {razorpay_order.get("id")} for user {request.user.email}')
         logger.info(f'✅ Created Razorpay order {razorpay_order.get("id")} for user {request.user.email}')
+        attach_razorpay_order(request.user, razorpay_order['id'])
         
         razorpay_key_id = getattr(settings, 'RAZORPAY_KEY_ID', '')
         
@@ -410,7 +417,8 @@ def create_razorpay_order(request):
             'razorpay_order_id': razorpay_order['id'],
             'amount': amount_float,  # Amount in rupees (frontend will convert to paise)
             'currency': 'INR',
-            'key': razorpay_key_id
+            'key': razorpay_key_id,
+            'reservation_expires_at': reservation_expires_at.isoformat()
         }
         
         # Only include customer_id if it's valid (from User model)
@@ -449,11 +457,9 @@ def create_razorpay_order(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def verify_razorpay_payment(request):
     """Verify Razorpay payment and create order"""
-    from cart.models import Cart
-    from decimal import Decimal
-    
     razorpay_order_id = request.data.get('razorpay_order_id')
     razorpay_payment_id = request.data.get('razorpay_payment_id')
     razorpay_signature = request.data.get('razorpay_signature')
@@ -484,106 +490,31 @@ def verify_razorpay_payment(request):
         }
         
         razorpay_client.utility.verify_payment_signature(params_dict)
-    except razorpay.SignatureVerificationError:
+    except razorpay.errors.SignatureVerificationError:
         # Payment verification failed - create pending order for user to complete payment later
         address = get_object_or_404(Address, id=shipping_address_id, user=request.user)
         
-        try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if not cart.items.exists():
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Calculate totals
-        subtotal = Decimal('0.00')
-        for cart_item in cart.items.all():
-            price = cart_item.product.price
-            if cart_item.variant and cart_item.variant.price:
-                price = cart_item.variant.price
-            subtotal += price * cart_item.quantity
-        
-        # Handle coupon if provided
-        coupon = None
-        coupon_discount = Decimal('0.00')
-        if coupon_id:
-            try:
-                coupon = Coupon.objects.get(id=coupon_id)
-                can_use, message = coupon.can_be_used_by_user(request.user)
-                if can_use:
-                    # If coupon is vendor-specific, calculate discount only on vendor's products
-                    if coupon.vendor:
-                        vendor_subtotal = Decimal('0.00')
-                        for cart_item in cart.items.all():
-                            if cart_item.product.vendor and cart_item.product.vendor.id == coupon.vendor.id:
-                                price = cart_item.product.price
-                                if cart_item.variant and cart_item.variant.price:
-                                    price = cart_item.variant.price
-                                vendor_subtotal += price * cart_item.quantity
-                        discount_amount, _ = coupon.calculate_discount(subtotal, vendor_subtotal)
-                    else:
-                        discount_amount, _ = coupon.calculate_discount(subtotal)
-                    coupon_discount = Decimal(str(discount_amount))
-                # Don't increment usage for failed verification
-            except Coupon.DoesNotExist:
-                pass
-        
         # Map payment method for platform fee calculation
         payment_method_for_calc = payment_method_from_request.upper() if payment_method_from_request else 'COD'
         
-        # Calculate totals with platform fee (after coupon discount)
-        subtotal_after_discount = subtotal - coupon_discount
-        totals = calculate_order_totals(subtotal_after_discount, payment_method_for_calc)
-        
-        # Create pending order with payment_status='pending'
-        order = Order.objects.create(
-            user=request.user,
-            shipping_address=address,
-            subtotal=subtotal,
-            coupon=coupon,
-            coupon_discount=coupon_discount,
-            shipping_cost=totals['shipping_cost'],
-            platform_fee=totals['platform_fee'],
-            tax_amount=totals['tax_amount'],
-            total_amount=totals['total_amount'],
-            payment_method=payment_method_for_calc,
-            razorpay_order_id=razorpay_order_id,
-            payment_status='pending',
-            status='pending'
-        )
-        
-        # Create order items
-        for cart_item in cart.items.all():
-            from orders.models import OrderItem
-            from products.models import ProductVariant
-            
-            # Get price from variant if available, otherwise from product
-            price = cart_item.product.price
-            if cart_item.variant and cart_item.variant.price:
-                price = cart_item.variant.price
-            
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                price=price,
-                variant_color=cart_item.variant.color.name if cart_item.variant else '',
-                variant_size=cart_item.variant.size if cart_item.variant else '',
-                variant_pattern=cart_item.variant.pattern if cart_item.variant else ''
+        try:
+            # Stock is not taken and the coupon is not counted until payment completes
+            order = place_order(
+                request.user,
+                cart_lines(request.user),
+                shipping_address_id=address.id,
+                payment_method=payment_method_for_calc,
+                coupon_id=coupon_id,
+                strict_coupon=False,
+                take_stock=False,
+                razorpay_order_id=razorpay_order_id,
+                payment_status='pending',
+                status='pending',
+                status_note='Order created but payment verification failed. User needs to complete payment.',
+                clear_cart=True
             )
-        
-        # Create status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='pending',
-            notes='Order created but payment verification failed. User needs to complete payment.',
-            created_by=request.user
-        )
-        
-        # Clear cart even if payment failed (order is created)
-        cart.items.all().delete()
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'error': 'Payment signature verification failed. Order created with pending payment status.',
@@ -595,67 +526,6 @@ def verify_razorpay_payment(request):
     # Verify address belongs to user
     address = get_object_or_404(Address, id=shipping_address_id, user=request.user)
     
-    # Get cart
-    try:
-        cart = Cart.objects.get(user=request.user)
-    except Cart.DoesNotExist:
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    if not cart.items.exists():
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Prepare items data
-    items_data = []
-    for cart_item in cart.items.all():
-        items_data.append({
-            'product_id': cart_item.product.id,
-            'quantity': cart_item.quantity
-        })
-    
-    # Calculate totals
-    subtotal = Decimal('0.00')
-    for cart_item in cart.items.all():
-        price = cart_item.product.price
-        if cart_item.variant and cart_item.variant.price:
-            price = cart_item.variant.price
-        subtotal += price * cart_item.quantity
-    
-    # Handle coupon if provided
-    coupon = None
-    coupon_discount = Decimal('0.00')
-    if coupon_id:
-        try:
-            coupon = Coupon.objects.get(id=coupon_id)
-            can_use, message = coupon.can_be_used_by_user(request.user)
-            if can_use:
-                # If coupon is vendor-specific, calculate discount only on vendor's products
-                if coupon.vendor:
-                    vendor_subtotal = Decimal('0.00')
-                    for cart_item in cart.items.all():
-                        if cart_item.product.vendor and cart_item.product.vendor.id == coupon.vendor.id:
-                            price = cart_item.product.price
-                            if cart_item.variant and cart_item.variant.price:
-                                price = cart_item.variant.price
-                            vendor_subtotal += price * cart_item.quantity
-                    
-                    if vendor_subtotal == 0:
-                        return Response({
-                            'error': f'This coupon applies only to products from {coupon.vendor.brand_name}. Please add products from this vendor to your cart.'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    discount_amount, _ = coupon.calculate_discount(subtotal, vendor_subtotal)
-                else:
-                    discount_amount, _ = coupon.calculate_discount(subtotal)
-                
-                coupon_discount = Decimal(str(discount_amount))
-                # Update coupon usage
-                coupon.used_count += 1
-                coupon.save()
-            else:
-                return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
-        except Coupon.DoesNotExist:
-            return Response({'error': 'Invalid coupon'}, status=status.HTTP_400_BAD_REQUEST)
-    
     # Map payment method to internal format for platform fee calculation
     # Use payment_method_from_request (from frontend: CC, NB, UPI, etc.) for calculation
     # This ensures platform fee is calculated correctly based on what user selected
@@ -666,69 +536,25 @@ def verify_razorpay_payment(request):
         # Default to CC (Card) if not specified
         payment_method_for_calc = 'CC'
     
-    # Calculate totals with platform fee (after coupon discount)
-    # Platform fee is calculated based on payment method (CC = 2.36%, UPI = 0%, etc.)
-    subtotal_after_discount = subtotal - coupon_discount
-    totals = calculate_order_totals(subtotal_after_discount, payment_method_for_calc)
-    
-    print(f'[PLATFORM_FEE] Calculation for order:')
-    print(f'[PLATFORM_FEE]    - Payment Method (from request): {payment_method_from_request}')
-    print(f'[PLATFORM_FEE]    - Payment Method (for calc): {payment_method_for_calc}')
-    print(f'[PLATFORM_FEE]    - Subtotal after discount: {subtotal_after_discount}')
-    print(f'[PLATFORM_FEE]    - Platform Fee: {totals["platform_fee"]}')
-    print(f'[PLATFORM_FEE]    - Tax: {totals["tax_amount"]}')
-    print(f'[PLATFORM_FEE]    - Total: {totals["total_amount"]}')
-    
-    # Create order
-    order = Order.objects.create(
-        user=request.user,
-        shipping_address=address,
-        subtotal=subtotal,
-        coupon=coupon,
-        coupon_discount=coupon_discount,
-        shipping_cost=totals['shipping_cost'],
-        platform_fee=totals['platform_fee'],
-        tax_amount=totals['tax_amount'],
-        total_amount=totals['total_amount'],
-        payment_method=payment_method_for_calc,  # Store the mapped payment method
-        razorpay_order_id=razorpay_order_id,
-        razorpay_payment_id=razorpay_payment_id,
-        razorpay_signature=razorpay_signature,
-        payment_status='paid',
-        status='confirmed'
-    )
-    
-    # Create order items
-    for cart_item in cart.items.all():
-        from orders.models import OrderItem
-        from products.models import ProductVariant
-        
-        # Get price from variant if available, otherwise from product
-        price = cart_item.product.price
-        if cart_item.variant and cart_item.variant.price:
-            price = cart_item.variant.price
-        
-        # Get vendor from product
-        vendor = cart_item.product.vendor if hasattr(cart_item.product, 'vendor') else None
-        
-        # Create order item with variant information
-        OrderItem.objects.create(
-            order=order,
-            product=cart_item.product,
-            variant=cart_item.variant,
-            vendor=vendor,
-            quantity=cart_item.quantity,
-            price=price,
-            variant_color=cart_item.variant.color.name if cart_item.variant else '',
-            variant_size=cart_item.variant.size if cart_item.variant else '',
-            variant_pattern=cart_item.variant.pattern if cart_item.variant else ''
+    # Payment has been taken: stock is floored at zero rather than refusing the order
+    try:
+        order = place_order(
+            request.user,
+            cart_lines(request.user),
+            shipping_address_id=address.id,
+            payment_method=payment_method_for_calc,  # Store the mapped payment method
+            coupon_id=coupon_id,
+            check_stock=False,
+            razorpay_order_id=razorpay_order_id,
+            razorpay_payment_id=razorpay_payment_id,
+            razorpay_signature=razorpay_signature,
+            payment_status='paid',
+            status='confirmed',
+            status_note='Order created and payment verified',
+            clear_cart=True
         )
-        
-        # Update variant stock if variant exists
-        if cart_item.variant:
-            cart_item.variant.stock_quantity -= cart_item.quantity
-            cart_item.variant.is_in_stock = cart_item.variant.stock_quantity > 0
-            cart_item.variant.save()
+    except CheckoutError as e:
+        return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
     
     # Fetch payment details to get token_id and customer_id if card was saved
     saved_card_info = None
@@ -909,22 +735,11 @@ def verify_razorpay_payment(request):
         logger.error(traceback.format_exc())
         pass
     
-    # Create initial status history
-    OrderStatusHistory.objects.create(
-        order=order,
-        status='confirmed',
-        notes='Order created and payment verified',
-        created_by=request.user
-    )
-    
-    # Clear cart
-    cart.items.all().delete()
-    
     # Return order details
     from .serializers import OrderDetailSerializer
     response_data = {
         'message': 'Order created successfully',
-        'order': OrderDetailSerializer(order, context={'request': request}).data
+        'order': OrderDetailSerializer(order_detail_queryset().get(pk=order.pk), context={'request': request}).data
     }
     
     # Include saved card info if card was saved during payment
@@ -993,45 +808,54 @@ def complete_payment(request):
                 'razorpay_signature': razorpay_signature
             }
             razorpay_client.utility.verify_payment_signature(params_dict)
-        except razorpay.SignatureVerificationError:
+        except razorpay.errors.SignatureVerificationError:
             return Response({'error': 'Payment signature verification failed'}, 
                            status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update order with payment details
-        order.razorpay_order_id = razorpay_order_id
-        order.razorpay_payment_id = razorpay_payment_id
-        order.razorpay_signature = razorpay_signature
-    
-    # Update order status
-    order.payment_method = payment_method
-    order.payment_status = 'paid'
-    order.status = 'confirmed'
-    order.save()
     
-    # Update variant stock (if not already done and variant exists)
-    if order.items.exists():
-        for order_item in order.items.all():
-            if order_item.variant:
-                if order_item.variant.stock_quantity >= order_item.quantity:
-                    order_item.variant.stock_quantity -= order_item.quantity
-                    order_item.variant.is_in_stock = order_item.variant.stock_quantity > 0
-                    order_item.variant.save()
-    
-    # Create status history
-    OrderStatusHistory.objects.create(
-        order=order,
-        status='confirmed',
-        notes='Payment completed successfully. Order confirmed.',
-        created_by=request.user
-    )
+    with transaction.atomic():
+        # Lock the order so concurrent completions cannot both take stock and count the coupon
+        order = Order.objects.select_for_update().select_related('coupon').get(pk=order.pk)
+        if order.payment_status != 'pending':
+            return Response({'error': 'Order payment is already completed or cannot be completed'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        
+        if payment_method in ['RAZORPAY', 'CARD', 'NET_BANKING', 'UPI']:
+            # Update order with payment details
+            order.razorpay_order_id = razorpay_order_id
+            order.razorpay_payment_id = razorpay_payment_id
+            order.razorpay_signature = razorpay_signature
+        
+        # Count the coupon unless placing the order already did (COD and cart checkouts)
+        if order.coupon_id and not order.coupon_redeemed:
+            redeem_coupon(order.coupon, request.user, order, strict=False)
+            order.coupon_redeemed = True
+        
+        # Update order status
+        order.payment_method = payment_method
+        order.payment_status = 'paid'
+        order.status = 'confirmed'
+        order.save()
+        
+        # Turn the stock held for this payment into a decrement (payment is
+        # already captured, so stock is floored at zero)
+        restock_variants(order, -1, floor=True)
+        release_holds(user=request.user)
+        
+        # Create status history
+        OrderStatusHistory.objects.create(
+            order=order,
+            status='confirmed',
+            notes='Payment completed successfully. Order confirmed.',
+            created_by=request.user
+        )
     
     # Return order details
     from .serializers import OrderDetailSerializer
     return Response({
         'message': 'Payment completed successfully. Order confirmed.',
-        'order': OrderDetailSerializer(order, context={'request': request}).data
+        'order': OrderDetailSerializer(order_detail_queryset().get(pk=order.pk), context={'request': request}).data
     }, status=status.HTTP_200_OK)
 
 
@@ -1060,56 +884,60 @@ def validate_coupon(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    try:
-        coupon = Coupon.objects.get(code=coupon_code)
-    except Coupon.DoesNotExist:
+    # Active coupons with this code, from the in-process table (no query)
+    candidates = coupon_table.lookup(coupon_code)
+    if not candidates:
         return Response(
             {'error': 'Invalid coupon code'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Check if coupon can be used by user
-    can_use, message = coupon.can_be_used_by_user(request.user)
-    if not can_use:
-        return Response(
-            {'error': message},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # If coupon is vendor-specific, validate cart items contain vendor's products
+    # A store-wide coupon wins; otherwise the code must match a vendor in the cart
+    coupon = candidates.get(None)
     vendor_products_amount = None
-    if coupon.vendor:
+    if coupon is None:
         if not cart_items:
             return Response(
                 {'error': 'Cart items are required for vendor-specific coupons'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Calculate total amount for vendor's products only
-        vendor_products_amount = Decimal('0.00')
-        vendor_product_found = False
-        
+        # Calculate the cart amount per vendor (one query for all items)
+        from products.models import Product
+        product_ids = set()
+        for item in cart_items:
+            try:
+                product_ids.add(int(item.get('product_id')))
+            except (TypeError, ValueError):
+                continue
+        product_vendors = dict(Product.objects.filter(pk__in=product_ids).values_list('id', 'vendor_id'))
+        vendor_amounts = {}
         for item in cart_items:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity', 1)
-            price = item.get('price', 0)
-            
             try:
-                from products.models import Product
-                product = Product.objects.get(id=product_id)
-                # Check if product belongs to coupon's vendor
-                if product.vendor and product.vendor.id == coupon.vendor.id:
-                    vendor_product_found = True
-                    item_total = Decimal(str(price)) * Decimal(str(quantity))
-                    vendor_products_amount += item_total
-            except Product.DoesNotExist:
+                vendor_id = product_vendors.get(int(item.get('product_id')))
+            except (TypeError, ValueError):
                 continue
+            if vendor_id in candidates:
+                item_total = Decimal(str(item.get('price', 0))) * Decimal(str(item.get('quantity', 1)))
+                vendor_amounts[vendor_id] = vendor_amounts.get(vendor_id, Decimal('0.00')) + item_total
         
-        if not vendor_product_found:
+        if not vendor_amounts:
+            coupon = candidates[min(candidates)]
             return Response(
                 {'error': f'This coupon applies only to products from {coupon.vendor.brand_name}. Please add products from this vendor to your cart.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        vendor_id = max(vendor_amounts, key=lambda pk: (vendor_amounts[pk], -pk))
+        coupon = candidates[vendor_id]
+        vendor_products_amount = vendor_amounts[vendor_id]
+    
+    # Check if coupon can be used by user
+    can_use, message = coupon.can_be_used_by_user(request.user)
+    if not can_use:
+        return Response(
+            {'error': message},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     # Calculate discount (on vendor products if vendor-specific, otherwise on total)
     discount_amount, discount_message = coupon.calculate_discount(order_amount, vendor_products_amount)
@@ -1136,6 +964,34 @@ def validate_coupon(request):
     }, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_best_coupons(request):
+    """Every coupon usable on the user's cart, ranked by discount (best first)"""
+    coupons_enabled = GlobalSettings.get_setting('coupons_enabled', True)
+    if isinstance(coupons_enabled, str):
+        coupons_enabled = coupons_enabled.lower() not in ['false', '0', 'no', '']
+    if not coupons_enabled:
+        return Response({'best': None, 'coupons': []}, status=status.HTTP_200_OK)
+    
+    coupons = [
+        {
+            'id': coupon.id,
+            'code': coupon.code,
+            'description': coupon.description,
+            'discount_type': coupon.discount_type,
+            'discount_value': str(coupon.discount_value),
+            'discount_amount': str(discount),
+            'vendor': coupon.vendor.brand_name if coupon.vendor else None,
+        }
+        for coupon, discount in rank_coupons(request.user, cart_lines(request.user))
+    ]
+    return Response({
+        'best': coupons[0] if coupons else None,
+        'coupons': coupons
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_payment_charges(request):
@@ -1163,11 +1019,9 @@ def get_payment_charges(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def checkout_with_cod(request):
     """Checkout with Cash on Delivery"""
-    from cart.models import Cart
-    from decimal import Decimal
-    
     # Check if COD is enabled
     cod_enabled = GlobalSettings.get_setting('cod_enabled', True)
     if isinstance(cod_enabled, str):
@@ -1189,126 +1043,25 @@ def checkout_with_cod(request):
     # Verify address
     address = get_object_or_404(Address, id=shipping_address_id, user=request.user)
     
-    # Get cart
     try:
-        cart = Cart.objects.get(user=request.user)
-    except Cart.DoesNotExist:
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    if not cart.items.exists():
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Calculate totals
-    subtotal = Decimal('0.00')
-    for cart_item in cart.items.all():
-        price = cart_item.product.price
-        if cart_item.variant and cart_item.variant.price:
-            price = cart_item.variant.price
-        subtotal += price * cart_item.quantity
-    
-    # Handle coupon if provided
-    coupon = None
-    coupon_discount = Decimal('0.00')
-    if coupon_id:
-        try:
-            coupon = Coupon.objects.get(id=coupon_id)
-            can_use, message = coupon.can_be_used_by_user(request.user)
-            if can_use:
-                # If coupon is vendor-specific, calculate discount only on vendor's products
-                if coupon.vendor:
-                    vendor_subtotal = Decimal('0.00')
-                    for cart_item in cart.items.all():
-                        if cart_item.product.vendor and cart_item.product.vendor.id == coupon.vendor.id:
-                            price = cart_item.product.price
-                            if cart_item.variant and cart_item.variant.price:
-                                price = cart_item.variant.price
-                            vendor_subtotal += price * cart_item.quantity
-                    
-                    if vendor_subtotal == 0:
-                        return Response({
-                            'error': f'This coupon applies only to products from {coupon.vendor.brand_name}. Please add products from this vendor to your cart.'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    discount_amount, _ = coupon.calculate_discount(subtotal, vendor_subtotal)
-                else:
-                    discount_amount, _ = coupon.calculate_discount(subtotal)
-                
-                coupon_discount = Decimal(str(discount_amount))
-                # Update coupon usage
-                coupon.used_count += 1
-                coupon.save()
-            else:
-                return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
-        except Coupon.DoesNotExist:
-            return Response({'error': 'Invalid coupon'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Calculate totals with platform fee (after coupon discount)
-    subtotal_after_discount = subtotal - coupon_discount
-    totals = calculate_order_totals(subtotal_after_discount, 'COD')
-    
-    # Create order
-    order = Order.objects.create(
-        user=request.user,
-        shipping_address=address,
-        subtotal=subtotal,
-        coupon=coupon,
-        coupon_discount=coupon_discount,
-        shipping_cost=totals['shipping_cost'],
-        platform_fee=totals['platform_fee'],
-        tax_amount=totals['tax_amount'],
-        total_amount=totals['total_amount'],
-        payment_method='COD',
-        payment_status='pending',
-        status='confirmed',  # COD orders are confirmed immediately, payment is pending
-        order_notes=order_notes
-    )
-    
-    # Create order items
-    for cart_item in cart.items.all():
-        from orders.models import OrderItem
-        from products.models import ProductVariant
-        
-        # Get price from variant if available, otherwise from product
-        price = cart_item.product.price
-        if cart_item.variant and cart_item.variant.price:
-            price = cart_item.variant.price
-        
-        # Get vendor from product
-        vendor = cart_item.product.vendor if hasattr(cart_item.product, 'vendor') else None
-        
-        # Create order item with variant information
-        OrderItem.objects.create(
-            order=order,
-            product=cart_item.product,
-            variant=cart_item.variant,
-            vendor=vendor,
-            quantity=cart_item.quantity,
-            price=price,
-            variant_color=cart_item.variant.color.name if cart_item.variant else '',
-            variant_size=cart_item.variant.size if cart_item.variant else '',
-            variant_pattern=cart_item.variant.pattern if cart_item.variant else ''
+        order = place_order(
+            request.user,
+            cart_lines(request.user),
+            shipping_address_id=address.id,
+            payment_method='COD',
+            coupon_id=coupon_id,
+            payment_status='pending',
+            status='confirmed',  # COD orders are confirmed immediately, payment is pending
+            order_notes=order_notes,
+            status_note='Order confirmed with COD payment',
+            clear_cart=True
         )
-        
-        # Update variant stock if variant exists
-        if cart_item.variant:
-            cart_item.variant.stock_quantity -= cart_item.quantity
-            cart_item.variant.is_in_stock = cart_item.variant.stock_quantity > 0
-            cart_item.variant.save()
-    
-    # Create initial status history
-    OrderStatusHistory.objects.create(
-        order=order,
-        status='confirmed',
-        notes='Order confirmed with COD payment',
-        created_by=request.user
-    )
-    
-    # Clear cart
-    cart.items.all().delete()
+    except CheckoutError as e:
+        return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
     
     # Return order details
     from .serializers import OrderDetailSerializer
     return Response({
         'message': 'Order created successfully',
-        'order': OrderDetailSerializer(order, context={'request': request}).data
+        'order': OrderDetailSerializer(order_detail_queryset().get(pk=order.pk), context={'request': request}).data
     }, status=status.HTTP_201_CREATED)
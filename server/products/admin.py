@@ -5,7 +5,7 @@ from django.utils.safestring import mark_safe
 from .models import (
     Category, Subcategory, Color, Material, Product, ProductImage, ProductVariant,
     ProductReview, ProductRecommendation, ProductSpecification,
-    ProductFeature, ProductOffer 
+    ProductFeature, ProductOffer, get_catalog_stats
 )
 
 
@@ -16,9 +16,11 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     ordering = ['sort_order', 'name']
+    list_select_related = ['stats']
     
     def product_count(self, obj):
-        return obj.products.count()
+        stats = get_catalog_stats(obj)
+        return stats.product_count if stats else 0
     product_count.short_description = 'Products'
 
 
@@ -29,9 +31,11 @@ class SubcategoryAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description', 'category__name']
     prepopulated_fields = {'slug': ('name',)}
     ordering = ['category', 'sort_order', 'name']
+    list_select_related = ['category', 'stats']
     
     def product_count(self, obj):
-        return obj.products.count()
+        stats = get_catalog_stats(obj)
+        return stats.product_count if stats else 0
     product_count.short_description = 'Products'
 
 
@@ -62,9 +66,11 @@ class MaterialAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
     ordering = ['name']
+    list_select_related = ['stats']
     
     def product_count(self, obj):
-        return obj.products.count()
+        stats = get_catalog_stats(obj)
+        return stats.product_count if stats else 0
     product_count.short_description = 'Products'
 
 
@@ -110,7 +116,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     search_fields = ['title', 'short_description', 'brand', 'material']
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ['discount_percentage', 'average_rating', 'review_count', 'created_at', 'updated_at']
+    readonly_fields = ['discount_percentage', 'average_rating', 'review_count', 'rating_histogram', 'created_at', 'updated_at']
     ordering = ['-created_at']
     
     fieldsets = (
@@ -0,0 +1,214 @@
+"""
+Versioned cache helpers.
+
+Cached entries embed a namespace version in their key. Bumping the version
+(from model signals) makes every older entry unreachable without having to
+know or delete the individual keys. Bumps run once the writing transaction
+commits (one per namespace however many rows it wrote), so a concurrent read
+cannot cache uncommitted data under the new version. Versions live in the
+cache when it is shared between workers (Redis) and in the database
+(CacheNamespace) otherwise, so every worker sees a bump.
+
+``cache_response`` applies this to whole API responses: entries live until a
+namespace they depend on is bumped, at most ``CACHE_RESPONSE_TIMEOUT`` seconds.
+``conditional_on`` derives HTTP validators (ETag / Last-Modified) from the same
+shared versions and bump times, so every worker answers a revalidation alike
+without the payload being built.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.views.decorators.http import condition
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def _changed_key(namespace):
+    return f'{namespace}:changed'
+
+
+def _seed_version():
+    # A timestamp, so a lost counter never reuses an old version
+    return int(time.time() * 1000)
+
+
+def get_cache_state(*namespaces):
+    """
+    ``{namespace: (version, changed_at)}`` for the namespaces in one cache or
+    database round trip; ``changed_at`` is the POSIX time of the last bump
+    (or of first use), the same in every worker.
+    """
+    if settings.CACHE_IS_SHARED:
+        keys = [key for namespace in namespaces for key in (_version_key(namespace), _changed_key(namespace))]
+        found = cache.get_many(keys)
+        for key in set(keys) - found.keys():
+            cache.add(key, _seed_version() if key.endswith(':version') else time.time(), None)
+            found[key] = cache.get(key)
+        return {
+            namespace: (found[_version_key(namespace)], found[_changed_key(namespace)])
+            for namespace in namespaces
+        }
+
+    from .models import CacheNamespace
+
+    def read(names):
+        return {
+            name: (version, changed_at.timestamp())
+            for name, version, changed_at in CacheNamespace.objects.filter(name__in=names).values_list(
+                'name', 'version', 'changed_at'
+            )
+        }
+
+    state = read(namespaces)
+    missing = [namespace for namespace in namespaces if namespace not in state]
+    if missing:
+        CacheNamespace.objects.bulk_create(
+            [CacheNamespace(name=namespace, version=_seed_version()) for namespace in missing],
+            ignore_conflicts=True
+        )
+        state.update(read(missing))
+    return state
+
+
+def get_cache_versions(*namespaces):
+    """``{namespace: version}`` for the namespaces, in one round trip"""
+    return {namespace: version for namespace, (version, _) in get_cache_state(*namespaces).items()}
+
+
+def get_cache_version(namespace):
+    """Get the current version for a cache namespace"""
+    return get_cache_versions(namespace)[namespace]
+
+
+def _bump(namespace):
+    if settings.CACHE_IS_SHARED:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _seed_version(), None)
+        cache.set(_changed_key(namespace), time.time(), None)
+        return
+
+    from django.db.models import F
+    from django.utils import timezone
+    from .models import CacheNamespace
+
+    bumped = CacheNamespace.objects.filter(name=namespace)
+    if not bumped.update(version=F('version') + 1, changed_at=timezone.now()):
+        _, created = CacheNamespace.objects.get_or_create(name=namespace, defaults={'version': _seed_version()})
+        if not created:
+            bumped.update(version=F('version') + 1, changed_at=timezone.now())
+
+
+def bump_cache_version(namespace):
+    """
+    Invalidate every entry cached under a namespace once the current
+    transaction commits; bulk writes bump each namespace only once.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _bump(namespace)
+        return
+    queue, pending = getattr(connection, '_pending_cache_bumps', (None, None))
+    if queue is not connection.run_on_commit:
+        # New transaction, or a savepoint rollback dropped callbacks: register afresh
+        pending = set()
+        connection._pending_cache_bumps = (connection.run_on_commit, pending)
+    if namespace not in pending:
+        pending.add(namespace)
+        transaction.on_commit(lambda: _bump(namespace))
+
+
+def namespace_validators(*namespaces, extra=()):
+    """
+    ``(etag, last_modified)`` of the namespaces: a weak ETag built from their
+    versions (and any extra parts) and their latest change as a datetime.
+    """
+    state = get_cache_state(*namespaces)
+    parts = [f'{namespace}={state[namespace][0]}' for namespace in namespaces]
+    parts.extend(str(part) for part in extra)
+    etag = 'W/"%s"' % hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    last_modified = datetime.fromtimestamp(max(changed_at for _, changed_at in state.values()), tz=dt_timezone.utc)
+    return etag, last_modified
+
+
+def _versioned_key(namespace, version, parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'{namespace}:{version}:{digest}'
+
+
+def make_cache_key(namespace, *parts):
+    """Build a versioned cache key from arbitrary (hashable to str) parts"""
+    return _versioned_key(namespace, get_cache_version(namespace), parts)
+
+
+def make_cache_keys(*keys):
+    """``make_cache_key`` for several ``(namespace, *parts)`` tuples, reading the versions in one round trip"""
+    versions = get_cache_versions(*{namespace for namespace, *_ in keys})
+    return [_versioned_key(namespace, versions[namespace], parts) for namespace, *parts in keys]
+
+
+def cache_response(*namespaces, timeout=None):
+    """
+    Cache the data of successful GET responses of a DRF view.
+
+    The key covers the full URL (host and query string) and the current version
+    of every namespace the view depends on. Entries are kept for ``timeout``
+    seconds (default and upper bound ``CACHE_RESPONSE_TIMEOUT``) so keys of old
+    versions and one-off query strings expire; a view can shorten the lifetime
+    of one response by setting ``response.cache_timeout``.
+
+    Use directly under ``@api_view`` or with ``method_decorator`` on class views.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            from rest_framework.response import Response
+
+            versions = get_cache_versions('response', *namespaces)
+            key = _versioned_key('response', versions.pop('response'), [
+                view_func.__qualname__, request.build_absolute_uri(),
+                *(f'{namespace}={version}' for namespace, version in sorted(versions.items())),
+            ])
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and getattr(response, 'data', None) is not None:
+                limit = settings.CACHE_RESPONSE_TIMEOUT
+                cache.set(key, response.data, min(getattr(response, 'cache_timeout', None) or timeout or limit, limit))
+            return response
+        return wrapped
+    return decorator
+
+
+def conditional_on(*namespaces):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` with 304 while none of the
+    namespaces changed, without calling the view. Use like ``cache_response``.
+    """
+    def validators(request):
+        # Read once per request; Django asks for the ETag and Last-Modified separately
+        if getattr(request, '_namespace_validators', None) is None:
+            request._namespace_validators = namespace_validators(*namespaces)
+        return request._namespace_validators
+
+    def etag(request, *args, **kwargs):
+        return validators(request)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
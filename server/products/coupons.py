@@ -0,0 +1,83 @@
+"""
+In-process lookup table of active coupons.
+
+Coupon validation runs while the shopper types a code, so active coupons are
+kept in memory keyed by code and vendor and a lookup needs no query. The table
+is rebuilt when a coupon or vendor changes (products/signals.py bumps a cache
+version shared by all workers, checked at most every ``VERSION_CHECK_INTERVAL``
+seconds) or a limited coupon is redeemed, and in any case once it is
+``MAX_AGE`` seconds old, so a missed invalidation or a coupon passing its
+validity window is never served for long. Usage counts in the table may lag
+behind; checkout enforces the limits with conditional updates
+(orders/checkout.py).
+"""
+import threading
+import time
+
+from .cache import get_cache_version, bump_cache_version
+
+CACHE_NAMESPACE = 'coupons'
+VERSION_CHECK_INTERVAL = 30
+MAX_AGE = 300
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+class CouponTable:
+    """code -> {vendor_id (None for store-wide coupons): Coupon}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._coupons = {}
+        self._built = False
+        self._version = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    def build(self):
+        """(Re)load active, unexpired coupons from the database"""
+        from django.utils import timezone
+        from .models import Coupon
+
+        version = get_cache_version(CACHE_NAMESPACE)
+        coupons = {}
+        for coupon in Coupon.objects.filter(
+            is_active=True, valid_until__gt=timezone.now()
+        ).select_related('vendor').order_by('pk'):
+            coupons.setdefault(normalize_code(coupon.code), {}).setdefault(coupon.vendor_id, coupon)
+        with self._lock:
+            self._coupons = coupons
+            self._built = True
+            self._version = version
+            self._checked_at = self._built_at = time.monotonic()
+
+    def ensure_current(self):
+        """Build on first use; rebuild when a coupon changed in any process or the table is too old"""
+        now = time.monotonic()
+        if self._built and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        if (not self._built or now - self._built_at >= MAX_AGE
+                or get_cache_version(CACHE_NAMESPACE) != self._version):
+            self.build()
+        else:
+            self._checked_at = now
+
+    def lookup(self, code):
+        """``{vendor_id: Coupon}`` of the active coupons with this code"""
+        self.ensure_current()
+        return dict(self._coupons.get(normalize_code(code), {}))
+
+    def active(self):
+        """Every coupon in the table"""
+        self.ensure_current()
+        return [coupon for by_vendor in self._coupons.values() for coupon in by_vendor.values()]
+
+    def invalidate(self):
+        """Make every process reload the table on its next lookup"""
+        bump_cache_version(CACHE_NAMESPACE)
+        self._built = False
+
+
+coupon_table = CouponTable()
@@ -1,6 +1,9 @@
 import django_filters
-from django.db.models import Q, Avg, Count
-from .models import Product, Category, Subcategory, Color, Material, Discount
+from django.core.cache import cache
+from rest_framework import filters
+from django.db.models import Q, Avg, Count, Min, Max, F, FilteredRelation
+from django.db.models.functions import Coalesce
+from .models import Product, ProductVariant, Category, Subcategory, Color, Material, Discount
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -49,20 +52,25 @@ class ProductFilter(django_filters.FilterSet):
         return queryset
     
     def filter_search(self, queryset, name, value):
-        """Search across multiple fields"""
+        """Ranked full-text search; annotates ``search_rank``"""
         if value:
-            return queryset.filter(
-                Q(title__icontains=value) |
-                Q(short_description__icontains=value) |
-                Q(long_description__icontains=value) |
-                Q(category__name__icontains=value) |
-                Q(subcategory__name__icontains=value) |
-                Q(brand__icontains=value) |
-                Q(material__icontains=value)
-            ).distinct()
+            from .search import apply_search
+            return apply_search(queryset, value)
         return queryset
 
 
+class ProductSearchFilter(filters.BaseFilterBackend):
+    """DRF filter backend for the ``search`` param using the ranked full-text index"""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        from .search import apply_search
+        return apply_search(queryset, query)
+
+
 class ProductSortFilter:
     """Product sorting options"""
     
@@ -75,6 +83,16 @@ class ProductSortFilter:
         'popularity': '-review_count',
     }
     
+    # Variant-grain sorting: prices use the variant price, falling back to the product price
+    VARIANT_SORT_OPTIONS = {
+        'relevance': '-created_at',
+        'price_low_to_high': 'effective_price',
+        'price_high_to_low': '-effective_price',
+        'newest': '-created_at',
+        'rating': '-average_rating',
+        'popularity': '-review_count',
+    }
+
     @classmethod
     def apply_sorting(cls, queryset, sort_option):
         """Apply sorting to queryset"""
@@ -82,54 +100,226 @@ class ProductSortFilter:
             return queryset.order_by(cls.SORT_OPTIONS[sort_option])
         return queryset.order_by('-created_at')  # Default sorting
 
+    @staticmethod
+    def get_search_query(query_params):
+        """The full-text query from either the ``q`` or ``search`` param"""
+        return (query_params.get('q') or query_params.get('search') or '').strip()
+
+    @classmethod
+    def apply_relevance(cls, queryset, sort_option):
+        """Order searched results by rank when sorting by relevance"""
+        if sort_option in (None, 'relevance') and 'search_rank' in queryset.query.annotations:
+            return queryset.order_by('-search_rank', '-created_at')
+        return queryset
+
+    @classmethod
+    def apply_affinity(cls, queryset, affinity, sort_option):
+        """Order by a personalization score first, keeping the sort option within equal scores"""
+        return queryset.annotate(affinity_score=affinity).order_by(
+            '-affinity_score', cls.SORT_OPTIONS.get(sort_option, '-created_at')
+        )
+
+    @classmethod
+    def expand_variant_rows(cls, queryset, sort_option, affinity=None, search_query=None):
+        """
+        Expand filtered products into one row per active variant (or one row for a
+        product without active variants), sorted in the database.
+
+        Returns a values queryset of {'id', 'variant_id', <sort columns>} that can be paginated directly.
+        """
+        rows = Product.objects.filter(
+            pk__in=queryset.order_by().values('pk')
+        ).annotate(
+            active_variant=FilteredRelation('variants', condition=Q(variants__is_active=True)),
+        ).annotate(
+            variant_id=F('active_variant__id'),
+            effective_price=Coalesce('active_variant__price', 'price'),
+        )
+
+        ordering = []
+        if search_query and sort_option in (None, 'relevance'):
+            from .search import apply_search
+            rows = apply_search(rows, search_query)
+            if 'search_rank' in rows.query.annotations:
+                ordering.append('-search_rank')
+        if affinity is not None:
+            rows = rows.annotate(affinity_score=affinity)
+            ordering.append('-affinity_score')
+        ordering += [cls.VARIANT_SORT_OPTIONS.get(sort_option, '-created_at'), '-id', 'variant_id']
+
+        # Sort columns are selected too so keyset pagination can read the row position
+        sort_columns = [field.lstrip('-') for field in ordering if field.lstrip('-') not in ('id', 'variant_id')]
+        return rows.order_by(*ordering).values('id', 'variant_id', *sort_columns)
+
 
 class ProductAggregationFilter:
-    """Get filter options for frontend"""
+    """Get filter options (facets with counts) for frontend"""
+    
+    CACHE_NAMESPACE = 'filter_options'
+    CACHE_TIMEOUT = 60 * 60
+    PRICE_HISTOGRAM_BUCKETS = 10
+    
+    # Query params that do not change the filtered product set
+    IGNORED_PARAMS = {'page', 'page_size', 'sort', 'ordering', 'expand_variants', 'cursor', 'pagination'}
     
     @classmethod
-    def get_filter_options(cls, queryset):
-        """Get available filter options - all categories/subcategories, but filtered colors/materials/brands"""
-        # Get ALL active categories (not filtered by products)
-        categories = Category.objects.filter(
-            is_active=True
-        ).values('id', 'name', 'slug').order_by('name')
+    def get_filter_signature(cls, filter_params):
+        """Normalize filter query params into a stable signature"""
+        if not filter_params:
+            return ''
+        if hasattr(filter_params, 'lists'):
+            items = filter_params.lists()
+        else:
+            items = ((key, value if isinstance(value, (list, tuple)) else [value]) for key, value in filter_params.items())
         
-        # Get ALL active subcategories (not filtered by products)
-        subcategories = Subcategory.objects.filter(
-            is_active=True
-        ).values('id', 'name', 'slug', 'category_id').order_by('category__name', 'name')
+        normalized = []
+        for key, values in items:
+            if key in cls.IGNORED_PARAMS:
+                continue
+            values = sorted({str(value).strip().lower() for value in values if str(value).strip()})
+            if values:
+                normalized.append(f"{key}={','.join(values)}")
+        return '&'.join(sorted(normalized))
+    
+    @classmethod
+    def get_filter_options(cls, queryset, filter_params=None):
+        """Get filter options for the filtered queryset, cached per normalized filter signature"""
+        from .cache import make_cache_key
         
-        # Get available colors (only from products that exist)
-        colors = Color.objects.filter(
-            # variants__product__in=queryset,
-            # variants__is_active=True,
-            is_active=True
-        ).distinct().values('id', 'name', 'hex_code').order_by('name')
+        cache_key = make_cache_key(cls.CACHE_NAMESPACE, 'facets', cls.get_filter_signature(filter_params))
+        options = cache.get(cache_key)
+        if options is None:
+            options = {**cls._get_static_options(), **cls._get_facets(queryset)}
+            cache.set(cache_key, options, cls.CACHE_TIMEOUT)
+        return options
+    
+    @classmethod
+    def _get_static_options(cls):
+        """Categories, subcategories and discount options do not depend on the filter state"""
+        from .cache import make_cache_key
         
-        # Get available materials (only from products that exist)
-        materials = Material.objects.filter(
-            # products__in=queryset,
-            is_active=True
-        ).distinct().values('id', 'name', 'description')
+        cache_key = make_cache_key(cls.CACHE_NAMESPACE, 'static')
+        static = cache.get(cache_key)
+        if static is None:
+            # Get ALL active categories (not filtered by products)
+            categories = Category.objects.filter(
+                is_active=True
+            ).values('id', 'name', 'slug').order_by('name')
+            
+            # Get ALL active subcategories (not filtered by products)
+            subcategories = Subcategory.objects.filter(
+                is_active=True
+            ).values('id', 'name', 'slug', 'category_id').order_by('category__name', 'name')
+            
+            # Get discount options (from Discount model)
+            discounts = Discount.objects.filter(is_active=True).values('percentage', 'label').order_by('percentage')
+            
+            static = {
+                'categories': list(categories),
+                'subcategories': list(subcategories),
+                'discounts': list(discounts),
+            }
+            cache.set(cache_key, static, cls.CACHE_TIMEOUT)
+        return static
+    
+    @classmethod
+    def _get_facets(cls, queryset):
+        """Compute colour, material, brand, discount and price facets with counts"""
+        # Re-select by primary key so joins/distinct used for filtering cannot inflate counts
+        products = Product.objects.filter(pk__in=queryset.order_by().values('pk'))
+        discount_options = cls._get_static_options()['discounts']
         
-        # Get price range (only from products that exist)
-        from django.db.models import Min, Max
-        price_range = queryset.aggregate(
-            min_price=Min('price'),
-            max_price=Max('price')
-        )
+        # 1. Price range, total and "at least N% off" bucket counts in one aggregate
+        aggregates = {
+            'min_price': Min('price'),
+            'max_price': Max('price'),
+            'total': Count('id'),
+        }
+        for option in discount_options:
+            aggregates[f"discount_{option['percentage']}"] = Count(
+                'id', filter=Q(discount_percentage__gte=option['percentage'])
+            )
+        summary = products.aggregate(**aggregates)
+        
+        discounts = [
+            {**option, 'count': summary[f"discount_{option['percentage']}"]}
+            for option in discount_options
+        ]
+        
+        # 2. Price histogram with equal-width buckets between min and max price
+        price_histogram = cls._get_price_histogram(products, summary['min_price'], summary['max_price'])
+        
+        # 3. Brand and material counts from a single GROUP BY
+        brand_counts = {}
+        material_counts = {}
+        grouped = products.values(
+            'brand', 'material_id', 'material__name', 'material__description', 'material__is_active'
+        ).annotate(count=Count('id'))
+        for row in grouped:
+            if row['brand']:
+                brand_counts[row['brand']] = brand_counts.get(row['brand'], 0) + row['count']
+            if row['material_id'] and row['material__is_active']:
+                material = material_counts.setdefault(row['material_id'], {
+                    'id': row['material_id'],
+                    'name': row['material__name'],
+                    'description': row['material__description'],
+                    'count': 0,
+                })
+                material['count'] += row['count']
         
-        # Get available brands (only from products that exist)
-        brands = queryset.values_list('brand', flat=True).distinct()
-        # Get discount options (from Discount model)
-        discounts = Discount.objects.filter(is_active=True).values('percentage', 'label').order_by('percentage')
+        # 4. Colour counts (distinct products per colour) from active variants
+        colors = ProductVariant.objects.filter(
+            product__in=products,
+            is_active=True,
+            color__is_active=True
+        ).values('color_id', 'color__name', 'color__hex_code').annotate(
+            count=Count('product_id', distinct=True)
+        ).order_by('color__name')
         
         return {
-            'categories': list(categories),
-            'subcategories': list(subcategories),
-            'colors': list(colors),
-            'materials': list(materials),
-            'brands': list(brands),
-            'price_range': price_range,
-            'discounts': list(discounts),
+            'colors': [
+                {'id': row['color_id'], 'name': row['color__name'], 'hex_code': row['color__hex_code'], 'count': row['count']}
+                for row in colors
+            ],
+            'materials': sorted(material_counts.values(), key=lambda material: material['name']),
+            'brands': [
+                {'name': brand, 'count': count}
+                for brand, count in sorted(brand_counts.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'price_range': {
+                'min_price': summary['min_price'],
+                'max_price': summary['max_price'],
+            },
+            'price_histogram': price_histogram,
+            'discounts': discounts,
+            'total_count': summary['total'],
         }
+    
+    @classmethod
+    def _get_price_histogram(cls, products, min_price, max_price):
+        """Count products per equal-width price bucket using conditional aggregates"""
+        if min_price is None or max_price is None:
+            return []
+        if min_price == max_price:
+            return [{'min_price': min_price, 'max_price': max_price, 'count': products.count()}]
+        
+        bucket_count = cls.PRICE_HISTOGRAM_BUCKETS
+        width = (max_price - min_price) / bucket_count
+        bounds = [min_price + width * index for index in range(bucket_count)] + [max_price]
+        aggregates = {}
+        for index in range(bucket_count):
+            price_filter = Q(price__gte=bounds[index])
+            # The last bucket is closed so the most expensive product is counted
+            if index < bucket_count - 1:
+                price_filter &= Q(price__lt=bounds[index + 1])
+            aggregates[f'bucket_{index}'] = Count('id', filter=price_filter)
+        counts = products.aggregate(**aggregates)
+        
+        return [
+            {
+                'min_price': round(bounds[index], 2),
+                'max_price': round(bounds[index + 1], 2),
+                'count': counts[f'bucket_{index}'],
+            }
+            for index in range(bucket_count)
+        ]
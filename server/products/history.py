@@ -0,0 +1,308 @@
+"""
+Write-behind buffer for browsing-history tracking.
+
+Product views are recorded in an in-process buffer that coalesces repeated
+views of the same product by the same user. A daemon thread flushes it every
+``BROWSING_HISTORY_FLUSH_INTERVAL`` seconds (or as soon as
+``BROWSING_HISTORY_MAX_PENDING`` pairs are waiting) with bulk upserts that add
+to ``view_count`` in the database, so concurrent views never lose increments
+and the product page does not pay for a write.
+
+Set ``BROWSING_HISTORY_WRITE_BEHIND = False`` to write every view immediately
+(for example on serverless deployments where background threads do not run).
+
+``prune_history`` enforces the retention settings (maximum age and maximum rows
+per user) in small chunks; see the prune_browsing_history command.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction, close_old_connections
+from django.db.models import F, Case, When, Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+UPSERT_BATCH_SIZE = 100
+
+
+def _upsert_sql(rows):
+    """INSERT ... ON CONFLICT statement adding to existing rows (PostgreSQL and SQLite)"""
+    from .models import BrowsingHistory
+
+    quote = connection.ops.quote_name
+    table = quote(BrowsingHistory._meta.db_table)
+    columns = ['user_id', 'product_id', 'category_id', 'subcategory_id', 'view_count', 'viewed_at', 'last_viewed']
+    values = ', '.join(['(%s)' % ', '.join(['%s'] * len(columns))] * rows)
+    return (
+        f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) VALUES {values} "
+        f"ON CONFLICT ({quote('user_id')}, {quote('product_id')}) DO UPDATE SET "
+        f"{quote('view_count')} = {table}.{quote('view_count')} + excluded.{quote('view_count')}, "
+        f"{quote('last_viewed')} = CASE WHEN excluded.{quote('last_viewed')} > {table}.{quote('last_viewed')} "
+        f"THEN excluded.{quote('last_viewed')} ELSE {table}.{quote('last_viewed')} END, "
+        f"{quote('category_id')} = COALESCE({table}.{quote('category_id')}, excluded.{quote('category_id')}), "
+        f"{quote('subcategory_id')} = COALESCE({table}.{quote('subcategory_id')}, excluded.{quote('subcategory_id')})"
+    )
+
+
+def _upsert_each(entries):
+    """Portable fallback: atomic increment, insert when the row does not exist yet"""
+    from django.db import IntegrityError
+    from .models import BrowsingHistory
+
+    for user_id, product_id, category_id, subcategory_id, count, last_viewed in entries:
+        rows = BrowsingHistory.objects.filter(user_id=user_id, product_id=product_id)
+        update = {
+            'view_count': F('view_count') + count,
+            'last_viewed': Case(When(last_viewed__lt=last_viewed, then=last_viewed), default=F('last_viewed')),
+        }
+        if rows.update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                BrowsingHistory.objects.create(
+                    user_id=user_id, product_id=product_id, category_id=category_id,
+                    subcategory_id=subcategory_id, view_count=count,
+                )
+        except IntegrityError:
+            rows.update(**update)
+
+
+def write_views(entries):
+    """
+    Add ``(user_id, product_id, category_id, subcategory_id, count, last_viewed)``
+    views to BrowsingHistory. Views of deleted users or products are dropped.
+    """
+    from django.contrib.auth import get_user_model
+    from .models import Product
+    from . import personalization
+
+    products = {
+        pk: (category_id, brand) for pk, category_id, brand in Product.objects.filter(
+            pk__in={entry[1] for entry in entries}
+        ).values_list('pk', 'category_id', 'brand')
+    }
+    user_ids = set(get_user_model().objects.filter(
+        pk__in={entry[0] for entry in entries}
+    ).values_list('pk', flat=True))
+    entries = [entry for entry in entries if entry[0] in user_ids and entry[1] in products]
+    if not entries:
+        return 0
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        adapt = connection.ops.adapt_datetimefield_value
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(entries), UPSERT_BATCH_SIZE):
+                batch = entries[start:start + UPSERT_BATCH_SIZE]
+                params = []
+                for user_id, product_id, category_id, subcategory_id, count, last_viewed in batch:
+                    viewed_at = adapt(last_viewed)
+                    params.extend([user_id, product_id, category_id, subcategory_id, count, viewed_at, viewed_at])
+                cursor.execute(_upsert_sql(len(batch)), params)
+    else:
+        _upsert_each(entries)
+
+    # Raw upserts send no post_save; fold the views into cached affinities here, once per user
+    weights = {}
+    for user_id, product_id, _, _, count, _ in entries:
+        weights.setdefault(user_id, []).append((*products[product_id], personalization.VIEW_WEIGHT * count))
+    personalization.add_affinities(weights)
+    return len(entries)
+
+
+class ViewBuffer:
+    """Pending (user, product) views of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}          # (user_id, product_id) -> [category_id, subcategory_id, count, last_viewed]
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'BROWSING_HISTORY_FLUSH_INTERVAL', 5)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'BROWSING_HISTORY_MAX_PENDING', 1000)
+
+    def record(self, user_id, product_id, category_id=None, subcategory_id=None):
+        """Count one view of a product by a user"""
+        now = timezone.now()
+        if not getattr(settings, 'BROWSING_HISTORY_WRITE_BEHIND', True):
+            try:
+                write_views([(user_id, product_id, category_id, subcategory_id, 1, now)])
+            except Exception:
+                # Tracking must never break the page that records it
+                logger.exception('Failed to record browsing history')
+            return
+        with self._lock:
+            entry = self._pending.get((user_id, product_id))
+            if entry is None:
+                self._pending[(user_id, product_id)] = [category_id, subcategory_id, 1, now]
+            else:
+                entry[2] += 1
+                entry[3] = now
+            full = len(self._pending) >= self.max_pending
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+
+    def _take(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {key: self._pending.pop(key) for key in list(self._pending) if key[0] == user_id}
+        return [(key[0], key[1], *entry) for key, entry in pending.items()]
+
+    def _requeue(self, entries):
+        """Put entries back after a failed flush (bounded so a broken database cannot grow it forever)"""
+        with self._lock:
+            for user_id, product_id, category_id, subcategory_id, count, last_viewed in entries:
+                if len(self._pending) >= self.max_pending * 10:
+                    logger.warning('Browsing history buffer full, dropping %d view(s)', len(entries))
+                    return
+                entry = self._pending.setdefault((user_id, product_id), [category_id, subcategory_id, 0, last_viewed])
+                entry[2] += count
+                entry[3] = max(entry[3], last_viewed)
+
+    def flush(self, user_id=None):
+        """Write pending views (of one user, or all) to the database"""
+        entries = self._take(user_id)
+        if not entries:
+            return 0
+        try:
+            return write_views(entries)
+        except Exception:
+            self._requeue(entries)
+            raise
+
+    def discard(self, user_id, product_id=None):
+        """Forget pending views, e.g. when the user clears their history"""
+        with self._lock:
+            for key in list(self._pending):
+                if key[0] == user_id and (product_id is None or key[1] == product_id):
+                    del self._pending[key]
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            if self._worker is None:
+                atexit.register(self._flush_at_exit)
+            self._worker = threading.Thread(target=self._run, name='browsing-history-flush', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush browsing history')
+            finally:
+                close_old_connections()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush browsing history at exit')
+
+
+view_buffer = ViewBuffer()
+
+
+RETENTION_SETTING = 'browsing_history_retention'
+
+
+def table_stats():
+    """Row count and (on PostgreSQL) on-disk size of the browsing history table"""
+    from .models import BrowsingHistory
+
+    table = BrowsingHistory._meta.db_table
+    if connection.vendor == 'postgresql':
+        # Planner estimate instead of a full COUNT(*) scan
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE relname = %s",
+                [table],
+            )
+            row = cursor.fetchone()
+        if row:
+            return {'rows': max(int(row[0]), 0), 'bytes': int(row[1])}
+    return {'rows': BrowsingHistory.objects.count(), 'bytes': None}
+
+
+def _delete_chunks(get_chunk, pause):
+    """
+    Delete the ``(pk, user_id)`` rows returned by ``get_chunk()`` until it is
+    empty, one short transaction each, and drop the cached affinity of their
+    users once per chunk
+    """
+    from .models import BrowsingHistory
+    from . import personalization
+
+    total = 0
+    while True:
+        rows = list(get_chunk())
+        if not rows:
+            return total
+        with transaction.atomic():
+            removed, _ = BrowsingHistory.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+        for user_id in {user_id for _, user_id in rows}:
+            personalization.invalidate_user_affinity(user_id)
+        total += removed
+        if pause:
+            time.sleep(pause)
+
+
+def prune_history(max_age_days=None, max_rows_per_user=None, chunk_size=1000, pause=0.0):
+    """
+    Delete history older than ``max_age_days`` and all but the newest
+    ``max_rows_per_user`` rows of every user. Returns the run's statistics.
+    """
+    from .models import BrowsingHistory
+
+    before = table_stats()
+    removed_by_age = removed_by_cap = 0
+
+    if max_age_days:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        expired = BrowsingHistory.objects.filter(last_viewed__lt=cutoff)
+        removed_by_age = _delete_chunks(
+            lambda: expired.order_by().values_list('pk', 'user_id')[:chunk_size], pause
+        )
+
+    if max_rows_per_user:
+        heavy_users = BrowsingHistory.objects.order_by().values('user_id').annotate(
+            rows=Count('id')
+        ).filter(rows__gt=max_rows_per_user).values_list('user_id', flat=True)
+        for user_id in list(heavy_users):
+            oldest = BrowsingHistory.objects.filter(user_id=user_id).order_by('-last_viewed', '-pk')
+            removed_by_cap += _delete_chunks(
+                lambda: oldest.values_list('pk', 'user_id')[max_rows_per_user:max_rows_per_user + chunk_size], pause
+            )
+
+    after = table_stats()
+    stats = {
+        'ran_at': timezone.now().isoformat(),
+        'rows_before': before['rows'],
+        'rows_after': after['rows'],
+        'bytes_before': before['bytes'],
+        'bytes_after': after['bytes'],
+        'removed_by_age': removed_by_age,
+        'removed_by_cap': removed_by_cap,
+        'removed': removed_by_age + removed_by_cap,
+    }
+    logger.info('Browsing history retention: %s', stats)
+    return stats
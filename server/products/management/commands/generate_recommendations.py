@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products.cache import bump_cache_version
+from products.recommendations import (
+    RECOMMENDATION_LIMIT, co_occurrence_scores, order_baskets, view_baskets, write_generated
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate 'buy_with' recommendations from orders and 'frequently_viewed' ones from "
+        "browsing history (curated recommendations are left untouched)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            choices=['buy_with', 'frequently_viewed'],
+            action='append',
+            dest='types',
+            help='Only generate this recommendation type (repeatable; default: both)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=RECOMMENDATION_LIMIT,
+            help=f'Recommendations kept per product (default: {RECOMMENDATION_LIMIT})',
+        )
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=2,
+            help='Minimum number of shared orders/viewers for a pair (default: 2)',
+        )
+        parser.add_argument(
+            '--view-days',
+            type=int,
+            default=180,
+            help='Only use browsing history from the last N days (default: 180)',
+        )
+        parser.add_argument(
+            '--max-basket-size',
+            type=int,
+            default=50,
+            help='Products used per order / most recent views used per user (default: 50)',
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=1,
+            help='Split products into N passes to bound memory on large catalogs (default: 1)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of products written per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        types = options['types'] or ['buy_with', 'frequently_viewed']
+        max_basket_size = max(2, options['max_basket_size'])
+        since = timezone.now() - timedelta(days=options['view_days'])
+        sources = {
+            'buy_with': lambda: order_baskets(max_basket_size),
+            'frequently_viewed': lambda: view_baskets(since, max_basket_size),
+        }
+
+        for recommendation_type in types:
+            results = co_occurrence_scores(
+                sources[recommendation_type],
+                top_k=max(1, options['top_k']),
+                min_support=max(1, options['min_support']),
+                shards=max(1, options['shards']),
+            )
+            products, written = write_generated(recommendation_type, results, max(1, options['batch_size']))
+            self.stdout.write(self.style.SUCCESS(
+                f"{recommendation_type}: {written} recommendation(s) written for {products} product(s)."
+            ))
+
+        # bulk_create sends no signals; drop cached product details and validators
+        bump_cache_version('product_details')
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from admin_api.models import GlobalSettings
+from products.cache import bump_cache_version
+from products.models import ProductRecommendation
+from products.recommendations import RECOMMENDATION_LIMIT, write_generated
+from products.similarity import (
+    LAST_RUN_SETTING, MIN_SCORE, RECOMMENDATION_TYPE,
+    affected_rows, build_matrix, changed_products, product_features, top_neighbours
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute content-based 'similar' recommendations. Only products changed since the "
+        "previous run (and the products they affect) are recomputed unless --full is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every product instead of only the changed ones',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=RECOMMENDATION_LIMIT,
+            help=f'Similar products kept per product (default: {RECOMMENDATION_LIMIT})',
+        )
+        parser.add_argument(
+            '--min-score',
+            type=float,
+            default=MIN_SCORE,
+            help=f'Minimum cosine similarity (default: {MIN_SCORE})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Products compared against the catalog per matrix product (default: 256)',
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        top_k = max(1, options['top_k'])
+        batch_size = max(1, options['batch_size'])
+        min_score = options['min_score']
+
+        last_run = GlobalSettings.get_setting(LAST_RUN_SETTING)
+        since = None if options['full'] or not last_run else parse_datetime(str(last_run))
+
+        ids, matrix = build_matrix(product_features())
+        if since is None:
+            rows = list(range(len(ids)))
+            self.stdout.write(f'Full run over {len(ids)} product(s)...')
+        else:
+            changed = changed_products(since)
+            rows = affected_rows(ids, matrix, changed, top_k, batch_size, min_score)
+            self.stdout.write(f'{len(changed)} product(s) changed since {since:%Y-%m-%d %H:%M}, recomputing {len(rows)}...')
+            # Deactivated products keep no generated neighbours of their own
+            active = set(ids.tolist())
+            ProductRecommendation.objects.filter(
+                recommendation_type=RECOMMENDATION_TYPE,
+                source='generated',
+                product_id__in=[product_id for product_id in changed if product_id not in active],
+            ).delete()
+
+        results = top_neighbours(ids, matrix, rows, top_k, batch_size, min_score)
+        products, written = write_generated(RECOMMENDATION_TYPE, results, replace_all=since is None)
+
+        GlobalSettings.set_setting(LAST_RUN_SETTING, started.isoformat(), 'Start of the last generate_similar_products run')
+        # bulk_create sends no signals; drop cached product details and validators
+        bump_cache_version('product_details')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} similar product(s) written for {products} product(s).'
+        ))
@@ -0,0 +1,55 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from admin_api.models import GlobalSettings
+from products.history import RETENTION_SETTING, prune_history
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply browsing history retention: drop rows older than the maximum age and all '
+        'but the newest rows of each user, deleting in small chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            default=settings.BROWSING_HISTORY_MAX_AGE_DAYS,
+            help='Delete rows not viewed for this many days, 0 keeps all (default: BROWSING_HISTORY_MAX_AGE_DAYS)',
+        )
+        parser.add_argument(
+            '--max-per-user',
+            type=int,
+            default=settings.BROWSING_HISTORY_MAX_PER_USER,
+            help='Rows kept per user, 0 keeps all (default: BROWSING_HISTORY_MAX_PER_USER)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between chunks to let other writers through (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        stats = prune_history(
+            max_age_days=max(0, options['max_age_days']),
+            max_rows_per_user=max(0, options['max_per_user']),
+            chunk_size=max(1, options['chunk_size']),
+            pause=max(0.0, options['pause']),
+        )
+        GlobalSettings.set_setting(RETENTION_SETTING, json.dumps(stats), 'Statistics of the last prune_browsing_history run')
+
+        size = f", {stats['bytes_after'] / 1024 / 1024:.1f} MB" if stats['bytes_after'] is not None else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {stats['removed']} browsing history row(s) "
+            f"({stats['removed_by_age']} by age, {stats['removed_by_cap']} over the per-user limit); "
+            f"{stats['rows_before']} -> {stats['rows_after']} row(s){size}."
+        ))
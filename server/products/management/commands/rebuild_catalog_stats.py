@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.models import CategoryStats, SubcategoryStats, MaterialStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the category, subcategory and material statistics tables '
+        '(needed after queryset updates or imports that bypass signals)'
+    )
+
+    def handle(self, *args, **options):
+        for model in (CategoryStats, SubcategoryStats, MaterialStats):
+            count = model.refresh()
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {count} row(s) rebuilt')
+        self.stdout.write(self.style.SUCCESS('Catalog statistics rebuilt.'))
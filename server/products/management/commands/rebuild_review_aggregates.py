@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from products.cache import bump_cache_version
+from products.models import Product, ProductReview
+
+
+class Command(BaseCommand):
+    help = 'Rebuild average_rating, review_count and rating_histogram for all products from approved reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of products written per bulk update (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+
+        self.stdout.write('Aggregating approved reviews...')
+        # One grouped query for the whole catalog
+        rating_counts = defaultdict(dict)
+        grouped = ProductReview.objects.filter(is_approved=True).values(
+            'product_id', 'rating'
+        ).annotate(count=Count('id')).values_list('product_id', 'rating', 'count')
+        for product_id, rating, count in grouped:
+            rating_counts[product_id][rating] = count
+
+        fields = ['average_rating', 'review_count', 'rating_histogram']
+        updated = 0
+        batch = []
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for product_id in product_ids:
+            product = Product(pk=product_id)
+            for field, value in Product.build_review_aggregates(rating_counts.get(product_id, {})).items():
+                setattr(product, field, value)
+            batch.append(product)
+            if len(batch) >= batch_size:
+                updated += self._flush(batch, fields)
+                batch = []
+        if batch:
+            updated += self._flush(batch, fields)
+        # bulk_update sends no signals; drop cached responses and validators
+        bump_cache_version('products')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Review aggregates rebuilt for {updated} product(s) '
+            f'({len(rating_counts)} with approved reviews).'
+        ))
+
+    def _flush(self, batch, fields):
+        with transaction.atomic():
+            Product.objects.bulk_update(batch, fields)
+        return len(batch)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from products.models import Product
+from products.search import FTS_TABLE, get_search_backend, refresh_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product search documents (and the SQLite FTS5 index) for all products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of products indexed per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        indexed = 0
+        for start in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                indexed += refresh_search_documents(product_ids[start:start + batch_size])
+
+        backend = get_search_backend()
+        if backend == 'sqlite':
+            # Re-derive the external-content index from the document table
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Search documents rebuilt for {indexed} product(s) using the {backend} backend.'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_coupon_vendor_alter_coupon_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=dict, help_text="Approved review count per star rating, e.g. {'5': 12, '4': 3}"),
+        ),
+    ]
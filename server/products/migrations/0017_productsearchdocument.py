@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models, DatabaseError
+
+DOCUMENT_TABLE = 'products_productsearchdocument'
+FTS_TABLE = 'products_search_fts'
+FTS_COLUMNS = 'title_text, keywords_text, summary_text, body_text'
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Create the database-specific full-text index over the search documents"""
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title_text, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(keywords_text, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(summary_text, '')), 'C') || "
+            "setweight(to_tsvector('english', coalesce(body_text, '')), 'D')"
+            ") STORED"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX products_search_vector_gin ON {DOCUMENT_TABLE} USING GIN (search_vector)"
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({FTS_COLUMNS}, "
+                f"content='{DOCUMENT_TABLE}', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')"
+            )
+        except DatabaseError:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        new_values = ', '.join(f'new.{column.strip()}' for column in FTS_COLUMNS.split(','))
+        old_values = ', '.join(f'old.{column.strip()}' for column in FTS_COLUMNS.split(','))
+        schema_editor.execute(
+            f"CREATE TRIGGER products_search_fts_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {new_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER products_search_fts_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER products_search_fts_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {new_values}); END"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS products_search_vector_gin")
+        schema_editor.execute(f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector")
+    elif connection.vendor == 'sqlite':
+        for trigger in ('products_search_fts_ai', 'products_search_fts_ad', 'products_search_fts_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def populate_search_documents(apps, schema_editor):
+    """Build search documents for the existing catalog"""
+    from products.search import build_search_documents
+
+    build_search_documents(
+        apps.get_model('products', 'Product'),
+        apps.get_model('products', 'ProductSpecification'),
+        apps.get_model('products', 'ProductSearchDocument'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_product_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title_text', models.TextField(blank=True)),
+                ('keywords_text', models.TextField(blank=True)),
+                ('summary_text', models.TextField(blank=True)),
+                ('body_text', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Product Search Document',
+                'verbose_name_plural': 'Product Search Documents',
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
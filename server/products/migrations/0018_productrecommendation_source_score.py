@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_productsearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrecommendation',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrecommendation',
+            name='source',
+            field=models.CharField(choices=[('manual', 'Curated'), ('generated', 'Generated')], default='manual', max_length=10),
+        ),
+    ]
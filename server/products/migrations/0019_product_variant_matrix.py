@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:37
+
+from django.db import migrations, models
+
+
+def populate_variant_matrices(apps, schema_editor):
+    """Build the variant matrix of existing products"""
+    from products.models import Product as CurrentProduct
+
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+
+    variants = {}
+    for row in ProductVariant.objects.filter(is_active=True).order_by(
+        'product_id', 'color__name', 'size', 'pattern'
+    ).values(*CurrentProduct.VARIANT_MATRIX_FIELDS).iterator():
+        variants.setdefault(row['product_id'], []).append(row)
+    for product_id, price in Product.objects.values_list('pk', 'price').iterator():
+        Product.objects.filter(pk=product_id).update(
+            variant_matrix=CurrentProduct.build_variant_matrix(variants.get(product_id, []), price)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_productrecommendation_source_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='variant_matrix',
+            field=models.JSONField(blank=True, default=dict, help_text='Active variants with their colour/size/pattern index'),
+        ),
+        migrations.RunPython(populate_variant_matrices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_product_variant_matrix'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='browsinghistory',
+            index=models.Index(fields=['last_viewed'], name='browsing_hi_last_viewed_idx'),
+        ),
+    ]
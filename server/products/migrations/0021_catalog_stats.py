@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Max, Q
+
+
+def populate_catalog_stats(apps, schema_editor):
+    """Build the statistics rows of existing categories, subcategories and materials"""
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    active = Q(is_active=True)
+    for owner_name, stats_name, field in (
+        ('Category', 'CategoryStats', 'category'),
+        ('Subcategory', 'SubcategoryStats', 'subcategory'),
+        ('Material', 'MaterialStats', 'material'),
+    ):
+        Stats = apps.get_model('products', stats_name)
+        products = {
+            row[f'{field}_id']: row
+            for row in Product.objects.order_by().values(f'{field}_id').annotate(
+                product_count=Count('id'),
+                active_product_count=Count('id', filter=active),
+                min_price=Min('price', filter=active),
+                max_price=Max('price', filter=active),
+            )
+        }
+        variants = dict(
+            ProductVariant.objects.filter(is_active=True, product__is_active=True).order_by().values(
+                f'product__{field}_id'
+            ).annotate(count=Count('id')).values_list(f'product__{field}_id', 'count')
+        )
+        Stats.objects.bulk_create([
+            Stats(**{
+                f'{field}_id': pk,
+                'product_count': products.get(pk, {}).get('product_count', 0),
+                'active_product_count': products.get(pk, {}).get('active_product_count', 0),
+                'variant_count': variants.get(pk, 0),
+                'min_price': products.get(pk, {}).get('min_price'),
+                'max_price': products.get(pk, {}).get('max_price'),
+            })
+            for pk in apps.get_model('products', owner_name).objects.values_list('pk', flat=True)
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_browsinghistory_last_viewed_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('active_product_count', models.PositiveIntegerField(default=0)),
+                ('variant_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='products.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+                'db_table': 'category_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('active_product_count', models.PositiveIntegerField(default=0)),
+                ('variant_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='products.material')),
+            ],
+            options={
+                'verbose_name_plural': 'Material stats',
+                'db_table': 'material_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='SubcategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('active_product_count', models.PositiveIntegerField(default=0)),
+                ('variant_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subcategory', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='products.subcategory')),
+            ],
+            options={
+                'verbose_name_plural': 'Subcategory stats',
+                'db_table': 'subcategory_stats',
+            },
+        ),
+        migrations.RunPython(populate_catalog_stats, migrations.RunPython.noop),
+    ]
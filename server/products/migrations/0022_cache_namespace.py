@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheNamespace',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Cache Namespace',
+                'verbose_name_plural': 'Cache Namespaces',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_cache_namespace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cachenamespace',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_variant_matrices(apps, schema_editor):
+    """Move the stored matrices out of the product rows"""
+    Product = apps.get_model('products', 'Product')
+    ProductVariantMatrix = apps.get_model('products', 'ProductVariantMatrix')
+    ProductVariantMatrix.objects.bulk_create(
+        (
+            ProductVariantMatrix(product_id=product_id, matrix=matrix)
+            for product_id, matrix in Product.objects.exclude(variant_matrix={}).values_list(
+                'pk', 'variant_matrix'
+            ).iterator()
+        ),
+        batch_size=500,
+    )
+
+
+def restore_variant_matrices(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductVariantMatrix = apps.get_model('products', 'ProductVariantMatrix')
+    for product_id, matrix in ProductVariantMatrix.objects.values_list('product_id', 'matrix').iterator():
+        Product.objects.filter(pk=product_id).update(variant_matrix=matrix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_cache_namespace_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariantMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matrix', models.JSONField(blank=True, default=dict, help_text='Active variants with their colour/size/pattern index')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='variant_matrix', to='products.product')),
+            ],
+            options={
+                'db_table': 'product_variant_matrix',
+            },
+        ),
+        migrations.RunPython(copy_variant_matrices, restore_variant_matrices),
+        migrations.RemoveField(
+            model_name='product',
+            name='variant_matrix',
+        ),
+    ]
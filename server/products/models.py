@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
@@ -82,6 +83,130 @@ class Material(models.Model):
         return self.name
 
 
+class CatalogStats(models.Model):
+    """
+    Product statistics of one category, subcategory or material, maintained by
+    products/signals.py so listings read them with a join instead of counting.
+    """
+    product_count = models.PositiveIntegerField(default=0)
+    active_product_count = models.PositiveIntegerField(default=0)
+    # Active variants of active products
+    variant_count = models.PositiveIntegerField(default=0)
+    # Price range of active products
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Name of the one-to-one field, which is also the Product foreign key it groups by
+    GROUP_FIELD = None
+    STAT_FIELDS = ['product_count', 'active_product_count', 'variant_count', 'min_price', 'max_price', 'updated_at']
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def refresh(cls, ids=None):
+        """Recompute the statistics of the given objects (all of them when ``ids`` is None)"""
+        from django.db.models import Count, Min, Max, Q
+        from django.utils import timezone
+
+        field = cls.GROUP_FIELD
+        owner = cls._meta.get_field(field).related_model
+        if ids is None:
+            ids = list(owner.objects.values_list('pk', flat=True))
+        else:
+            ids = list(owner.objects.filter(pk__in={pk for pk in ids if pk}).values_list('pk', flat=True))
+        if not ids:
+            return 0
+
+        active = Q(is_active=True)
+        products = {
+            row[f'{field}_id']: row
+            for row in Product.objects.filter(**{f'{field}_id__in': ids}).order_by().values(f'{field}_id').annotate(
+                product_count=Count('id'),
+                active_product_count=Count('id', filter=active),
+                min_price=Min('price', filter=active),
+                max_price=Max('price', filter=active),
+            )
+        }
+        variants = dict(
+            ProductVariant.objects.filter(
+                **{f'product__{field}_id__in': ids}, is_active=True, product__is_active=True
+            ).order_by().values(f'product__{field}_id').annotate(count=Count('id')).values_list(
+                f'product__{field}_id', 'count'
+            )
+        )
+
+        now = timezone.now()
+        rows = []
+        for pk in ids:
+            row = products.get(pk, {})
+            rows.append(cls(**{
+                f'{field}_id': pk,
+                'product_count': row.get('product_count', 0),
+                'active_product_count': row.get('active_product_count', 0),
+                'variant_count': variants.get(pk, 0),
+                'min_price': row.get('min_price'),
+                'max_price': row.get('max_price'),
+                'updated_at': now,
+            }))
+        cls.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=[field], update_fields=cls.STAT_FIELDS
+        )
+        return len(rows)
+
+
+class CategoryStats(CatalogStats):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name='stats')
+    GROUP_FIELD = 'category'
+
+    class Meta:
+        db_table = 'category_stats'
+        verbose_name_plural = 'Category stats'
+
+    def __str__(self):
+        return f"Stats of category {self.category_id}"
+
+
+class SubcategoryStats(CatalogStats):
+    subcategory = models.OneToOneField(Subcategory, on_delete=models.CASCADE, related_name='stats')
+    GROUP_FIELD = 'subcategory'
+
+    class Meta:
+        db_table = 'subcategory_stats'
+        verbose_name_plural = 'Subcategory stats'
+
+    def __str__(self):
+        return f"Stats of subcategory {self.subcategory_id}"
+
+
+class MaterialStats(CatalogStats):
+    material = models.OneToOneField(Material, on_delete=models.CASCADE, related_name='stats')
+    GROUP_FIELD = 'material'
+
+    class Meta:
+        db_table = 'material_stats'
+        verbose_name_plural = 'Material stats'
+
+    def __str__(self):
+        return f"Stats of material {self.material_id}"
+
+
+def refresh_catalog_stats(category_ids=None, subcategory_ids=None, material_ids=None):
+    """Recompute the statistics rows of the given categories, subcategories and materials"""
+    for model, ids in ((CategoryStats, category_ids), (SubcategoryStats, subcategory_ids), (MaterialStats, material_ids)):
+        if ids:
+            model.refresh(ids)
+
+
+def get_catalog_stats(obj):
+    """Statistics row of a category, subcategory or material (None when not built yet)"""
+    try:
+        return obj.stats
+    except models.ObjectDoesNotExist:
+        return None
+
+
 class Product(models.Model):
     """Main product model"""
     # Basic Information
@@ -105,9 +230,11 @@ class Product(models.Model):
     main_image = models.URLField(max_length=500, blank=True, null=True)
     
     # Ratings and Reviews
+    # Kept current from approved ProductReview rows (see products/signals.py)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, validators=[MinValueValidator(0), MaxValueValidator(5)])
     review_count = models.PositiveIntegerField(default=0)
-    
+    rating_histogram = models.JSONField(default=dict, blank=True, help_text="Approved review count per star rating, e.g. {'5': 12, '4': 3}")
+
     # Product Details - Multi-vendor support
     vendor = models.ForeignKey('accounts.Vendor', on_delete=models.CASCADE, related_name='products', null=True, blank=True, help_text='Vendor/Seller who owns this product')
     brand = models.CharField(max_length=100, blank=True, help_text='Brand name (can be different from vendor brand)')
@@ -152,6 +279,173 @@ class Product(models.Model):
     def __str__(self):
         return self.title
 
+    @staticmethod
+    def build_review_aggregates(rating_counts):
+        """Build review column values from a {rating: count} mapping of approved reviews"""
+        from decimal import Decimal
+
+        histogram = {str(star): int(rating_counts.get(star, 0)) for star in range(5, 0, -1)}
+        total = sum(histogram.values())
+        if total:
+            weighted = sum(int(star) * count for star, count in histogram.items())
+            average = (Decimal(weighted) / Decimal(total)).quantize(Decimal('0.01'))
+        else:
+            average = Decimal('0.00')
+        return {
+            'average_rating': average,
+            'review_count': total,
+            'rating_histogram': histogram,
+        }
+
+    def refresh_review_aggregates(self):
+        """Recompute average_rating, review_count and rating_histogram from approved reviews"""
+        from django.db.models import Count
+
+        rating_counts = dict(
+            ProductReview.objects.filter(product_id=self.pk, is_approved=True)
+            .values('rating').annotate(count=Count('id')).values_list('rating', 'count')
+        )
+        aggregates = self.build_review_aggregates(rating_counts)
+        # Queryset update so auto_now/save() side effects are not triggered
+        Product.objects.filter(pk=self.pk).update(**aggregates)
+        for field, value in aggregates.items():
+            setattr(self, field, value)
+        return aggregates
+
+    VARIANT_MATRIX_FIELDS = (
+        'id', 'product_id', 'title', 'color_id', 'color__name', 'color__hex_code',
+        'size', 'pattern', 'price', 'old_price', 'stock_quantity', 'is_in_stock', 'image',
+    )
+
+    @staticmethod
+    def build_variant_matrix(variants, product_price=None):
+        """Build the variant matrix from active variant rows ordered by colour name, size and pattern"""
+        colors = {}
+        entries = []
+        index = {}
+        for variant in variants:
+            colors.setdefault(variant['color_id'], {
+                'id': variant['color_id'],
+                'name': variant['color__name'],
+                'hex_code': variant['color__hex_code'],
+            })
+            price = variant['price'] if variant['price'] is not None else product_price
+            entries.append({
+                'id': variant['id'],
+                'title': variant['title'],
+                'color_id': variant['color_id'],
+                'size': variant['size'],
+                'pattern': variant['pattern'],
+                'price': str(price) if price is not None else None,
+                'old_price': str(variant['old_price']) if variant['old_price'] is not None else None,
+                'stock_quantity': variant['stock_quantity'],
+                'is_in_stock': variant['is_in_stock'],
+                'image': variant['image'],
+            })
+            index[f"{variant['color_id']}|{variant['size']}|{variant['pattern']}"] = variant['id']
+        return {
+            'colors': list(colors.values()),
+            'sizes': [size for size in dict.fromkeys(entry['size'] for entry in entries) if size],
+            'patterns': [pattern for pattern in dict.fromkeys(entry['pattern'] for entry in entries) if pattern],
+            'variants': entries,
+            'index': index,
+        }
+
+    @classmethod
+    def load_variant_matrices(cls, product_ids):
+        """Compute variant matrices for the given products with two queries, keyed by id"""
+        prices = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'price'))
+        variants = {}
+        for row in ProductVariant.objects.filter(product_id__in=prices, is_active=True).order_by(
+            'color__name', 'size', 'pattern'
+        ).values(*cls.VARIANT_MATRIX_FIELDS):
+            variants.setdefault(row['product_id'], []).append(row)
+        return {
+            product_id: cls.build_variant_matrix(variants.get(product_id, []), price)
+            for product_id, price in prices.items()
+        }
+
+    @classmethod
+    def refresh_variant_matrices(cls, product_ids):
+        """Recompute and store the variant matrix of the given products"""
+        from django.utils import timezone
+
+        matrices = cls.load_variant_matrices(product_ids)
+        now = timezone.now()
+        ProductVariantMatrix.objects.bulk_create(
+            [
+                ProductVariantMatrix(product_id=product_id, matrix=matrix, updated_at=now)
+                for product_id, matrix in matrices.items()
+            ],
+            update_conflicts=True, unique_fields=['product'], update_fields=['matrix', 'updated_at'], batch_size=500,
+        )
+        return matrices
+
+    def refresh_variant_matrix(self):
+        matrix = self.refresh_variant_matrices([self.pk]).get(self.pk, {})
+        self.variant_matrix = ProductVariantMatrix(product=self, matrix=matrix)
+        return matrix
+
+    def get_variant_matrix(self):
+        """Stored variant matrix, built on first use for products without one"""
+        from django.core.exceptions import ObjectDoesNotExist
+
+        try:
+            matrix = self.variant_matrix.matrix
+        except ObjectDoesNotExist:
+            matrix = None
+        if 'variants' not in (matrix or {}):
+            return self.refresh_variant_matrix()
+        return matrix
+
+    @property
+    def has_variants(self):
+        return bool(self.get_variant_matrix().get('variants'))
+
+    def get_matrix_variant(self, variant_id):
+        """Matrix entry of an active variant of this product, or None"""
+        try:
+            variant_id = int(variant_id)
+        except (TypeError, ValueError):
+            return None
+        for entry in self.get_variant_matrix().get('variants', []):
+            if entry['id'] == variant_id:
+                return entry
+        return None
+
+    def get_review_percentages(self):
+        """Star rating breakdown in percent, read from the stored histogram"""
+        histogram = self.rating_histogram or {}
+        total = sum(int(count) for count in histogram.values())
+        if total == 0:
+            return {'5': 0, '4': 0, '3': 0, '2': 0, '1': 0}
+        return {
+            str(star): round((int(histogram.get(str(star), 0)) / total) * 100, 1)
+            for star in range(5, 0, -1)
+        }
+
+
+class ProductSearchDocument(models.Model):
+    """Denormalized search text for a product, grouped by ranking weight.
+
+    The database-specific full-text index (Postgres tsvector column or SQLite
+    FTS5 table) is created over these columns in migration 0017 and queried
+    through products/search.py.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='search_document')
+    title_text = models.TextField(blank=True)  # weight A: title
+    keywords_text = models.TextField(blank=True)  # weight B: brand, category, subcategory
+    summary_text = models.TextField(blank=True)  # weight C: short description, material, specifications
+    body_text = models.TextField(blank=True)  # weight D: long description
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Product Search Document'
+        verbose_name_plural = 'Product Search Documents'
+
+    def __str__(self):
+        return f"Search document for {self.product_id}"
+
 
 class ProductImage(models.Model):
     """Additional product images"""
@@ -243,6 +537,54 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.title} - {self.title}" if self.title else f"{self.product.title} - Variant {self.id}"
 
+    @classmethod
+    def adjust_stock(cls, changes, floor=False):
+        """
+        Add ``{variant_id: delta}`` to stock with F() expressions (negative
+        deltas take stock). Lock the rows first when the result is checked.
+        With ``floor`` stock never drops below zero. Queryset updates send no
+        signals, so the variant matrices and cached responses are refreshed here.
+        """
+        from django.db.models import Case, When, Value, F, Q, ExpressionWrapper, BooleanField
+        from django.db.models.functions import Greatest
+        
+        changes = {variant_id: delta for variant_id, delta in changes.items() if variant_id and delta}
+        if not changes:
+            return
+        delta = Case(
+            *[When(pk=variant_id, then=Value(amount)) for variant_id, amount in changes.items()],
+            default=Value(0),
+        )
+        stock = F('stock_quantity') + delta
+        variants = cls.objects.filter(pk__in=changes)
+        variants.update(stock_quantity=Greatest(stock, Value(0)) if floor else stock)
+        variants.update(is_in_stock=ExpressionWrapper(Q(stock_quantity__gt=0), output_field=BooleanField()))
+        
+        Product.refresh_variant_matrices(list(
+            variants.order_by().values_list('product_id', flat=True).distinct()
+        ))
+        from .cache import bump_cache_version
+        from .filters import ProductAggregationFilter
+        bump_cache_version('products')
+        bump_cache_version(ProductAggregationFilter.CACHE_NAMESPACE)
+
+
+class ProductVariantMatrix(models.Model):
+    """
+    Active variants of a product by colour/size/pattern, maintained by
+    products/signals.py. Kept out of the Product row so saving a product
+    never writes back a stale copy.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='variant_matrix')
+    matrix = models.JSONField(default=dict, blank=True, help_text="Active variants with their colour/size/pattern index")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'product_variant_matrix'
+
+    def __str__(self):
+        return f"Variant matrix of product {self.product_id}"
+
 
 class ProductReview(models.Model):
     """Product reviews and ratings"""
@@ -273,12 +615,19 @@ class ProductRecommendation(models.Model):
         ('similar', 'Similar products'),
         ('recommended', 'Recommended for you'),
     ]
+    SOURCE_CHOICES = [
+        ('manual', 'Curated'),
+        ('generated', 'Generated'),
+    ]
     
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
     recommended_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_by')
     recommendation_type = models.CharField(max_length=20, choices=RECOMMENDATION_TYPES)
     sort_order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # Generated rows are owned by the generate_recommendations command; curated ones are never touched
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='manual')
+    score = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -416,9 +765,9 @@ class Coupon(models.Model):
             return False, "Coupon is not valid"
         
         if self.one_time_use_per_user:
-            from orders.models import Order
-            # Check if user has already used this coupon
-            if Order.objects.filter(user=user, coupon=self).exists():
+            from orders.models import CouponRedemption
+            # Check the (coupon, user) redemption ledger
+            if CouponRedemption.objects.filter(coupon=self, user=user, times_used__gt=0).exists():
                 return False, "This coupon can only be used once per user"
         
         return True, "Valid"
@@ -479,7 +828,27 @@ class BrowsingHistory(models.Model):
         indexes = [
             models.Index(fields=['user', '-last_viewed'], name='browsing_hi_user_id_941c7b_idx'),
             models.Index(fields=['user', 'category'], name='browsing_hi_user_id_3df6af_idx'),
+            models.Index(fields=['last_viewed'], name='browsing_hi_last_viewed_idx'),
         ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.product.title} ({self.view_count} views)"
\ No newline at end of file
+        return f"{self.user.username} - {self.product.title} ({self.view_count} views)"
+
+
+class CacheNamespace(models.Model):
+    """Version and last change of a cache namespace (products/cache.py) when the cache is not shared.
+
+    Per-process caches (local memory, disk) cannot hold a version every worker
+    sees, so it is kept here instead and bumped with a single UPDATE. The
+    change time feeds Last-Modified headers.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Cache Namespace'
+        verbose_name_plural = 'Cache Namespaces'
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
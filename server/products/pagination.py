@@ -0,0 +1,198 @@
+"""
+Keyset (cursor) pagination.
+
+Page-number pagination runs a COUNT(*) and an ever-growing OFFSET on every
+page. KeysetPagination instead remembers the sort values of the last row it
+returned and asks for rows strictly after them, so every page costs the same.
+Ties are broken by the primary key, which keeps the cursor stable for any
+ordering (including annotated ones such as ``effective_price`` or ``search_rank``).
+
+Views opt in per request through CursorPaginationMixin: clients send
+``?pagination=cursor`` (or a ``cursor`` from a previous response); everyone
+else keeps the view's regular page-number pagination.
+"""
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a composite (ordering fields + pk) key"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return params.get(cls.mode_query_param) == 'cursor' or cls.cursor_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """Ordering field names of the queryset with a pk tiebreaker appended"""
+        ordering = list(queryset.query.order_by)
+        if not ordering and queryset.query.default_ordering:
+            ordering = list(queryset.model._meta.ordering)
+        if not all(isinstance(field, str) for field in ordering):
+            # The cursor stores one value per ordering name; dropping an expression would skip or repeat rows
+            raise ImproperlyConfigured(
+                f'{self.__class__.__name__} needs named orderings; annotate expressions and order by the alias'
+            )
+        names = [field.lstrip('-') for field in ordering]
+        if 'pk' not in names and 'id' not in names:
+            descending = ordering[-1].startswith('-') if ordering else True
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = [self._flip(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, self._parse_position(queryset, position)))
+
+        # Fetch one extra row to learn whether there is another page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self._position(self.page[0]), reverse=True)
+
+    def _link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        url = replace_query_param(url, self.mode_query_param, 'cursor')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _position(self, row):
+        """Sort key values of a row (model instance or values() dict)"""
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                value = row.get('id' if name == 'pk' else name)
+            else:
+                value = row
+                for attr in name.split('__'):
+                    value = getattr(value, attr, None)
+            position.append(value)
+        return position
+
+    def _parse_position(self, queryset, position):
+        """Cursor values converted by their ordering field, so a tampered cursor is a 404 rather than a 500"""
+        query = queryset.query.chain()
+        try:
+            return [
+                value if value is None else query.resolve_ref(field.lstrip('-')).output_field.to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _after(ordering, position):
+        """Rows strictly after ``position`` in ``ordering`` (lexicographic keyset condition)"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            if value is not None:
+                lookup = 'lt' if field.startswith('-') else 'gt'
+                condition |= equal & Q(**{f'{name}__{lookup}': value})
+                equal &= Q(**{name: value})
+            else:
+                equal &= Q(**{f'{name}__isnull': True})
+        return condition
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        return value
+
+    def encode_cursor(self, position, reverse=False):
+        payload = {'p': [self._encode_value(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            payload = json.loads(data)
+            position = payload['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+
+class CursorPaginationMixin:
+    """Let clients opt into KeysetPagination per request; otherwise use pagination_class"""
+    cursor_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and self.cursor_pagination_class.is_requested(request):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
@@ -0,0 +1,185 @@
+"""
+Per-user category/brand affinity used to personalize product ordering.
+
+A user's affinity is a small map of category id -> score and brand -> score
+built from their stated interests, browsing history and past orders. It is
+cached under a per-user namespace version (products/cache.py), so an
+invalidation reaches every worker. With a shared cache new views and orders
+are folded into the cached entry in place; with a per-process cache they bump
+the version instead, since an in-place update would only reach one worker.
+
+``affinity_score`` turns it into a single annotated expression
+(``category score + brand score``) that listings order by before their normal sort.
+"""
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, FloatField
+from django.utils import timezone
+
+from .cache import bump_cache_version, make_cache_key, make_cache_keys
+
+CACHE_NAMESPACE = 'user_affinity'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+INTEREST_WEIGHT = 5.0
+VIEW_WEIGHT = 1.0
+ORDER_WEIGHT = 3.0
+# Browsing signal halves every HALF_LIFE_DAYS
+HALF_LIFE_DAYS = 30
+MAX_HISTORY_ROWS = 200
+
+# Only the strongest entries are applied, scores are rounded into a few levels
+TOP_CATEGORIES = 10
+TOP_BRANDS = 10
+SCORE_LEVELS = 4
+
+
+def _namespace(user_id):
+    return f'{CACHE_NAMESPACE}:{user_id}'
+
+
+def _cache_key(user_id):
+    return make_cache_key(_namespace(user_id))
+
+
+def _parse_interests(interests):
+    if isinstance(interests, str):
+        try:
+            interests = json.loads(interests)
+        except ValueError:
+            return []
+    return interests if isinstance(interests, list) else []
+
+
+def compute_user_affinity(user):
+    """Build raw category and brand scores for a user from the database"""
+    from django.db.models import Sum
+    from orders.models import OrderItem
+    from .models import Category, BrowsingHistory
+
+    categories = {}
+    brands = {}
+
+    interests = _parse_interests(user.interests)
+    if interests:
+        for category_id in Category.objects.filter(name__in=interests, is_active=True).values_list('id', flat=True):
+            categories[category_id] = categories.get(category_id, 0.0) + INTEREST_WEIGHT
+
+    now = timezone.now()
+    history = BrowsingHistory.objects.filter(user=user).order_by('-last_viewed').values_list(
+        'product__category_id', 'product__brand', 'view_count', 'last_viewed'
+    )[:MAX_HISTORY_ROWS]
+    for category_id, brand, view_count, last_viewed in history:
+        age_days = max((now - last_viewed).total_seconds(), 0) / 86400
+        weight = VIEW_WEIGHT * view_count * 0.5 ** (age_days / HALF_LIFE_DAYS)
+        if category_id:
+            categories[category_id] = categories.get(category_id, 0.0) + weight
+        if brand:
+            brands[brand] = brands.get(brand, 0.0) + weight
+
+    purchases = OrderItem.objects.filter(order__user=user).exclude(
+        order__status__in=['cancelled', 'returned']
+    ).values('product__category_id', 'product__brand').annotate(quantity=Sum('quantity'))
+    for row in purchases:
+        weight = ORDER_WEIGHT * row['quantity']
+        if row['product__category_id']:
+            categories[row['product__category_id']] = categories.get(row['product__category_id'], 0.0) + weight
+        if row['product__brand']:
+            brands[row['product__brand']] = brands.get(row['product__brand'], 0.0) + weight
+
+    return {'categories': categories, 'brands': brands}
+
+
+def get_user_affinity(user):
+    """Cached raw affinity for an authenticated user"""
+    key = _cache_key(user.pk)
+    affinity = cache.get(key)
+    if affinity is None:
+        affinity = compute_user_affinity(user)
+        cache.set(key, affinity, CACHE_TIMEOUT)
+    return affinity
+
+
+def add_product_affinity(user_id, product_id, weight=VIEW_WEIGHT):
+    """Fold a new view or purchase of a product into a cached affinity (no-op when not cached)"""
+    from .models import Product
+
+    if not settings.CACHE_IS_SHARED:
+        invalidate_user_affinity(user_id)
+        return
+    row = Product.objects.filter(pk=product_id).values_list('category_id', 'brand').first()
+    if row is not None:
+        add_affinities({user_id: [(*row, weight)]})
+
+
+def add_affinities(weights):
+    """
+    Fold ``{user_id: [(category_id, brand, weight), ...]}`` into the cached
+    affinities with one version read, one cache read and one cache write
+    """
+    if not settings.CACHE_IS_SHARED:
+        for user_id in weights:
+            invalidate_user_affinity(user_id)
+        return
+    user_ids = list(weights)
+    keys = dict(zip(user_ids, make_cache_keys(*((_namespace(user_id),) for user_id in user_ids))))
+    cached = cache.get_many(keys.values())
+    updated = {}
+    for user_id, key in keys.items():
+        affinity = cached.get(key)
+        if affinity is None:
+            continue
+        for category_id, brand, weight in weights[user_id]:
+            if category_id:
+                affinity['categories'][category_id] = affinity['categories'].get(category_id, 0.0) + weight
+            if brand:
+                affinity['brands'][brand] = affinity['brands'].get(brand, 0.0) + weight
+        updated[key] = affinity
+    if updated:
+        cache.set_many(updated, CACHE_TIMEOUT)
+
+
+def invalidate_user_affinity(user_id):
+    """Recompute the user's affinity on next use, in every worker, once the transaction commits"""
+    bump_cache_version(_namespace(user_id))
+
+
+def _levels(scores, limit):
+    """Top entries normalized to (0, 1] and rounded to SCORE_LEVELS, grouped by level"""
+    top = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+    if not top or top[0][1] <= 0:
+        return {}
+    best = top[0][1]
+    levels = {}
+    for key, score in top:
+        level = math.ceil(score / best * SCORE_LEVELS) / SCORE_LEVELS
+        levels.setdefault(level, []).append(key)
+    return levels
+
+
+def affinity_score(affinity):
+    """
+    Expression scoring a product by the user's category and brand affinity,
+    or None when the user has no signal yet.
+    """
+    if not affinity:
+        return None
+    category_levels = _levels(affinity.get('categories', {}), TOP_CATEGORIES)
+    brand_levels = _levels(affinity.get('brands', {}), TOP_BRANDS)
+    if not category_levels and not brand_levels:
+        return None
+
+    zero = Value(0.0, output_field=FloatField())
+    category_score = Case(
+        *[When(category_id__in=ids, then=Value(level)) for level, ids in category_levels.items()],
+        default=zero, output_field=FloatField()
+    ) if category_levels else zero
+    # Brands weigh half as much as categories
+    brand_score = Case(
+        *[When(brand__in=names, then=Value(level / 2)) for level, names in brand_levels.items()],
+        default=zero, output_field=FloatField()
+    ) if brand_levels else zero
+    return category_score + brand_score
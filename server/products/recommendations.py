@@ -0,0 +1,338 @@
+"""
+Product recommendations: loading for the API and offline generation.
+
+Every recommendation type of a product is fetched in one grouped query (top
+``RECOMMENDATION_LIMIT`` per type via a window function) and the cards of all
+recommended products are then built together.
+
+``co_occurrence_scores`` mines item-to-item scores from "baskets" (the products
+of one order, or the recent views of one user) with sparse NumPy counting and
+``write_generated`` stores the top results as ``source='generated'`` rows next
+to the curated ones.
+
+``inspired_by_feed`` builds a per-user feed from the user's recent views: the
+neighbours of the viewed products plus popular products of the viewed
+categories, ranked together and cached for a few minutes.
+"""
+import heapq
+import math
+from datetime import timedelta
+from collections import Counter
+from itertools import groupby, islice
+from operator import itemgetter
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .cache import make_cache_key
+from .models import ProductRecommendation
+
+RECOMMENDATION_LIMIT = 10
+RECOMMENDATION_TYPES = [key for key, _ in ProductRecommendation.RECOMMENDATION_TYPES]
+
+# Generated rows sort after curated ones of the same type
+GENERATED_SORT_OFFSET = 1000
+# Pair keys buffered before they are folded into the sparse counts
+COMPACT_EVERY = 2_000_000
+
+FEED_CACHE_NAMESPACE = 'inspired_feed'
+FEED_CACHE_TIMEOUT = 60 * 5
+FEED_LIMIT = 20
+# Most recent views used as seeds, and how far back they may go
+FEED_SEED_ROWS = 30
+FEED_SEED_DAYS = 90
+# Candidates taken per seed product and per seed category
+FEED_NEIGHBOURS_PER_SEED = 10
+FEED_CATEGORIES = 5
+FEED_PRODUCTS_PER_CATEGORY = 20
+# Item-to-item recommendation types a viewed product contributes through
+FEED_NEIGHBOUR_WEIGHTS = {'similar': 1.0, 'frequently_viewed': 0.8, 'buy_with': 0.6}
+FEED_CATEGORY_WEIGHT = 0.3
+
+
+def load_recommendations(product_id, limit=RECOMMENDATION_LIMIT):
+    """Cards of a product's active recommendations keyed by recommendation type"""
+    from .serializers import ProductCardSerializer
+
+    rows = ProductRecommendation.objects.filter(
+        product_id=product_id,
+        is_active=True,
+        recommended_product__is_active=True,
+    ).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('recommendation_type'),
+            order_by=[F('sort_order').asc(), F('created_at').desc()],
+        )
+    ).filter(position__lte=limit).order_by('recommendation_type', 'position').values_list(
+        'recommendation_type', 'recommended_product_id'
+    )
+
+    grouped = {recommendation_type: [] for recommendation_type in RECOMMENDATION_TYPES}
+    for recommendation_type, recommended_id in rows:
+        grouped.setdefault(recommendation_type, []).append(recommended_id)
+
+    cards = ProductCardSerializer.load_cards(list({pk for ids in grouped.values() for pk in ids}))
+    return {
+        recommendation_type: [cards[pk] for pk in ids if pk in cards]
+        for recommendation_type, ids in grouped.items()
+    }
+
+
+def _baskets(rows, max_basket_size):
+    """Group ``(basket key, product id)`` rows sorted by key into sets of two or more products"""
+    for _, group in groupby(rows, key=itemgetter(0)):
+        basket = {product_id for _, product_id in islice(group, max_basket_size)}
+        if len(basket) > 1:
+            yield basket
+
+
+def order_baskets(max_basket_size=50, chunk_size=5000):
+    """Products bought together in one order (cancelled and returned orders excluded)"""
+    from orders.models import OrderItem
+
+    rows = OrderItem.objects.filter(product__is_active=True).exclude(
+        order__status__in=['cancelled', 'returned']
+    ).order_by('order_id').values_list('order_id', 'product_id').iterator(chunk_size=chunk_size)
+    return _baskets(rows, max_basket_size)
+
+
+def view_baskets(since=None, max_basket_size=50, chunk_size=5000):
+    """Products viewed by the same user, most recent views first"""
+    from .models import BrowsingHistory
+
+    history = BrowsingHistory.objects.filter(product__is_active=True)
+    if since is not None:
+        history = history.filter(last_viewed__gte=since)
+    rows = history.order_by('user_id', '-last_viewed').values_list(
+        'user_id', 'product_id'
+    ).iterator(chunk_size=chunk_size)
+    return _baskets(rows, max_basket_size)
+
+
+def _merge_counts(keys, counts, chunks):
+    """Fold ``chunks`` of keys (one occurrence each) into sorted unique ``keys`` with ``counts``"""
+    keys, inverse = np.unique(np.concatenate([keys, *chunks]), return_inverse=True)
+    weights = np.concatenate([counts, np.ones(sum(len(chunk) for chunk in chunks), dtype=np.int64)])
+    return keys, np.bincount(inverse, weights=weights, minlength=len(keys)).astype(np.int64)
+
+
+def co_occurrence_scores(get_baskets, top_k=RECOMMENDATION_LIMIT, min_support=2, shards=1,
+                         compact_every=COMPACT_EVERY):
+    """
+    Yield ``(product_id, [(other_id, score), ...])`` best first.
+
+    ``get_baskets`` is called once per shard and must return a fresh basket
+    iterable. Only anchors with ``product_id % shards == shard`` are counted in
+    a pass. Pairs are packed as ``anchor << 32 | other`` int64 keys and counted
+    as a sparse (COO) vector with NumPy, compacted every ``compact_every`` keys,
+    so memory stays proportional to the distinct co-occurrences of one shard.
+    The score is the co-occurrence count normalized by both products'
+    popularity (cosine similarity of the binary basket vectors).
+    """
+    empty = np.empty(0, dtype=np.int64)
+    for shard in range(shards):
+        product_ids, frequency = empty, empty
+        pair_keys, pair_counts = empty, empty
+        product_chunks, pair_chunks = [], []
+        pending = 0
+        for basket in get_baskets():
+            products = np.fromiter(basket, dtype=np.int64, count=len(basket))
+            anchors = products[products % shards == shard]
+            product_chunks.append(products)
+            if len(anchors):
+                pair_chunks.append(((anchors[:, None] << 32) | products[None, :]).ravel())
+            pending += len(products) + len(anchors) * len(products)
+            if pending >= compact_every:
+                product_ids, frequency = _merge_counts(product_ids, frequency, product_chunks)
+                pair_keys, pair_counts = _merge_counts(pair_keys, pair_counts, pair_chunks)
+                product_chunks, pair_chunks, pending = [], [], 0
+        product_ids, frequency = _merge_counts(product_ids, frequency, product_chunks)
+        pair_keys, pair_counts = _merge_counts(pair_keys, pair_counts, pair_chunks)
+
+        anchors, others = pair_keys >> 32, pair_keys & 0xFFFFFFFF
+        keep = (anchors != others) & (pair_counts >= min_support)
+        anchors, others, counts = anchors[keep], others[keep], pair_counts[keep]
+        if not len(anchors):
+            continue
+        scores = counts / np.sqrt(
+            frequency[np.searchsorted(product_ids, anchors)] * frequency[np.searchsorted(product_ids, others)]
+        )
+
+        # Keys are sorted, so each anchor's pairs are one contiguous run
+        starts = np.flatnonzero(np.r_[True, anchors[1:] != anchors[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(anchors)]):
+            run = np.lexsort((others[start:stop], -scores[start:stop]))[:top_k]
+            yield int(anchors[start]), [
+                (int(other_id), float(score))
+                for other_id, score in zip(others[start:stop][run], scores[start:stop][run])
+            ]
+
+
+def write_generated(recommendation_type, results, batch_size=500, replace_all=True):
+    """
+    Upsert generated recommendations of one type and drop stale generated rows.
+
+    Pairs already curated for the product are skipped, curated rows are never
+    modified. With ``replace_all`` products missing from ``results`` lose their
+    generated rows too (full runs). Returns ``(products, rows written)``.
+    """
+    generated = ProductRecommendation.objects.filter(recommendation_type=recommendation_type, source='generated')
+    seen = set()
+    written = 0
+
+    def flush(batch):
+        anchors = [anchor for anchor, _ in batch]
+        curated = set(ProductRecommendation.objects.filter(
+            product_id__in=anchors, recommendation_type=recommendation_type
+        ).exclude(source='generated').values_list('product_id', 'recommended_product_id'))
+        rows = []
+        for anchor, scored in batch:
+            rank = 0
+            for other_id, score in scored:
+                if (anchor, other_id) in curated:
+                    continue
+                rows.append(ProductRecommendation(
+                    product_id=anchor,
+                    recommended_product_id=other_id,
+                    recommendation_type=recommendation_type,
+                    source='generated',
+                    score=score,
+                    sort_order=GENERATED_SORT_OFFSET + rank,
+                    is_active=True,
+                ))
+                rank += 1
+        keep = {(row.product_id, row.recommended_product_id) for row in rows}
+        stale = [
+            pk for pk, anchor, other_id in generated.filter(product_id__in=anchors).values_list(
+                'pk', 'product_id', 'recommended_product_id'
+            )
+            if (anchor, other_id) not in keep
+        ]
+        with transaction.atomic():
+            ProductRecommendation.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['product', 'recommended_product', 'recommendation_type'],
+                # is_active is left alone so generated rows an admin switched off stay off
+                update_fields=['score', 'sort_order'],
+            )
+            if stale:
+                ProductRecommendation.objects.filter(pk__in=stale).delete()
+        return len(rows)
+
+    batch = []
+    for anchor, scored in results:
+        seen.add(anchor)
+        batch.append((anchor, scored))
+        if len(batch) >= batch_size:
+            written += flush(batch)
+            batch = []
+    if batch:
+        written += flush(batch)
+
+    if not replace_all:
+        return len(seen), written
+
+    # Products without results lose their generated rows
+    orphaned = [pk for pk in generated.order_by().values_list('product_id', flat=True).distinct() if pk not in seen]
+    for start in range(0, len(orphaned), batch_size):
+        generated.filter(product_id__in=orphaned[start:start + batch_size]).delete()
+
+    return len(seen), written
+
+
+def _feed_candidates(user_id, seeds, categories):
+    """
+    Neighbour and category candidates as ``(product_id, source, position)``
+    rows. Purchased products and the seeds themselves are excluded in SQL.
+    """
+    from orders.models import OrderItem
+    from .models import Product
+
+    purchased = OrderItem.objects.filter(order__user_id=user_id).exclude(
+        order__status__in=['cancelled', 'returned']
+    ).values('product_id')
+
+    neighbours = ProductRecommendation.objects.filter(
+        product_id__in=seeds,
+        recommendation_type__in=list(FEED_NEIGHBOUR_WEIGHTS),
+        is_active=True,
+        recommended_product__is_active=True,
+    ).exclude(
+        Q(recommended_product_id__in=seeds) | Q(recommended_product_id__in=purchased)
+    ).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('product_id'), F('recommendation_type')],
+            order_by=[F('sort_order').asc(), F('created_at').desc()],
+        )
+    ).filter(position__lte=FEED_NEIGHBOURS_PER_SEED).values_list(
+        'recommended_product_id', 'product_id', 'recommendation_type', 'position'
+    )
+
+    popular = Product.objects.filter(category_id__in=categories, is_active=True).exclude(
+        Q(pk__in=seeds) | Q(pk__in=purchased)
+    ).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('category_id'),
+            order_by=[F('is_featured').desc(), F('review_count').desc(), F('average_rating').desc(), F('pk').desc()],
+        )
+    ).filter(position__lte=FEED_PRODUCTS_PER_CATEGORY).values_list('pk', 'category_id', 'position')
+
+    return list(neighbours), list(popular)
+
+
+def compute_inspired_by_feed(user_id, limit=FEED_LIMIT):
+    """Ranked product ids inspired by a user's recent browsing history"""
+    from .models import BrowsingHistory
+    from .personalization import HALF_LIFE_DAYS
+
+    now = timezone.now()
+    history = BrowsingHistory.objects.filter(
+        user_id=user_id, last_viewed__gte=now - timedelta(days=FEED_SEED_DAYS), product__is_active=True
+    ).order_by('-last_viewed').values_list('product_id', 'category_id', 'view_count', 'last_viewed')[:FEED_SEED_ROWS]
+
+    # Seed weight: views, halving every HALF_LIFE_DAYS
+    seeds = {}
+    category_weights = Counter()
+    for product_id, category_id, view_count, last_viewed in history:
+        age_days = max((now - last_viewed).total_seconds(), 0) / 86400
+        weight = math.log1p(view_count) * 0.5 ** (age_days / HALF_LIFE_DAYS)
+        seeds[product_id] = weight
+        if category_id:
+            category_weights[category_id] += weight
+    if not seeds:
+        return []
+
+    categories = dict(category_weights.most_common(FEED_CATEGORIES))
+    neighbours, popular = _feed_candidates(user_id, list(seeds), list(categories))
+
+    scores = Counter()
+    for candidate_id, seed_id, recommendation_type, position in neighbours:
+        scores[candidate_id] += seeds[seed_id] * FEED_NEIGHBOUR_WEIGHTS[recommendation_type] / position
+    for candidate_id, category_id, position in popular:
+        scores[candidate_id] += categories[category_id] * FEED_CATEGORY_WEIGHT / position
+    return [product_id for product_id, _ in heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))]
+
+
+def inspired_by_feed(user_id, limit=FEED_LIMIT):
+    """Cards of a user's "inspired by your browsing history" feed, cached per user"""
+    from .history import view_buffer
+    from .serializers import ProductCardSerializer
+
+    key = make_cache_key(FEED_CACHE_NAMESPACE, user_id, limit)
+    cards = cache.get(key)
+    if cards is None:
+        # Include views still waiting in the write-behind buffer
+        view_buffer.flush(user_id=user_id)
+        product_ids = compute_inspired_by_feed(user_id, limit)
+        loaded = ProductCardSerializer.load_cards(product_ids)
+        cards = [loaded[pk] for pk in product_ids if pk in loaded]
+        cache.set(key, cards, FEED_CACHE_TIMEOUT)
+    return cards
@@ -0,0 +1,170 @@
+"""
+Ranked full-text product search.
+
+Search text lives in ProductSearchDocument (kept current by products/signals.py).
+Migration 0017 adds the database-specific index over it:
+
+* PostgreSQL: a generated, weighted ``search_vector`` tsvector column with a GIN index
+* SQLite: an external-content FTS5 table kept in sync by triggers
+
+Other backends (or SQLite builds without FTS5) fall back to ``icontains`` over
+the document columns.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+DOCUMENT_TABLE = 'products_productsearchdocument'
+FTS_TABLE = 'products_search_fts'
+SEARCH_CONFIG = 'english'
+
+# Column weights for SQLite bm25(): title, keywords, summary, body
+FTS_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_QUERY_TOKENS = 8
+
+_fts_available = {}
+
+
+def tokenize_query(query):
+    """Split a raw user query into lowercase search tokens"""
+    return [token.lower() for token in TOKEN_RE.findall(query or '')][:MAX_QUERY_TOKENS]
+
+
+def _has_fts_table(connection):
+    if connection.alias not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available[connection.alias]
+
+
+def get_search_backend(using='default'):
+    """Which full-text implementation is available for a database alias"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        return 'sqlite'
+    return 'fallback'
+
+
+def _postgres_query(tokens):
+    # Every token must match as a prefix so results follow the keystrokes
+    terms = [f"{token}:*" for token in tokens]
+    return ' & '.join(terms)
+
+
+def _fts5_query(tokens):
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(queryset, query, using='default'):
+    """
+    Restrict a Product queryset to products matching ``query`` and annotate
+    ``search_rank`` (higher is more relevant).
+    """
+    tokens = tokenize_query(query)
+    if not tokens:
+        return queryset
+
+    backend = get_search_backend(using)
+    if backend == 'postgresql':
+        search_query = _postgres_query(tokens)
+        matches = RawSQL(
+            f"SELECT d.product_id FROM {DOCUMENT_TABLE} d "
+            f"WHERE d.search_vector @@ to_tsquery('{SEARCH_CONFIG}', %s)",
+            [search_query]
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank_cd(d.search_vector, to_tsquery('{SEARCH_CONFIG}', %s)) "
+            f"FROM {DOCUMENT_TABLE} d WHERE d.product_id = products_product.id",
+            [search_query],
+            output_field=FloatField()
+        )
+    elif backend == 'sqlite':
+        search_query = _fts5_query(tokens)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        matches = RawSQL(
+            f"SELECT d.product_id FROM {FTS_TABLE} JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s",
+            [search_query]
+        )
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.product_id = products_product.id",
+            [search_query],
+            output_field=FloatField()
+        )
+    else:
+        from .models import ProductSearchDocument
+
+        condition = Q()
+        for token in tokens:
+            condition &= (
+                Q(title_text__icontains=token) | Q(keywords_text__icontains=token) |
+                Q(summary_text__icontains=token) | Q(body_text__icontains=token)
+            )
+        matches = ProductSearchDocument.objects.filter(condition).values('product_id')
+        rank = Value(0.0, output_field=FloatField())
+
+    return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+def build_search_documents(product_model, specification_model, document_model, product_ids=None):
+    """
+    Create or update search documents for the given products (all when None).
+
+    Takes the model classes so it can also run from migrations with historical models.
+    Returns the number of documents written.
+    """
+    products = product_model.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    rows = list(products.values(
+        'id', 'title', 'short_description', 'long_description', 'brand',
+        'category__name', 'subcategory__name', 'material__name'
+    ))
+    if not rows:
+        return 0
+
+    ids = [row['id'] for row in rows]
+    specifications = {}
+    for product_id, name, value in specification_model.objects.filter(
+        product_id__in=ids, is_active=True
+    ).order_by('sort_order').values_list('product_id', 'name', 'value'):
+        specifications.setdefault(product_id, []).append(f"{name} {value}")
+
+    existing = dict(document_model.objects.filter(product_id__in=ids).values_list('product_id', 'id'))
+    to_create = []
+    to_update = []
+    for row in rows:
+        document = document_model(
+            id=existing.get(row['id']),
+            product_id=row['id'],
+            title_text=row['title'] or '',
+            keywords_text=' '.join(filter(None, [row['brand'], row['category__name'], row['subcategory__name']])),
+            summary_text=' '.join(filter(None, [
+                row['short_description'], row['material__name'], *specifications.get(row['id'], [])
+            ])),
+            body_text=row['long_description'] or '',
+        )
+        (to_update if document.id else to_create).append(document)
+
+    if to_create:
+        document_model.objects.bulk_create(to_create, batch_size=500)
+    if to_update:
+        document_model.objects.bulk_update(
+            to_update, ['title_text', 'keywords_text', 'summary_text', 'body_text'], batch_size=500
+        )
+    return len(rows)
+
+
+def refresh_search_documents(product_ids=None):
+    """Rebuild search documents for products using the live models"""
+    from .models import Product, ProductSpecification, ProductSearchDocument
+
+    return build_search_documents(Product, ProductSpecification, ProductSearchDocument, product_ids)
@@ -1,8 +1,7 @@
 from rest_framework import serializers
-from django.db.models import Q
 from .models import (
     Category, Subcategory, Color, Material, Product, ProductImage, ProductVariant,
-    ProductVariantImage, ProductReview, ProductRecommendation, ProductSpecification, 
+    ProductVariantImage, ProductReview, ProductSpecification, 
     ProductFeature, ProductOffer, BrowsingHistory
 )
 
@@ -117,16 +116,134 @@ class ProductListSerializer(serializers.ModelSerializer):
         return obj.variants.filter(is_active=True).count()
     
     def get_review_count(self, obj):
-        """Get actual review count from database"""
-        return obj.reviews.filter(is_approved=True).count()
+        """Get approved review count stored on the product"""
+        return obj.review_count
     
     def get_average_rating(self, obj):
-        """Get actual average rating from database"""
-        from django.db.models import Avg
-        avg_rating = obj.reviews.filter(is_approved=True).aggregate(
-            avg_rating=Avg('rating')
-        )['avg_rating']
-        return round(float(avg_rating), 1) if avg_rating else 0.0
+        """Get average rating stored on the product"""
+        return round(float(obj.average_rating), 1) if obj.average_rating else 0.0
+
+
+class ProductCardListSerializer(serializers.ListSerializer):
+    """Load every card of a list with two projected queries"""
+    
+    def to_representation(self, data):
+        from django.db.models import QuerySet
+        
+        if isinstance(data, QuerySet):
+            product_ids = list(data.values_list('pk', flat=True))
+        else:
+            product_ids = [getattr(product, 'pk', product) for product in data]
+        cards = ProductCardSerializer.load_cards(product_ids)
+        return [cards[product_id] for product_id in product_ids if product_id in cards]
+
+
+class ProductCardSerializer(serializers.BaseSerializer):
+    """
+    Compact product card used wherever products are listed.
+    
+    Built from one value projection instead of model instances: the product
+    columns (with category, subcategory and material names joined) plus the
+    stored variant matrix, from which variants, colours and the variant count
+    are derived.
+    Nested single cards (cart, order and history items) read from
+    ``context['product_cards']`` when a view preloads it.
+    """
+    PRODUCT_FIELDS = (
+        'id', 'title', 'slug', 'short_description', 'main_image',
+        'price', 'old_price', 'is_on_sale', 'discount_percentage',
+        'average_rating', 'review_count', 'brand', 'is_featured', 'created_at',
+        'category_id', 'category__name', 'category__slug',
+        'subcategory_id', 'subcategory__name', 'subcategory__slug',
+        'material_id', 'material__name', 'variant_matrix__matrix',
+    )
+    
+    class Meta:
+        list_serializer_class = ProductCardListSerializer
+    
+    def to_representation(self, instance):
+        product_id = getattr(instance, 'pk', instance)
+        preloaded = self.context.get('product_cards') or {}
+        if product_id in preloaded:
+            return preloaded[product_id]
+        return self.load_cards([product_id]).get(product_id)
+    
+    @classmethod
+    def preload(cls, context, product_ids):
+        """Load cards for nested single-card fields once per response"""
+        cards = context.setdefault('product_cards', {})
+        missing = [product_id for product_id in set(product_ids) if product_id not in cards]
+        cards.update(cls.load_cards(missing))
+        return cards
+    
+    @staticmethod
+    def _decimal(value):
+        return str(value) if value is not None else None
+    
+    @classmethod
+    def load_cards(cls, product_ids):
+        """Build cards for the given product ids, keyed by id"""
+        if not product_ids:
+            return {}
+        datetime_field = serializers.DateTimeField()
+        rows = list(Product.objects.filter(pk__in=product_ids).values(*cls.PRODUCT_FIELDS))
+        # Products saved before the variant matrix existed get one built now
+        missing = [row['id'] for row in rows if 'variants' not in (row['variant_matrix__matrix'] or {})]
+        matrices = Product.refresh_variant_matrices(missing) if missing else {}
+        
+        cards = {}
+        for row in rows:
+            matrix = matrices.get(row['id']) or row['variant_matrix__matrix']
+            colors = {color['id']: color for color in matrix['colors']}
+            product_variants = [
+                {
+                    'id': variant['id'],
+                    'title': variant['title'],
+                    'color': colors[variant['color_id']],
+                    'size': variant['size'],
+                    'pattern': variant['pattern'],
+                    'price': variant['price'],
+                    'old_price': variant['old_price'],
+                    'stock_quantity': variant['stock_quantity'],
+                    'is_in_stock': variant['is_in_stock'],
+                    'image': variant['image'],
+                }
+                for variant in matrix['variants']
+            ]
+            cards[row['id']] = {
+                'id': row['id'],
+                'title': row['title'],
+                'slug': row['slug'],
+                'short_description': row['short_description'],
+                'main_image': row['main_image'],
+                'price': cls._decimal(row['price']),
+                'old_price': cls._decimal(row['old_price']),
+                'is_on_sale': row['is_on_sale'],
+                'discount_percentage': row['discount_percentage'],
+                'average_rating': round(float(row['average_rating']), 1) if row['average_rating'] else 0.0,
+                'review_count': row['review_count'],
+                'category': {
+                    'id': row['category_id'],
+                    'name': row['category__name'],
+                    'slug': row['category__slug'],
+                } if row['category_id'] else None,
+                'subcategory': {
+                    'id': row['subcategory_id'],
+                    'name': row['subcategory__name'],
+                    'slug': row['subcategory__slug'],
+                } if row['subcategory_id'] else None,
+                'brand': row['brand'],
+                'material': {
+                    'id': row['material_id'],
+                    'name': row['material__name'],
+                } if row['material_id'] else None,
+                'variants': product_variants,
+                'available_colors': [color['name'] for color in matrix['colors']],
+                'variant_count': len(product_variants),
+                'is_featured': row['is_featured'],
+                'created_at': datetime_field.to_representation(row['created_at']),
+            }
+        return cards
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -151,6 +268,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     available_colors = serializers.SerializerMethodField()
     available_sizes = serializers.SerializerMethodField()
     available_patterns = serializers.SerializerMethodField()
+    variant_matrix = serializers.SerializerMethodField()
     
     # Real review data
     review_count = serializers.SerializerMethodField()
@@ -168,115 +286,70 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             'images', 'variants', 'specifications', 'features', 'offers',
             'buy_with_products', 'inspired_products', 'frequently_viewed_products',
             'similar_products', 'recommended_products',
-            'available_colors', 'available_sizes', 'available_patterns',
+            'available_colors', 'available_sizes', 'available_patterns', 'variant_matrix',
             'meta_title', 'meta_description', 'is_featured', 'created_at', 'updated_at'
         ]
     
+    def _recommendations(self, obj):
+        """All recommendation types of the product, loaded once per serializer"""
+        from .recommendations import load_recommendations
+        
+        if not hasattr(self, '_recommendation_cache'):
+            self._recommendation_cache = {}
+        if obj.pk not in self._recommendation_cache:
+            self._recommendation_cache[obj.pk] = load_recommendations(obj.pk)
+        return self._recommendation_cache[obj.pk]
+    
     def get_buy_with_products(self, obj):
         """Get 'Buy with it' recommended products"""
-        recommendations = ProductRecommendation.objects.filter(
-            product=obj,
-            recommendation_type='buy_with',
-            is_active=True
-        ).select_related('recommended_product')[:10]
-        
-        return ProductListSerializer([rec.recommended_product for rec in recommendations], many=True).data
+        return self._recommendations(obj)['buy_with']
     
     def get_inspired_products(self, obj):
         """Get 'Inspired by browsing history' products"""
-        recommendations = ProductRecommendation.objects.filter(
-            product=obj,
-            recommendation_type='inspired_by',
-            is_active=True
-        ).select_related('recommended_product')[:10]
-        
-        return ProductListSerializer([rec.recommended_product for rec in recommendations], many=True).data
+        return self._recommendations(obj)['inspired_by']
     
     def get_frequently_viewed_products(self, obj):
         """Get frequently viewed products"""
-        recommendations = ProductRecommendation.objects.filter(
-            product=obj,
-            recommendation_type='frequently_viewed',
-            is_active=True
-        ).select_related('recommended_product')[:10]
-        
-        return ProductListSerializer([rec.recommended_product for rec in recommendations], many=True).data
+        return self._recommendations(obj)['frequently_viewed']
     
     def get_similar_products(self, obj):
         """Get similar products"""
-        recommendations = ProductRecommendation.objects.filter(
-            product=obj,
-            recommendation_type='similar',
-            is_active=True
-        ).select_related('recommended_product')[:10]
-        
-        return ProductListSerializer([rec.recommended_product for rec in recommendations], many=True).data
+        return self._recommendations(obj)['similar']
     
     def get_recommended_products(self, obj):
         """Get recommended products"""
-        recommendations = ProductRecommendation.objects.filter(
-            product=obj,
-            recommendation_type='recommended',
-            is_active=True
-        ).select_related('recommended_product')[:10]
-        
-        return ProductListSerializer([rec.recommended_product for rec in recommendations], many=True).data
+        return self._recommendations(obj)['recommended']
+    
+    def get_variant_matrix(self, obj):
+        """Colour x size x pattern index of the active variants"""
+        return obj.get_variant_matrix()
     
     def get_available_colors(self, obj):
         """Get available colors for this product"""
-        colors = obj.variants.filter(is_active=True).values('color__id', 'color__name', 'color__hex_code').distinct()
-        return list(colors)
+        return [
+            {'color__id': color['id'], 'color__name': color['name'], 'color__hex_code': color['hex_code']}
+            for color in obj.get_variant_matrix()['colors']
+        ]
     
     def get_available_sizes(self, obj):
         """Get available sizes for this product"""
-        sizes = obj.variants.filter(is_active=True).values_list('size', flat=True).distinct()
-        return [size for size in sizes if size]
+        return obj.get_variant_matrix()['sizes']
     
     def get_available_patterns(self, obj):
         """Get available patterns for this product"""
-        patterns = obj.variants.filter(is_active=True).values_list('pattern', flat=True).distinct()
-        return [pattern for pattern in patterns if pattern]
+        return obj.get_variant_matrix()['patterns']
     
     def get_review_count(self, obj):
-        """Get actual review count from database"""
-        return obj.reviews.filter(is_approved=True).count()
+        """Get approved review count stored on the product"""
+        return obj.review_count
     
     def get_average_rating(self, obj):
-        """Get actual average rating from database"""
-        from django.db.models import Avg
-        avg_rating = obj.reviews.filter(is_approved=True).aggregate(
-            avg_rating=Avg('rating')
-        )['avg_rating']
-        return round(float(avg_rating), 1) if avg_rating else 0.0
+        """Get average rating stored on the product"""
+        return round(float(obj.average_rating), 1) if obj.average_rating else 0.0
     
     def get_review_percentages(self, obj):
         """Get review percentage breakdown by star rating"""
-        from django.db.models import Count
-        from django.db.models import Case, When, IntegerField
-        
-        # Get review counts by rating
-        rating_counts = obj.reviews.filter(is_approved=True).aggregate(
-            five_star=Count('id', filter=Q(rating=5)),
-            four_star=Count('id', filter=Q(rating=4)),
-            three_star=Count('id', filter=Q(rating=3)),
-            two_star=Count('id', filter=Q(rating=2)),
-            one_star=Count('id', filter=Q(rating=1)),
-            total=Count('id')
-        )
-        
-        total_reviews = rating_counts['total']
-        if total_reviews == 0:
-            return {
-                '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
-            }
-        
-        return {
-            '5': round((rating_counts['five_star'] / total_reviews) * 100, 1),
-            '4': round((rating_counts['four_star'] / total_reviews) * 100, 1),
-            '3': round((rating_counts['three_star'] / total_reviews) * 100, 1),
-            '2': round((rating_counts['two_star'] / total_reviews) * 100, 1),
-            '1': round((rating_counts['one_star'] / total_reviews) * 100, 1),
-        }
+        return obj.get_review_percentages()
 
 
 class ProductReviewSerializer(serializers.ModelSerializer):
@@ -348,7 +421,7 @@ class ProductFilterSerializer(serializers.Serializer):
 
 class BrowsingHistorySerializer(serializers.ModelSerializer):
     """Serializer for browsing history"""
-    product = ProductListSerializer(read_only=True)
+    product = ProductCardSerializer(source='product_id', read_only=True)
     category = CategorySerializer(read_only=True)
     subcategory = SubcategorySerializer(read_only=True)
     
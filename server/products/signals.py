@@ -0,0 +1,287 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_cache_version
+from .filters import ProductAggregationFilter
+from .models import (
+    Category, Subcategory, Color, Material, Product, ProductVariant, ProductReview, Discount,
+    ProductSpecification, BrowsingHistory, ProductOffer, ProductImage, ProductVariantImage,
+    ProductFeature, ProductRecommendation, Coupon, refresh_catalog_stats
+)
+from accounts.models import User, Vendor
+from orders.models import Order, OrderItem
+from admin_api.models import HomePageContent, BulkOrderPageContent
+from .search import refresh_search_documents
+from .suggestions import suggestion_index
+from .coupons import coupon_table
+from . import personalization
+
+
+def _refresh_product_reviews(product_id):
+    """Recompute the stored review aggregates for a single product"""
+    if not product_id:
+        return
+    product = Product.objects.filter(pk=product_id).only('id').first()
+    if product:
+        product.refresh_review_aggregates()
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_product(sender, instance, **kwargs):
+    """Remember the previous product so moved reviews update both products"""
+    instance._previous_product_id = None
+    if instance.pk:
+        instance._previous_product_id = (
+            ProductReview.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_review_aggregates_on_save(sender, instance, raw=False, **kwargs):
+    """Keep Product review columns current when a review is created, edited or approved"""
+    if raw:
+        return
+    _refresh_product_reviews(instance.product_id)
+    previous_product_id = getattr(instance, '_previous_product_id', None)
+    if previous_product_id and previous_product_id != instance.product_id:
+        _refresh_product_reviews(previous_product_id)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_review_aggregates_on_delete(sender, instance, **kwargs):
+    """Keep Product review columns current when a review is deleted"""
+    _refresh_product_reviews(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def update_variant_matrix(sender, instance, raw=False, **kwargs):
+    """Keep the product's variant matrix current when a variant or its stock changes"""
+    if raw:
+        return
+    Product.refresh_variant_matrices([instance.product_id])
+
+
+@receiver(post_save, sender=Color)
+def update_variant_matrices_for_color(sender, instance, created=False, raw=False, **kwargs):
+    """Colour names and codes are copied into the matrices of products using the colour"""
+    if raw or created:
+        return
+    Product.refresh_variant_matrices(list(
+        ProductVariant.objects.filter(color=instance).order_by().values_list('product_id', flat=True).distinct()
+    ))
+
+
+# Product fields the category/subcategory/material statistics depend on
+CATALOG_STATS_FIELDS = ('category_id', 'subcategory_id', 'material_id', 'price', 'is_active')
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_grouping(sender, instance, **kwargs):
+    """Remember the previous grouping and price so moved products update both sides"""
+    instance._previous_catalog_stats = None
+    if instance.pk:
+        instance._previous_catalog_stats = (
+            Product.objects.filter(pk=instance.pk).values_list(*CATALOG_STATS_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_catalog_stats_on_product_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_catalog_stats', None)
+    current = tuple(getattr(instance, field) for field in CATALOG_STATS_FIELDS)
+    if not created and previous == current:
+        return
+    previous = previous or (None,) * len(CATALOG_STATS_FIELDS)
+    refresh_catalog_stats(
+        category_ids={previous[0], current[0]},
+        subcategory_ids={previous[1], current[1]},
+        material_ids={previous[2], current[2]},
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_variant_matrix_on_price_change(sender, instance, created=False, raw=False, **kwargs):
+    """Variants without their own price show the product price, copied into the matrix"""
+    if raw or created:
+        return
+    previous = getattr(instance, '_previous_catalog_stats', None)
+    if previous is not None and previous[CATALOG_STATS_FIELDS.index('price')] != instance.price:
+        instance.refresh_variant_matrix()
+
+
+@receiver(post_delete, sender=Product)
+def update_catalog_stats_on_product_delete(sender, instance, **kwargs):
+    refresh_catalog_stats([instance.category_id], [instance.subcategory_id], [instance.material_id])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def update_catalog_stats_on_variant_change(sender, instance, raw=False, **kwargs):
+    """Variant counts are part of the statistics"""
+    if raw:
+        return
+    grouping = Product.objects.filter(pk=instance.product_id).values_list(
+        'category_id', 'subcategory_id', 'material_id'
+    ).first()
+    if grouping:
+        refresh_catalog_stats([grouping[0]], [grouping[1]], [grouping[2]])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_save, sender=Material)
+def create_catalog_stats(sender, instance, created=False, raw=False, **kwargs):
+    """New categories, subcategories and materials start with an empty statistics row"""
+    if raw or not created:
+        return
+    sender.stats.related.related_model.refresh([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductReview)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subcategory)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Material)
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_filter_options(sender, **kwargs):
+    """Cached facet counts depend on the catalog; drop them when it changes"""
+    bump_cache_version(ProductAggregationFilter.CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=Product)
+def update_search_document(sender, instance, raw=False, **kwargs):
+    """Rebuild the product's search document when its text changes"""
+    if raw:
+        return
+    refresh_search_documents([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def update_search_document_for_specification(sender, instance, raw=False, **kwargs):
+    """Specifications are part of the searchable summary text"""
+    if raw:
+        return
+    if Product.objects.filter(pk=instance.product_id).exists():
+        refresh_search_documents([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_save, sender=Material)
+def update_search_documents_for_taxonomy(sender, instance, raw=False, **kwargs):
+    """Renaming a category, subcategory or material changes every linked document"""
+    if raw:
+        return
+    lookup = {Category: 'category', Subcategory: 'subcategory', Material: 'material'}[sender]
+    product_ids = list(Product.objects.filter(**{lookup: instance}).values_list('pk', flat=True))
+    if product_ids:
+        refresh_search_documents(product_ids)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def update_product_suggestions(sender, instance, **kwargs):
+    """Keep the autocomplete index in step with product titles and visibility"""
+    suggestion_index.refresh_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def update_category_suggestions(sender, instance, **kwargs):
+    suggestion_index.refresh_category(instance.pk)
+
+
+@receiver(post_save, sender=Subcategory)
+def update_subcategory_suggestions(sender, instance, **kwargs):
+    suggestion_index.refresh_subcategories([instance.pk])
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Subcategory)
+def remove_taxonomy_suggestion(sender, instance, **kwargs):
+    suggestion_index.remove(sender.__name__.lower(), instance.pk)
+
+
+@receiver(post_save, sender=BrowsingHistory)
+def update_affinity_on_view(sender, instance, raw=False, **kwargs):
+    """Each recorded product view nudges the viewer's category/brand affinity"""
+    if raw:
+        return
+    personalization.add_product_affinity(instance.user_id, instance.product_id, personalization.VIEW_WEIGHT)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_affinity_on_purchase(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    user_id = Order.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+    if user_id:
+        personalization.add_product_affinity(
+            user_id, instance.product_id, personalization.ORDER_WEIGHT * instance.quantity
+        )
+
+
+@receiver(post_save, sender=Order)
+def invalidate_affinity_on_order_update(sender, instance, created=False, **kwargs):
+    """Cancelled and returned orders stop counting towards affinity"""
+    if not created and instance.status in ('cancelled', 'returned'):
+        personalization.invalidate_user_affinity(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_affinity_on_interests_change(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'interests' not in update_fields):
+        return
+    personalization.invalidate_user_affinity(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Coupon)
+@receiver(post_save, sender=Vendor)
+def invalidate_coupon_table(sender, raw=False, **kwargs):
+    if not raw:
+        coupon_table.invalidate()
+
+
+# Response cache namespaces (see cache_response in products/views.py) each model feeds
+RESPONSE_CACHE_NAMESPACES = {
+    Product: ('products',),
+    ProductVariant: ('products',),
+    ProductReview: ('products',),
+    Category: ('products', 'categories'),
+    Subcategory: ('products', 'categories'),
+    Color: ('products', 'colors'),
+    Material: ('products', 'materials'),
+    ProductOffer: ('offers',),
+    Vendor: ('brands',),
+    # Only embedded in the product detail payload
+    ProductImage: ('product_details',),
+    ProductVariantImage: ('product_details',),
+    ProductSpecification: ('product_details',),
+    ProductFeature: ('product_details',),
+    ProductRecommendation: ('product_details',),
+    HomePageContent: ('homepage_content',),
+    BulkOrderPageContent: ('bulk_order_content',),
+}
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductReview)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subcategory)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Material)
+@receiver([post_save, post_delete], sender=ProductOffer)
+@receiver([post_save, post_delete], sender=Vendor)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductVariantImage)
+@receiver([post_save, post_delete], sender=ProductSpecification)
+@receiver([post_save, post_delete], sender=ProductFeature)
+@receiver([post_save, post_delete], sender=ProductRecommendation)
+@receiver([post_save, post_delete], sender=HomePageContent)
+@receiver([post_save, post_delete], sender=BulkOrderPageContent)
+def invalidate_cached_responses(sender, **kwargs):
+    """Cached public responses and their validators are kept until the data behind them changes"""
+    for namespace in RESPONSE_CACHE_NAMESPACES[sender]:
+        bump_cache_version(namespace)
@@ -0,0 +1,171 @@
+"""
+Content-based "similar products".
+
+Every active product gets a sparse feature set (category, subcategory, material,
+price band, variant colours and specification tokens) that is turned into an
+L2-normalized NumPy matrix, so cosine similarity of a batch of products against
+the whole catalog is one matrix product. The top neighbours are stored as
+generated ``similar`` ProductRecommendation rows and served by
+``recommendations.load_recommendations``.
+
+Incremental runs only recompute products changed since the previous run plus
+the products whose stored neighbour lists those changes can affect.
+"""
+import math
+from collections import Counter
+
+import numpy as np
+from django.db.models import Count, Min
+
+from .models import Product, ProductVariant, ProductSpecification, ProductRecommendation
+from .suggestions import tokenize
+
+RECOMMENDATION_TYPE = 'similar'
+LAST_RUN_SETTING = 'similar_products_last_run'
+
+# Relative weight of each feature group
+FEATURE_WEIGHTS = {
+    'category': 1.0,
+    'subcategory': 2.0,
+    'material': 1.0,
+    'price': 1.0,
+    'color': 1.0,
+    'spec': 1.5,
+}
+MIN_SCORE = 0.2
+
+
+def _price_band(price):
+    """Half-octave price bands (each band is ~1.4x the previous one)"""
+    return int(math.log2(max(float(price), 1.0)) * 2)
+
+
+def _spread(features, prefix, values, weight):
+    """Add a multi-valued feature group without letting its size dominate"""
+    values = set(values)
+    if values:
+        share = weight / math.sqrt(len(values))
+        for value in values:
+            features[f'{prefix}:{value}'] = share
+
+
+def product_features():
+    """Map every active product id to a ``{feature: weight}`` dict"""
+    colors = {}
+    for product_id, color_id in ProductVariant.objects.filter(
+        is_active=True, product__is_active=True
+    ).values_list('product_id', 'color_id').distinct():
+        colors.setdefault(product_id, []).append(color_id)
+
+    specs = {}
+    for product_id, name, value in ProductSpecification.objects.filter(
+        is_active=True, product__is_active=True
+    ).values_list('product_id', 'name', 'value'):
+        name = ' '.join(tokenize(name))
+        specs.setdefault(product_id, []).extend(f'{name}={token}' for token in tokenize(value))
+
+    features = {}
+    for product_id, category_id, subcategory_id, material_id, price in Product.objects.filter(
+        is_active=True
+    ).values_list('id', 'category_id', 'subcategory_id', 'material_id', 'price').iterator():
+        product = {f'category:{category_id}': FEATURE_WEIGHTS['category']}
+        if subcategory_id:
+            product[f'subcategory:{subcategory_id}'] = FEATURE_WEIGHTS['subcategory']
+        if material_id:
+            product[f'material:{material_id}'] = FEATURE_WEIGHTS['material']
+        # Neighbouring price bands still count for half
+        band = _price_band(price)
+        product[f'price:{band}'] = FEATURE_WEIGHTS['price']
+        product[f'price:{band - 1}'] = FEATURE_WEIGHTS['price'] / 2
+        product[f'price:{band + 1}'] = FEATURE_WEIGHTS['price'] / 2
+        _spread(product, 'color', colors.get(product_id, ()), FEATURE_WEIGHTS['color'])
+        _spread(product, 'spec', specs.get(product_id, ()), FEATURE_WEIGHTS['spec'])
+        features[product_id] = product
+    return features
+
+
+def build_matrix(features):
+    """
+    Product ids and their L2-normalized feature matrix (float32).
+
+    Features held by a single product cannot make two products similar, so
+    their columns are dropped after they have been counted in the norm.
+    """
+    ids = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+    document_frequency = Counter(name for product in features.values() for name in product)
+    columns = {}
+    for name, frequency in document_frequency.items():
+        if frequency > 1:
+            columns[name] = len(columns)
+
+    matrix = np.zeros((len(ids), max(len(columns), 1)), dtype=np.float32)
+    for row, product in enumerate(features.values()):
+        norm = math.sqrt(sum(weight * weight for weight in product.values())) or 1.0
+        for name, weight in product.items():
+            column = columns.get(name)
+            if column is not None:
+                matrix[row, column] = weight / norm
+    return ids, matrix
+
+
+def top_neighbours(ids, matrix, rows, top_k=10, batch_size=256, min_score=MIN_SCORE):
+    """Yield ``(product_id, [(other_id, score), ...])`` best first for the given matrix rows"""
+    k = min(top_k, len(ids) - 1)
+    if k <= 0:
+        return
+    for start in range(0, len(rows), batch_size):
+        batch = np.asarray(rows[start:start + batch_size])
+        scores = matrix[batch] @ matrix.T
+        scores[np.arange(len(batch)), batch] = -1.0
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        for position, row in enumerate(batch):
+            keep = candidate_scores[position] >= min_score
+            yield int(ids[row]), [
+                (int(ids[column]), round(float(score), 6))
+                for column, score in zip(candidates[position][keep], candidate_scores[position][keep])
+            ]
+
+
+def changed_products(since):
+    """Ids of products (active or not) whose features may have changed since ``since``"""
+    changed = set(Product.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+    changed.update(ProductVariant.objects.filter(updated_at__gte=since).values_list('product_id', flat=True))
+    changed.update(ProductSpecification.objects.filter(created_at__gte=since).values_list('product_id', flat=True))
+    return changed
+
+
+def affected_rows(ids, matrix, changed_ids, top_k=10, batch_size=256, min_score=MIN_SCORE):
+    """
+    Matrix rows to recompute after ``changed_ids`` changed: the changed products
+    themselves, products that list one of them as a neighbour, and products for
+    which a changed product now beats their weakest stored neighbour.
+    """
+    index = {int(product_id): row for row, product_id in enumerate(ids)}
+    generated = ProductRecommendation.objects.filter(recommendation_type=RECOMMENDATION_TYPE, source='generated')
+
+    affected = {index[product_id] for product_id in changed_ids if product_id in index}
+    listing = generated.filter(recommended_product_id__in=changed_ids).values_list('product_id', flat=True)
+    affected.update(index[product_id] for product_id in listing if product_id in index)
+
+    changed_rows = sorted(index[product_id] for product_id in changed_ids if product_id in index)
+    if changed_rows:
+        # Weakest stored score per product; lists shorter than top_k accept anything above min_score
+        thresholds = np.full(len(ids), min_score, dtype=np.float32)
+        for product_id, weakest, listed in generated.order_by().values('product_id').annotate(
+            weakest=Min('score'), listed=Count('id')
+        ).values_list('product_id', 'weakest', 'listed'):
+            if product_id in index and listed >= top_k:
+                thresholds[index[product_id]] = max(weakest, min_score)
+
+        best = np.full(len(ids), -1.0, dtype=np.float32)
+        for start in range(0, len(changed_rows), batch_size):
+            batch = np.asarray(changed_rows[start:start + batch_size])
+            scores = matrix[batch] @ matrix.T
+            scores[np.arange(len(batch)), batch] = -1.0
+            best = np.maximum(best, scores.max(axis=0))
+        affected.update(int(row) for row in np.nonzero(best > thresholds)[0])
+    return sorted(affected)
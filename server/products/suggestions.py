@@ -0,0 +1,336 @@
+"""
+In-process prefix index for search-box autocomplete.
+
+Active product titles, category names and subcategory names are tokenized into
+a sorted token list, so a keystroke is answered with a couple of bisects and set
+intersections instead of database queries.
+
+The index is built on first use and patched by products/signals.py once a
+change to a product, category or subcategory commits. Other worker processes
+notice the change through a shared cache version and rebuild on their next
+lookup (checked at most every ``VERSION_CHECK_INTERVAL`` seconds).
+"""
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.db import transaction
+
+from .cache import get_cache_version, bump_cache_version
+
+CACHE_NAMESPACE = 'search_suggestions'
+VERSION_CHECK_INTERVAL = 30
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Per-type result limits and ordering (matches the previous database implementation)
+TYPE_LIMITS = (('product', 10), ('category', 5), ('subcategory', 5))
+MAX_SUGGESTIONS = 15
+
+# Typo tolerance only kicks in for tokens at least this long
+MIN_FUZZY_LENGTH = 4
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def _within_one_edit(a, b):
+    """True when a and b differ by at most one insert, delete, substitution or transposition"""
+    if a == b:
+        return True
+    length_a, length_b = len(a), len(b)
+    if abs(length_a - length_b) > 1:
+        return False
+    if length_a > length_b:
+        a, b, length_a, length_b = b, a, length_b, length_a
+    index = 0
+    while index < length_a and a[index] == b[index]:
+        index += 1
+    if length_a == length_b:
+        if a[index + 1:] == b[index + 1:]:
+            return True
+        # Adjacent transposition
+        return (
+            index + 1 < length_a and a[index] == b[index + 1] and a[index + 1] == b[index]
+            and a[index + 2:] == b[index + 2:]
+        )
+    return a[index:] == b[index + 1:]
+
+
+class SuggestionIndex:
+    """Token -> entry index over products, categories and subcategories"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._version = None
+        self._checked_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._entries = {}          # (type, id) -> suggestion entry
+        self._postings = {}         # token -> set of (type, id)
+        self._tokens = []           # sorted list of posting keys
+
+    def build(self):
+        """(Re)build the whole index from the database"""
+        from django.db.models import Count, Q
+        from .models import Category, Subcategory, Product
+
+        version = get_cache_version(CACHE_NAMESPACE)
+        active_products = Q(products__is_active=True)
+        categories = Category.objects.filter(is_active=True).annotate(
+            product_count=Count('products', filter=active_products)
+        ).values_list('id', 'name', 'slug', 'product_count')
+        subcategories = Subcategory.objects.filter(is_active=True).annotate(
+            product_count=Count('products', filter=active_products)
+        ).values_list('id', 'name', 'slug', 'category__name', 'product_count')
+        products = Product.objects.filter(is_active=True).values_list(
+            'id', 'title', 'slug', 'category__name', 'subcategory__name', 'review_count', 'is_featured'
+        )
+
+        with self._lock:
+            self._reset()
+            for row in categories:
+                self._add(self._category_entry(*row))
+            for row in subcategories:
+                self._add(self._subcategory_entry(*row))
+            for row in products:
+                self._add(self._product_entry(*row))
+            self._built = True
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def ensure_current(self):
+        """Build on first use; rebuild when another process changed the catalog"""
+        now = time.monotonic()
+        if self._built and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        if not self._built or get_cache_version(CACHE_NAMESPACE) != self._version:
+            self.build()
+        else:
+            self._checked_at = now
+
+    @staticmethod
+    def _category_entry(pk, name, slug, product_count):
+        return {
+            'key': ('category', pk),
+            'type': 'category',
+            'title': name,
+            'subtitle': 'Category',
+            'slug': slug,
+            'tokens': set(tokenize(name)),
+            'weight': math.log1p(product_count),
+        }
+
+    @staticmethod
+    def _subcategory_entry(pk, name, slug, category_name, product_count):
+        return {
+            'key': ('subcategory', pk),
+            'type': 'subcategory',
+            'title': name,
+            'subtitle': f"in {category_name}",
+            'slug': slug,
+            'tokens': set(tokenize(name)),
+            'weight': math.log1p(product_count),
+        }
+
+    @staticmethod
+    def _product_entry(pk, title, slug, category_name, subcategory_name, review_count, is_featured):
+        # Products are also found through their category and subcategory names
+        return {
+            'key': ('product', pk),
+            'type': 'product',
+            'title': title,
+            'subtitle': category_name,
+            'slug': slug,
+            'tokens': set(tokenize(title)) | set(tokenize(category_name)) | set(tokenize(subcategory_name)),
+            'weight': math.log1p(review_count) + (1.0 if is_featured else 0.0),
+        }
+
+    def _add(self, entry):
+        key = entry['key']
+        self._entries[key] = entry
+        for token in entry['tokens']:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                insort(self._tokens, token)
+            postings.add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry['tokens']:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(key)
+            if not postings:
+                del self._postings[token]
+                index = bisect_left(self._tokens, token)
+                if index < len(self._tokens) and self._tokens[index] == token:
+                    del self._tokens[index]
+
+    def _on_commit(self, patch):
+        """
+        Advance the shared version and run ``patch`` against this process's
+        index once the writing transaction commits, so the patch reads committed
+        rows and a rollback leaves the index untouched
+        """
+        bump_cache_version(CACHE_NAMESPACE)
+        transaction.on_commit(lambda: self._apply(patch))
+
+    def _apply(self, patch):
+        if not self._built:
+            return
+        patch()
+        # Registered after the bump, so this process is up to date with it
+        self._version = get_cache_version(CACHE_NAMESPACE)
+        self._checked_at = time.monotonic()
+
+    def _patch_products(self, product_ids):
+        from .models import Product
+
+        rows = list(Product.objects.filter(pk__in=product_ids, is_active=True).values_list(
+            'id', 'title', 'slug', 'category__name', 'subcategory__name', 'review_count', 'is_featured'
+        ))
+        with self._lock:
+            for product_id in product_ids:
+                self._remove(('product', product_id))
+            for row in rows:
+                self._add(self._product_entry(*row))
+
+    def _patch_subcategories(self, subcategory_ids):
+        from django.db.models import Count, Q
+        from .models import Subcategory
+
+        rows = list(Subcategory.objects.filter(pk__in=subcategory_ids, is_active=True).annotate(
+            product_count=Count('products', filter=Q(products__is_active=True))
+        ).values_list('id', 'name', 'slug', 'category__name', 'product_count'))
+        with self._lock:
+            for pk in subcategory_ids:
+                self._remove(('subcategory', pk))
+            for row in rows:
+                self._add(self._subcategory_entry(*row))
+
+    def refresh_products(self, product_ids):
+        """Re-index the given products (removing inactive or deleted ones)"""
+        self._on_commit(lambda: self._patch_products(product_ids))
+
+    def refresh_category(self, category_id):
+        """Re-index a category, its subcategories and the products that display its name"""
+        from django.db.models import Count, Q
+        from .models import Category, Subcategory, Product
+
+        def patch():
+            row = Category.objects.filter(pk=category_id, is_active=True).annotate(
+                product_count=Count('products', filter=Q(products__is_active=True))
+            ).values_list('id', 'name', 'slug', 'product_count').first()
+            with self._lock:
+                self._remove(('category', category_id))
+                if row:
+                    self._add(self._category_entry(*row))
+            self._patch_subcategories(list(
+                Subcategory.objects.filter(category_id=category_id).values_list('pk', flat=True)
+            ))
+            self._patch_products(list(Product.objects.filter(category_id=category_id).values_list('pk', flat=True)))
+
+        self._on_commit(patch)
+
+    def refresh_subcategories(self, subcategory_ids):
+        """Re-index subcategories and the products that are also found through their names"""
+        from .models import Product
+
+        def patch():
+            self._patch_subcategories(subcategory_ids)
+            self._patch_products(list(
+                Product.objects.filter(subcategory_id__in=subcategory_ids).values_list('pk', flat=True)
+            ))
+
+        self._on_commit(patch)
+
+    def remove(self, kind, pk):
+        def patch():
+            with self._lock:
+                self._remove((kind, pk))
+
+        self._on_commit(patch)
+
+    def _prefix_matches(self, token):
+        """Keys of entries having a token that starts with ``token``"""
+        keys = set()
+        index = bisect_left(self._tokens, token)
+        while index < len(self._tokens) and self._tokens[index].startswith(token):
+            keys |= self._postings[self._tokens[index]]
+            index += 1
+        return keys
+
+    def _fuzzy_matches(self, token, prefix):
+        """Keys of entries with a token within one edit of ``token`` (or of its prefix)"""
+        keys = set()
+        # Only scan tokens sharing the first letter; typos there are rare
+        index = bisect_left(self._tokens, token[0])
+        while index < len(self._tokens) and self._tokens[index].startswith(token[0]):
+            candidate = self._tokens[index]
+            if prefix:
+                candidate = candidate[:len(token) + 1]
+                matched = _within_one_edit(token, candidate) or _within_one_edit(token, candidate[:len(token)])
+            else:
+                matched = _within_one_edit(token, candidate)
+            if matched:
+                keys |= self._postings[self._tokens[index]]
+            index += 1
+        return keys
+
+    def suggest(self, query, fuzzy=True):
+        """Suggestions for a partially typed query, best first within each type"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        self.ensure_current()
+        with self._lock:
+            matches = None
+            typo_penalty = 0.0
+            for position, token in enumerate(tokens):
+                # Every token may be a prefix: it is common to type "woo sof"
+                keys = self._prefix_matches(token)
+                if not keys and fuzzy and len(token) >= MIN_FUZZY_LENGTH:
+                    keys = self._fuzzy_matches(token, prefix=position == len(tokens) - 1)
+                    typo_penalty += 1.0
+                matches = keys if matches is None else matches & keys
+                if not matches:
+                    return []
+
+            phrase = ' '.join(tokens)
+            by_type = {}
+            for key in matches:
+                entry = self._entries[key]
+                title = entry['title'].lower()
+                if title.startswith(phrase):
+                    quality = 3.0
+                elif any(token.startswith(tokens[0]) for token in tokenize(title)):
+                    quality = 2.0
+                else:
+                    quality = 1.0
+                score = quality + entry['weight'] - typo_penalty
+                by_type.setdefault(entry['type'], []).append((-score, entry['title'], entry))
+
+        suggestions = []
+        for kind, limit in TYPE_LIMITS:
+            for _, _, entry in sorted(by_type.get(kind, []), key=lambda item: item[:2])[:limit]:
+                suggestions.append({
+                    'type': entry['type'],
+                    'title': entry['title'],
+                    'subtitle': entry['subtitle'],
+                    'slug': entry['slug'],
+                })
+        return suggestions[:MAX_SUGGESTIONS]
+
+
+suggestion_index = SuggestionIndex()
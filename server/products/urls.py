@@ -6,13 +6,17 @@ app_name = 'products'
 urlpatterns = [
     # Product listing and detail
     path('products/', views.ProductListView.as_view(), name='product-list'),
-    path('products/<slug:slug>/', views.ProductDetailView.as_view(), name='product-detail'),
     
-    # Search
+    # Search (before the detail route so the slug pattern does not swallow them)
     path('products/search/', views.ProductSearchView.as_view(), name='product-search'),
     path('products/advanced-search/', views.ProductListView.as_view(), name='advanced-search'),
     path('search/suggestions/', views.get_search_suggestions, name='search-suggestions'),
     
+    # Special product lists (also before the detail route)
+    path('products/featured/', views.get_featured_products, name='featured-products'),
+    path('products/new-arrivals/', views.get_new_arrivals, name='new-arrivals'),
+    path('products/<slug:slug>/', views.ProductDetailView.as_view(), name='product-detail'),
+    
     # Categories and filters
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('categories/<slug:category_slug>/subcategories/', views.SubcategoryListView.as_view(), name='subcategory-list'),
@@ -21,9 +25,7 @@ urlpatterns = [
     path('filter-options/', views.get_filter_options, name='filter-options'),
     path('brands/', views.get_brands, name='brands-list'),
     
-    # Special product lists
-    path('products/featured/', views.get_featured_products, name='featured-products'),
-    path('products/new-arrivals/', views.get_new_arrivals, name='new-arrivals'),
+    # Home page
     path('home-data/', views.get_home_data, name='home-data'),
     path('homepage-content/', views.get_homepage_content, name='homepage-content'),
     path('bulk-order-page-content/', views.get_bulk_order_page_content, name='bulk-order-page-content'),
@@ -40,6 +42,7 @@ urlpatterns = [
     
     path('browsing-history/track/', views.track_browsing_history, name='track-browsing-history'),
     path('browsing-history/categories/', views.get_browsed_categories, name='browsed-categories'),
+    path('browsing-history/inspired-by/', views.get_inspired_by_feed, name='inspired-by-feed'),
     path('browsing-history/clear/', views.clear_browsing_history, name='clear-browsing-history'),
     path('browsing-history/', views.get_browsing_history, name='browsing-history'),
 ]
\ No newline at end of file
@@ -4,23 +4,30 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Count, Prefetch, Min, Max
+from django.db.models import Q, Count, Prefetch, Min, Max
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 
 from .models import (
     Product, Category, Subcategory, Color, Material, ProductVariant, ProductVariantImage,
-    ProductReview, ProductRecommendation, ProductSpecification,
+    ProductReview, ProductSpecification,
     ProductFeature, ProductOffer, BrowsingHistory, Discount
 )
 from accounts.models import Vendor
 from .serializers import (
-    ProductListSerializer, ProductDetailSerializer, ProductSearchSerializer,
+    ProductCardSerializer, ProductDetailSerializer, ProductSearchSerializer,
     CategorySerializer, SubcategorySerializer, ColorSerializer, MaterialSerializer,
     ProductReviewSerializer, ProductFilterSerializer, ProductOfferSerializer,
     BrowsingHistorySerializer
 )
-from .filters import ProductFilter, ProductSortFilter, ProductAggregationFilter
+from .filters import ProductFilter, ProductSortFilter, ProductAggregationFilter, ProductSearchFilter
+from .pagination import CursorPaginationMixin
+from .recommendations import load_recommendations, inspired_by_feed, FEED_LIMIT
+from .history import view_buffer
+from .cache import cache_response, conditional_on, namespace_validators
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -30,25 +37,18 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(CursorPaginationMixin, generics.ListAPIView):
     """Product listing with advanced filtering and sorting"""
-    serializer_class = ProductListSerializer
+    serializer_class = ProductCardSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_class = ProductFilter
-    search_fields = ['title', 'short_description', 'category__name', 'subcategory__name', 'brand', 'material']
     ordering_fields = ['price', 'created_at', 'average_rating', 'review_count']
-    ordering = ['-created_at']
     
     def get_queryset(self):
         """Get products with optimized queries"""
-        queryset = Product.objects.filter(is_active=True).select_related(
-            'category', 'subcategory'
-        ).prefetch_related(
-            'images',
-            'reviews',
-            Prefetch('variants', queryset=ProductVariant.objects.filter(is_active=True).select_related('color').prefetch_related('images'))
-        )
+        # Cards are loaded by ProductCardSerializer, so no related rows are prefetched here
+        queryset = Product.objects.filter(is_active=True)
         
         # Apply sorting
         sort_option = self.request.query_params.get('sort', 'relevance')
@@ -59,154 +59,38 @@ class ProductListView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         """Override list to include filter options and expand variants"""
         queryset = self.filter_queryset(self.get_queryset())
-        
-        # Check if we should prioritize products from user's interest categories
-        # Only if user is authenticated, has interests (category names), and no category filter/search is applied
-        user_interest_category_ids = []
-        if request.user.is_authenticated:
-            user_interests = request.user.interests or []
-            if isinstance(user_interests, str):
-                import json
-                try:
-                    user_interests = json.loads(user_interests)
-                except:
-                    user_interests = []
-            
-            # Convert category names to category IDs
-            if user_interests and isinstance(user_interests, list):
-                from .models import Category
-                interest_categories = Category.objects.filter(
-                    name__in=user_interests,
-                    is_active=True
-                ).values_list('id', flat=True)
-                user_interest_category_ids = list(interest_categories)
+        sort_option = request.query_params.get('sort', 'relevance')
+        if not request.query_params.get('ordering'):
+            queryset = ProductSortFilter.apply_relevance(queryset, sort_option)
         
         # Check if category filter or search query is applied
         category_filter = request.query_params.get('category') or request.query_params.get('category__slug')
-        search_query = request.query_params.get('q') or request.query_params.get('search')
+        search_query = ProductSortFilter.get_search_query(request.query_params)
         
-        # Prioritize products from interest categories if applicable
-        if user_interest_category_ids and not category_filter and not search_query:
-            from django.db.models import Case, When, IntegerField
-            # Get the current sort option to preserve it within priority groups
-            sort_option = request.query_params.get('sort', 'relevance')
-            sort_field = ProductSortFilter.SORT_OPTIONS.get(sort_option, '-created_at')
-            
-            # Create a case statement to prioritize products from interest categories
-            when_conditions = [When(category_id=cat_id, then=0) for cat_id in user_interest_category_ids]
-            if when_conditions:
-                queryset = queryset.annotate(
-                    priority=Case(
-                        *when_conditions,
-                        default=1,
-                        output_field=IntegerField()
-                    )
-                ).order_by('priority', sort_field)
+        # Personalize ordering by the user's category/brand affinity when browsing the whole catalog
+        affinity = None
+        if request.user.is_authenticated and not category_filter and not search_query:
+            from .personalization import get_user_affinity, affinity_score
+            affinity = affinity_score(get_user_affinity(request.user))
+            if affinity is not None:
+                queryset = ProductSortFilter.apply_affinity(queryset, affinity, sort_option)
         
         # Check if we should expand variants into separate items
         expand_variants = request.query_params.get('expand_variants', 'false').lower() == 'true'
         
         # Get filter options for the current queryset
-        filter_options = ProductAggregationFilter.get_filter_options(queryset)
+        filter_options = ProductAggregationFilter.get_filter_options(queryset, request.query_params)
         
-        # If expand_variants, we need to handle pagination differently
         if expand_variants:
-            # Expand variants: create a list where each variant is a separate item
-            expanded_results = []
-            for product in queryset:
-                variants = product.variants.filter(is_active=True).prefetch_related('images').all()
-                if variants.exists():
-                    # If product has variants, add each variant as a separate item
-                    for variant in variants:
-                        # Get variant images
-                        variant_images = [
-                            {
-                                'id': img.id,
-                                'image': img.image,
-                                'alt_text': img.alt_text,
-                                'sort_order': img.sort_order
-                            }
-                            for img in variant.images.filter(is_active=True).order_by('sort_order')
-                        ] if hasattr(variant, 'images') else []
-                        
-                        expanded_results.append({
-                            'id': f"{product.id}-{variant.id}",  # Unique ID for variant
-                            'product_id': product.id,
-                            'variant_id': variant.id,
-                            'title': f"{product.title} - {variant.title}",  # Include variant title in product title
-                            'slug': product.slug,
-                            'product_title': product.title,  # Original product title
-                            'short_description': product.short_description,
-                            'main_image': variant.image if variant.image else product.main_image,
-                            'images': variant_images if variant_images else [{'image': variant.image if variant.image else product.main_image}] if variant.image or product.main_image else [],
-                            'price': float(variant.price) if variant.price else float(product.price),
-                            'old_price': float(variant.old_price) if variant.old_price else (float(product.old_price) if product.old_price else None),
-                            'is_on_sale': product.is_on_sale,
-                            'discount_percentage': product.discount_percentage,
-                            'average_rating': self._get_average_rating(product),
-                            'review_count': product.reviews.filter(is_approved=True).count(),
-                            'category': {
-                                'id': product.category.id,
-                                'name': product.category.name,
-                                'slug': product.category.slug
-                            },
-                            'subcategory': {
-                                'id': product.subcategory.id,
-                                'name': product.subcategory.name,
-                                'slug': product.subcategory.slug
-                            } if product.subcategory else None,
-                            'brand': product.brand,
-                            'material': {
-                                'id': product.material.id,
-                                'name': product.material.name
-                            } if product.material else None,
-                            'variant': {
-                                'id': variant.id,
-                                'title': variant.title,
-                                'color': {
-                                    'id': variant.color.id,
-                                    'name': variant.color.name,
-                                    'hex_code': variant.color.hex_code
-                                },
-                                'size': variant.size,
-                                'pattern': variant.pattern,
-                                'price': float(variant.price) if variant.price else float(product.price),
-                                'old_price': float(variant.old_price) if variant.old_price else (float(product.old_price) if product.old_price else None),
-                                'stock_quantity': variant.stock_quantity,
-                                'is_in_stock': variant.is_in_stock,
-                                'image': variant.image if variant.image else product.main_image,
-                                'images': variant_images
-                            },
-                            'variant_title': variant.title,  # For easy access in frontend
-                            'is_featured': product.is_featured,
-                            'created_at': product.created_at.isoformat()
-                        })
-                else:
-                    # If no variants, add product as is
-                    serializer = self.get_serializer(product)
-                    expanded_results.append(serializer.data)
-            
-            # Apply sorting to expanded results
-            sort_option = request.query_params.get('sort', 'relevance')
-            expanded_results = self._sort_expanded_results(expanded_results, sort_option)
-            
-            # Manual pagination for expanded results
-            page_size = int(request.query_params.get('page_size', self.pagination_class.page_size))
-            page_number = int(request.query_params.get('page', 1))
-            start = (page_number - 1) * page_size
-            end = start + page_size
-            paginated_items = expanded_results[start:end]
-            
-            total_count = len(expanded_results)
-            total_pages = (total_count + page_size - 1) // page_size
-            
-            return Response({
-                'count': total_count,
-                'next': f"?page={page_number + 1}" if end < total_count else None,
-                'previous': f"?page={page_number - 1}" if page_number > 1 else None,
-                'results': paginated_items,
-                'filter_options': filter_options
-            })
+            # Expand variants: each active variant (or variant-less product) is one row,
+            # filtered, sorted and paginated in the database
+            rows = ProductSortFilter.expand_variant_rows(
+                queryset, sort_option, affinity, search_query
+            )
+            page = self.paginate_queryset(rows)
+            paginated_response = self.get_paginated_response(self._build_expanded_items(page))
+            paginated_response.data['filter_options'] = filter_options
+            return paginated_response
         else:
             # Normal pagination without expansion
             page = self.paginate_queryset(queryset)
@@ -222,26 +106,102 @@ class ProductListView(generics.ListAPIView):
                 'filter_options': filter_options
             })
     
+    def _build_expanded_items(self, rows):
+        """Load products and variants for one page of expanded rows in a fixed number of queries"""
+        product_ids = {row['id'] for row in rows}
+        variant_ids = {row['variant_id'] for row in rows if row['variant_id']}
+        
+        products = Product.objects.filter(id__in=product_ids).select_related(
+            'category', 'subcategory', 'material'
+        ).in_bulk()
+        variants = ProductVariant.objects.filter(id__in=variant_ids).select_related('color').prefetch_related(
+            Prefetch('images', queryset=ProductVariantImage.objects.filter(is_active=True).order_by('sort_order'))
+        ).in_bulk()
+        
+        # Products without variants keep the regular list serialization
+        plain_ids = {row['id'] for row in rows if not row['variant_id']}
+        plain_products = {}
+        if plain_ids:
+            plain_products = {
+                product.id: product for product in self.get_queryset().filter(id__in=plain_ids)
+            }
+        
+        items = []
+        for row in rows:
+            if row['variant_id']:
+                items.append(self._build_variant_item(products[row['id']], variants[row['variant_id']]))
+            else:
+                items.append(self.get_serializer(plain_products[row['id']]).data)
+        return items
+    
+    def _build_variant_item(self, product, variant):
+        """Represent a single product variant as a listing item"""
+        variant_images = [
+            {
+                'id': img.id,
+                'image': img.image,
+                'alt_text': img.alt_text,
+                'sort_order': img.sort_order
+            }
+            for img in variant.images.all()
+        ]
+        
+        return {
+            'id': f"{product.id}-{variant.id}",  # Unique ID for variant
+            'product_id': product.id,
+            'variant_id': variant.id,
+            'title': f"{product.title} - {variant.title}",  # Include variant title in product title
+            'slug': product.slug,
+            'product_title': product.title,  # Original product title
+            'short_description': product.short_description,
+            'main_image': variant.image if variant.image else product.main_image,
+            'images': variant_images if variant_images else [{'image': variant.image if variant.image else product.main_image}] if variant.image or product.main_image else [],
+            'price': float(variant.price) if variant.price else float(product.price),
+            'old_price': float(variant.old_price) if variant.old_price else (float(product.old_price) if product.old_price else None),
+            'is_on_sale': product.is_on_sale,
+            'discount_percentage': product.discount_percentage,
+            'average_rating': self._get_average_rating(product),
+            'review_count': product.review_count,
+            'category': {
+                'id': product.category.id,
+                'name': product.category.name,
+                'slug': product.category.slug
+            },
+            'subcategory': {
+                'id': product.subcategory.id,
+                'name': product.subcategory.name,
+                'slug': product.subcategory.slug
+            } if product.subcategory else None,
+            'brand': product.brand,
+            'material': {
+                'id': product.material.id,
+                'name': product.material.name
+            } if product.material else None,
+            'variant': {
+                'id': variant.id,
+                'title': variant.title,
+                'color': {
+                    'id': variant.color.id,
+                    'name': variant.color.name,
+                    'hex_code': variant.color.hex_code
+                },
+                'size': variant.size,
+                'pattern': variant.pattern,
+                'price': float(variant.price) if variant.price else float(product.price),
+                'old_price': float(variant.old_price) if variant.old_price else (float(product.old_price) if product.old_price else None),
+                'stock_quantity': variant.stock_quantity,
+                'is_in_stock': variant.is_in_stock,
+                'image': variant.image if variant.image else product.main_image,
+                'images': variant_images
+            },
+            'variant_title': variant.title,  # For easy access in frontend
+            'is_featured': product.is_featured,
+            'created_at': product.created_at.isoformat()
+        }
+    
     def _get_average_rating(self, product):
-        """Helper to get average rating"""
-        from django.db.models import Avg
-        avg_rating = product.reviews.filter(is_approved=True).aggregate(
-            avg_rating=Avg('rating')
-        )['avg_rating']
-        return round(float(avg_rating), 1) if avg_rating else 0.0
-    
-    def _sort_expanded_results(self, results, sort_option):
-        """Sort expanded variant results"""
-        if sort_option == 'price_low_to_high':
-            return sorted(results, key=lambda x: x['price'])
-        elif sort_option == 'price_high_to_low':
-            return sorted(results, key=lambda x: x['price'], reverse=True)
-        elif sort_option == 'newest':
-            return sorted(results, key=lambda x: x.get('created_at', ''), reverse=True)
-        elif sort_option == 'rating':
-            return sorted(results, key=lambda x: x.get('average_rating', 0), reverse=True)
-        else:
-            return results
+        """Helper to get the stored average rating"""
+        return round(float(product.average_rating), 1) if product.average_rating else 0.0
 
 
 class ProductDetailView(generics.RetrieveAPIView):
@@ -252,69 +212,65 @@ class ProductDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         """Get product with all related data"""
         return Product.objects.filter(is_active=True).select_related(
-            'category', 'subcategory'
+            'category', 'subcategory', 'variant_matrix'
         ).prefetch_related(
             'images',
             'specifications',
             'features',
             'offers',
-            'reviews',
-            Prefetch('variants', queryset=ProductVariant.objects.filter(is_active=True).select_related('color').prefetch_related('images')),
-            Prefetch('recommendations__recommended_product', 
-                    queryset=Product.objects.filter(is_active=True))
+            Prefetch('variants', queryset=ProductVariant.objects.filter(is_active=True).select_related('color').prefetch_related('images'))
         )
     
+    # Namespaces covering everything the detail payload embeds
+    validator_namespaces = ('products', 'product_details', 'offers')
+
     def retrieve(self, request, *args, **kwargs):
-        """Override retrieve to track browsing history"""
-        response = super().retrieve(request, *args, **kwargs)
-        
-        # Track browsing history if user is authenticated
-        if request.user.is_authenticated and response.status_code == 200:
-            product_id = response.data.get('id')
-            if product_id:
-                try:
-                    # Get or create browsing history entry
-                    browsing_history, created = BrowsingHistory.objects.get_or_create(
-                        user=request.user,
-                        product_id=product_id,
-                        defaults={
-                            'category_id': response.data.get('category', {}).get('id'),
-                            'subcategory_id': response.data.get('subcategory', {}).get('id') if response.data.get('subcategory') else None,
-                        }
-                    )
-                    
-                    if not created:
-                        # Update view count and last viewed
-                        browsing_history.view_count += 1
-                        browsing_history.last_viewed = timezone.now()
-                        # Update category/subcategory if not set
-                        if not browsing_history.category_id and response.data.get('category', {}).get('id'):
-                            browsing_history.category_id = response.data.get('category', {}).get('id')
-                        if not browsing_history.subcategory_id and response.data.get('subcategory', {}).get('id'):
-                            browsing_history.subcategory_id = response.data.get('subcategory', {}).get('id')
-                        browsing_history.save()
-                except Exception as e:
-                    # Silently fail - don't break the product detail page if tracking fails
-                    pass
-        
+        """Answer conditional requests from cheap validators; track browsing history"""
+        product = Product.objects.filter(is_active=True, slug=kwargs.get(self.lookup_field)).values(
+            'id', 'category_id', 'subcategory_id', 'updated_at'
+        ).first()
+        if product is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = namespace_validators(
+            *self.validator_namespaces, extra=(product['id'], product['updated_at'].isoformat())
+        )
+        last_modified = max(product['updated_at'], last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+
+        # Track browsing history if user is authenticated (revalidated views count too);
+        # buffered and written in bulk by products/history.py
+        if request.user.is_authenticated and response.status_code in (200, 304):
+            view_buffer.record(request.user.id, product['id'], product['category_id'], product['subcategory_id'])
+
         return response
 
 
-class ProductSearchView(generics.ListAPIView):
+class ProductSearchView(CursorPaginationMixin, generics.ListAPIView):
     """Advanced product search"""
     serializer_class = ProductSearchSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['title', 'short_description', 'long_description', 'category__name', 'subcategory__name', 'brand', 'material']
     
     def get_queryset(self):
         """Get products for search"""
         return Product.objects.filter(is_active=True).select_related(
             'category', 'subcategory'
         )
+    
+    def filter_queryset(self, queryset):
+        """Most relevant matches first"""
+        queryset = super().filter_queryset(queryset)
+        return ProductSortFilter.apply_relevance(queryset, self.request.query_params.get('sort'))
 
 
+@method_decorator(conditional_on('categories'), name='get')
+@method_decorator(cache_response('categories'), name='get')
 class CategoryListView(generics.ListAPIView):
     """List all categories with subcategories"""
     serializer_class = CategorySerializer
@@ -326,6 +282,7 @@ class CategoryListView(generics.ListAPIView):
         ).order_by('sort_order', 'name')
 
 
+@method_decorator(conditional_on('categories'), name='get')
 class SubcategoryListView(generics.ListAPIView):
     """List subcategories for a specific category"""
     serializer_class = SubcategorySerializer
@@ -341,6 +298,8 @@ class SubcategoryListView(generics.ListAPIView):
         return Subcategory.objects.filter(is_active=True).order_by('sort_order', 'name')
 
 
+@method_decorator(conditional_on('colors'), name='get')
+@method_decorator(cache_response('colors'), name='get')
 class ColorListView(generics.ListAPIView):
     """List all available colors"""
     serializer_class = ColorSerializer
@@ -350,6 +309,8 @@ class ColorListView(generics.ListAPIView):
         return Color.objects.filter(is_active=True).order_by('name')
 
 
+@method_decorator(conditional_on('materials'), name='get')
+@method_decorator(cache_response('materials'), name='get')
 class MaterialListView(generics.ListAPIView):
     """List all available materials"""
     serializer_class = MaterialSerializer
@@ -379,50 +340,45 @@ class ProductReviewListView(generics.ListCreateAPIView):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('products')
 def get_featured_products(request):
     """Get featured products for homepage"""
     products = Product.objects.filter(
         is_active=True,
         is_featured=True
-    ).select_related('category', 'subcategory').prefetch_related(
-        'images', 'variants__color'
     ).order_by('-created_at')[:10]
     
-    serializer = ProductListSerializer(products, many=True)
+    serializer = ProductCardSerializer(products, many=True)
     return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('products')
 def get_new_arrivals(request):
     """Get new arrival products"""
     products = Product.objects.filter(
         is_active=True
-    ).select_related('category', 'subcategory').prefetch_related(
-        'images', 'variants__color'
     ).order_by('-created_at')[:20]
     
-    serializer = ProductListSerializer(products, many=True)
+    serializer = ProductCardSerializer(products, many=True)
     return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('products', 'categories')
 def get_home_data(request):
     """Get all data needed for homepage"""
     # Featured products
     featured_products = Product.objects.filter(
         is_active=True,
         is_featured=True
-    ).select_related('category', 'subcategory').prefetch_related(
-        'images', 'variants__color'
     ).order_by('-created_at')[:10]
     
     # New arrivals
     new_arrivals = Product.objects.filter(
         is_active=True
-    ).select_related('category', 'subcategory').prefetch_related(
-        'images', 'variants__color'
     ).order_by('-created_at')[:20]
     
     # Categories
@@ -431,14 +387,15 @@ def get_home_data(request):
     ).order_by('sort_order', 'name')
     
     return Response({
-        'featured_products': ProductListSerializer(featured_products, many=True).data,
-        'new_arrivals': ProductListSerializer(new_arrivals, many=True).data,
+        'featured_products': ProductCardSerializer(featured_products, many=True).data,
+        'new_arrivals': ProductCardSerializer(new_arrivals, many=True).data,
         'categories': CategorySerializer(categories, many=True).data,
     })
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_on('homepage_content')
 def get_homepage_content(request):
     """Get homepage content sections for public display"""
     from admin_api.models import HomePageContent
@@ -474,6 +431,7 @@ def get_homepage_content(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_on('bulk_order_content')
 def get_bulk_order_page_content(request):
     """Get bulk order page content sections for public display"""
     from admin_api.models import BulkOrderPageContent
@@ -510,132 +468,44 @@ def get_bulk_order_page_content(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_search_suggestions(request):
-    """Get search suggestions based on query"""
+    """Get search suggestions based on query (served from the in-process prefix index)"""
+    from .suggestions import suggestion_index
+    
     query = request.GET.get('q', '').strip()
     
     if len(query) < 2:
         return Response([])
     
-    # Get product suggestions
-    products = Product.objects.filter(
-        Q(title__icontains=query) |
-        Q(category__name__icontains=query) |
-        Q(subcategory__name__icontains=query),
-        is_active=True
-    ).values('title', 'slug', 'category__name')[:10]
-    
-    # Get category suggestions
-    categories = Category.objects.filter(
-        name__icontains=query,
-        is_active=True
-    ).values('name', 'slug')[:5]
-    
-    # Get subcategory suggestions
-    subcategories = Subcategory.objects.filter(
-        name__icontains=query,
-        is_active=True
-    ).values('name', 'slug', 'category__name')[:5]
-    
-    suggestions = []
-    
-    # Add product suggestions
-    for product in products:
-        suggestions.append({
-            'type': 'product',
-            'title': product['title'],
-            'subtitle': product['category__name'],
-            'slug': product['slug']
-        })
-    
-    # Add category suggestions
-    for category in categories:
-        suggestions.append({
-            'type': 'category',
-            'title': category['name'],
-            'subtitle': 'Category',
-            'slug': category['slug']
-        })
-    
-    # Add subcategory suggestions
-    for subcategory in subcategories:
-        suggestions.append({
-            'type': 'subcategory',
-            'title': subcategory['name'],
-            'subtitle': f"in {subcategory['category__name']}",
-            'slug': subcategory['slug']
-        })
-    
-    return Response(suggestions[:15])  # Limit total suggestions
+    fuzzy = request.GET.get('fuzzy', 'true').lower() != 'false'
+    return Response(suggestion_index.suggest(query, fuzzy=fuzzy))
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_product_recommendations(request, slug):
     """Get product recommendations for a specific product"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    
-    # Get different types of recommendations
-    buy_with = ProductRecommendation.objects.filter(
-        product=product,
-        recommendation_type='buy_with',
-        is_active=True
-    ).select_related('recommended_product')[:10]
-    
-    inspired_by = ProductRecommendation.objects.filter(
-        product=product,
-        recommendation_type='inspired_by',
-        is_active=True
-    ).select_related('recommended_product')[:10]
+    product = get_object_or_404(Product.objects.only('pk'), slug=slug, is_active=True)
     
-    frequently_viewed = ProductRecommendation.objects.filter(
-        product=product,
-        recommendation_type='frequently_viewed',
-        is_active=True
-    ).select_related('recommended_product')[:10]
-    
-    similar = ProductRecommendation.objects.filter(
-        product=product,
-        recommendation_type='similar',
-        is_active=True
-    ).select_related('recommended_product')[:10]
-    
-    recommended = ProductRecommendation.objects.filter(
-        product=product,
-        recommendation_type='recommended',
-        is_active=True
-    ).select_related('recommended_product')[:10]
-    
-    return Response({
-        'buy_with': ProductListSerializer([rec.recommended_product for rec in buy_with], many=True).data,
-        'inspired_by': ProductListSerializer([rec.recommended_product for rec in inspired_by], many=True).data,
-        'frequently_viewed': ProductListSerializer([rec.recommended_product for rec in frequently_viewed], many=True).data,
-        'similar': ProductListSerializer([rec.recommended_product for rec in similar], many=True).data,
-        'recommended': ProductListSerializer([rec.recommended_product for rec in recommended], many=True).data,
-    })
+    return Response(load_recommendations(product.pk))
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_filter_options(request):
-    """Get available filter options"""
-    # Get base queryset
-    queryset = Product.objects.filter(is_active=True)
-    
-    # Apply any existing filters
-    filter_params = request.GET.copy()
-    if 'category' in filter_params:
-        queryset = queryset.filter(category__slug=filter_params['category'])
-    if 'subcategory' in filter_params:
-        queryset = queryset.filter(subcategory__slug=filter_params['subcategory'])
+    """Get available filter options (facets with counts) for the current filters"""
+    # Apply the same filters (and ``search``) as the product listing, which shares the cached facets
+    queryset = ProductFilter(request.GET, queryset=Product.objects.filter(is_active=True)).qs
+    queryset = ProductSearchFilter().filter_queryset(request, queryset, None)
     
     # Get filter options
-    filter_options = ProductAggregationFilter.get_filter_options(queryset)
+    filter_options = ProductAggregationFilter.get_filter_options(queryset, request.GET)
     
     return Response(filter_options)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('brands')
 def get_brands(request):
     """Get list of active brands/vendors"""
     brands = Vendor.objects.filter(
@@ -648,6 +518,7 @@ def get_brands(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('offers', 'products')
 def get_active_offers(request):
     """Get all products with active offers for advertisement boxes"""
     from django.utils import timezone
@@ -686,10 +557,21 @@ def get_active_offers(request):
             }
         })
     
-    return Response({
+    response = Response({
         'count': len(serialized_offers),
         'results': serialized_offers
     })
+    
+    # Cache only until the next offer starts or ends
+    boundaries = [offer.valid_until for offer in offers if offer.valid_until]
+    next_start = ProductOffer.objects.filter(is_active=True, valid_from__gt=now).order_by('valid_from').values_list(
+        'valid_from', flat=True
+    ).first()
+    if next_start:
+        boundaries.append(next_start)
+    if boundaries:
+        response.cache_timeout = max(int((min(boundaries) - now).total_seconds()), 1)
+    return response
 
 
 @api_view(['POST'])
@@ -767,40 +649,21 @@ def track_browsing_history(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    try:
-        product = Product.objects.get(id=product_id, is_active=True)
-    except Product.DoesNotExist:
+    product = Product.objects.filter(id=product_id, is_active=True).values(
+        'id', 'category_id', 'subcategory_id'
+    ).first()
+    if product is None:
         return Response(
             {'error': 'Product not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Get or create browsing history entry
-    browsing_history, created = BrowsingHistory.objects.get_or_create(
-        user=request.user,
-        product=product,
-        defaults={
-            'category': product.category,
-            'subcategory': product.subcategory,
-        }
-    )
+    # Buffered and written in bulk by products/history.py
+    view_buffer.record(request.user.id, product['id'], product['category_id'], product['subcategory_id'])
     
-    if not created:
-        # Update view count and last viewed
-        browsing_history.view_count += 1
-        browsing_history.last_viewed = timezone.now()
-        # Update category/subcategory if product changed
-        if not browsing_history.category:
-            browsing_history.category = product.category
-        if not browsing_history.subcategory:
-            browsing_history.subcategory = product.subcategory
-        browsing_history.save()
-    
-    serializer = BrowsingHistorySerializer(browsing_history)
     return Response({
-        'message': 'Browsing history tracked successfully',
-        'data': serializer.data
-    }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        'message': 'Browsing history tracked successfully'
+    }, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['GET'])
@@ -808,6 +671,8 @@ def track_browsing_history(request):
 def get_browsing_history(request):
     """Get user's browsing history"""
     limit = int(request.query_params.get('limit', 20))
+    # Include this user's views still waiting in the write-behind buffer
+    view_buffer.flush(user_id=request.user.id)
     
     browsing_history = BrowsingHistory.objects.filter(
         user=request.user
@@ -825,6 +690,22 @@ def get_browsing_history(request):
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_inspired_by_feed(request):
+    """Products inspired by the user's recent browsing history, best first"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', FEED_LIMIT)), 1), 50)
+    except ValueError:
+        limit = FEED_LIMIT
+    
+    results = inspired_by_feed(request.user.id, limit)
+    return Response({
+        'count': len(results),
+        'results': results
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_browsed_categories(request):
@@ -832,12 +713,14 @@ def get_browsed_categories(request):
     # Get unique categories from browsing history, ordered by most recently browsed
     from django.db.models import Count, Max
     
+    view_buffer.flush(user_id=request.user.id)
     categories_data = BrowsingHistory.objects.filter(
         user=request.user,
         category__isnull=False
     ).values(
         'category_id', 'category__name', 'category__slug', 
-        'category__image', 'category__description'
+        'category__image', 'category__description',
+        'category__stats__active_product_count'
     ).annotate(
         product_count=Count('product_id', distinct=True),
         last_viewed=Max('last_viewed')
@@ -846,17 +729,14 @@ def get_browsed_categories(request):
     # Convert to list with proper structure
     categories = []
     for cat_data in categories_data:
-        # Get product count for this category
-        category = Category.objects.get(id=cat_data['category_id'])
-        total_products = category.products.filter(is_active=True).count()
-        
         categories.append({
             'id': cat_data['category_id'],
             'name': cat_data['category__name'],
             'slug': cat_data['category__slug'],
             'image': cat_data['category__image'],
             'description': cat_data['category__description'],
-            'product_count': total_products,
+            # Active products in the whole category, from the statistics table
+            'product_count': cat_data['category__stats__active_product_count'] or 0,
             'browsed_product_count': cat_data['product_count']
         })
     
@@ -870,23 +750,29 @@ def get_browsed_categories(request):
 @permission_classes([IsAuthenticated])
 def clear_browsing_history(request):
     """Clear user's browsing history"""
+    from . import personalization
+
     product_id = request.query_params.get('product_id')
     
     if product_id:
+        view_buffer.discard(request.user.id, int(product_id))
         # Clear specific product from history
         deleted_count, _ = BrowsingHistory.objects.filter(
             user=request.user,
             product_id=product_id
         ).delete()
+        personalization.invalidate_user_affinity(request.user.id)
         
         return Response({
             'message': f'Removed {deleted_count} item(s) from browsing history'
         })
     else:
+        view_buffer.discard(request.user.id)
         # Clear all browsing history
         deleted_count, _ = BrowsingHistory.objects.filter(
             user=request.user
         ).delete()
+        personalization.invalidate_user_affinity(request.user.id)
         
         return Response({
             'message': f'Cleared {deleted_count} item(s) from browsing history'